@@ -2,86 +2,247 @@
 # -*- coding: utf-8 -*-
 
 """
-Usage:  gene2protein.py
+Usage:  gene2protein.py [--namespace hgnc --namespace mgi ...] [--workers 4]
 
 Generate backbone edges g() transcribedTo r() and
                         m() and r() translatedTo p()
+
+for the gene namespaces (EG, HGNC, MGI, RGD, ZFIN)
 """
 
-import gzip
 import json
+import multiprocessing
+import os
 from string import Template
+from typing import List, Optional
 
 import structlog
+import typer
+from typer import Option
 
 import app.settings as settings
+import app.setup_logging
+from app.common.compressed_io import open_compressed
+from app.common.subsets import SubsetWriter, resource_sinks
 
 log = structlog.getLogger(__name__)
 
 bel_version = "2.1.1"
 
-eg_datafile = f"{settings.DATA_DIR}/namespaces/eg.jsonl.gz"
-backbone_fn = f"{settings.DATA_DIR}/backbone/eg_backbone_nanopubs.jsonl.gz"
-backbone_hmrz_fn = f"{settings.DATA_DIR}/backbone/eg_backbone_nanopubs_hmrz.jsonl.gz"
+backbone_namespaces = ["eg", "hgnc", "mgi", "rgd", "zfin"]
+
+# Placeholders for the per-gene values in the pre-serialized nanopub skeletons
+key_sentinel = "__BACKBONE_KEY__"
+id_sentinel = "__BACKBONE_ID__"
+
+
+def namespace_fn(namespace_lc: str) -> str:
+    return f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
+
+
+def backbone_fn(namespace_lc: str) -> str:
+    """Backbone nanopubs filename for namespace - species subsets are named by subset_fn()"""
+
+    return f"{settings.DATA_DIR}/backbone/{namespace_lc}_backbone_nanopubs.jsonl.{settings.RESOURCE_EXT}"
+
+
+eg_datafile = namespace_fn("eg")
+
+
+def get_entity_class(entity_types: List[str]) -> Optional[str]:
+    """Backbone entity class of gene - protein, rna or None if no backbone edges"""
+
+    if not entity_types:
+        return None
+    elif "Protein" in entity_types:
+        return "protein"
+    elif "RNA" in entity_types or "Micro_RNA" in entity_types:
+        return "rna"
+
+    return None
+
+
+def make_nanopub(
+    entity_class: str, key: str, citation_uri: str, species_key: str, species_label: str
+) -> dict:
+    """Make backbone nanopub for gene
+
+    Args:
+        entity_class: protein or rna - see get_entity_class()
+        key: gene key, e.g. EG:207
+        citation_uri: namespace url for the gene
+        species_key: gene species key, e.g. TAX:9606
+        species_label: gene species label, e.g. human
+
+    Returns:
+        dict: nanopub
+    """
+
+    assertions = [{"subject": f"g({key})", "relation": "transcribedTo", "object": f"r({key})",}]
+    if entity_class == "protein":
+        assertions.append(
+            {"subject": f"r({key})", "relation": "translatedTo", "object": f"p({key})",}
+        )
+
+    nanopub = {
+        "type": {"name": "BEL", "version": bel_version},
+        "citation": {"uri": citation_uri},
+        "assertions": assertions,
+        "annotations": [{"type": "Species", "id": species_key, "label": species_label}],
+        "metadata": {"gd_status": "finalized", "nanopub_type": "backbone"},
+    }
+
+    return nanopub
+
+
+def json_escape(value: str) -> str:
+    """Escape value as json.dumps() would inside a JSON string"""
+
+    return json.dumps(value)[1:-1]
+
+
+class NanopubRenderer(object):
+    """Render serialized backbone nanopub JSONL records for gene terms
+
+    The nanopub is the same for every gene except for the gene key and id, so it is
+    serialized once per (entity class, species) with placeholders for the key and id
+    (including in the template_url citation) and each gene is a single str.format() call.
+    """
+
+    def __init__(self, template_url: str):
+
+        self.citation_uri = Template(template_url).safe_substitute(
+            id=id_sentinel, key=key_sentinel
+        )
+        self.skeletons = {}
+
+    def skeleton(self, entity_class: str, species_key: str, species_label: str) -> str:
+        """Serialized nanopub format string with {key} and {id} fields"""
+
+        skeleton_key = (entity_class, species_key, species_label)
+        skeleton = self.skeletons.get(skeleton_key)
+        if skeleton is None:
+            nanopub = make_nanopub(
+                entity_class, key_sentinel, self.citation_uri, species_key, species_label
+            )
+            skeleton = (
+                f'{{"nanopub": {json.dumps(nanopub)}}}\n'.replace("{", "{{")
+                .replace("}", "}}")
+                .replace(key_sentinel, "{key}")
+                .replace(id_sentinel, "{id}")
+            )
+            self.skeletons[skeleton_key] = skeleton
+
+        return skeleton
+
+    def render(self, term: dict) -> Optional[str]:
+        """Render backbone nanopub JSONL record for term or None if no backbone edges"""
+
+        entity_class = get_entity_class(term.get("entity_types"))
+        if entity_class is None:
+            return None
+
+        skeleton = self.skeleton(entity_class, term["species_key"], term["species_label"])
+
+        return skeleton.format(key=json_escape(term["key"]), id=json_escape(term["id"]))
+
+
+class BackboneWriter(object):
+    """Write backbone nanopubs for gene terms as they are built
+
+    Used as a pipeline hook by the EG namespace builder so the backbone is built
+    in the same pass as the namespace instead of re-reading eg.jsonl.gz
+
+    Usage:
+        with BackboneWriter(metadata) as backbone:
+            backbone.add_term(term.dict())
+    """
+
+    def __init__(self, metadata: dict, namespace_lc: str = "eg"):
+
+        self.renderer = NanopubRenderer(metadata["template_url"])
+        resource_fn = backbone_fn(namespace_lc)
+        self.writer = SubsetWriter(resource_fn, sinks=resource_sinks(resource_fn))
+        self.count = 0
+
+    def __enter__(self):
+
+        self.writer.__enter__()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.writer.__exit__(exc_type, exc_value, traceback)
+
+    def add_term(self, term: dict):
+        """Add backbone nanopub for term - term is a Term.dict()"""
+
+        line = self.renderer.render(term)
+        if line is None:
+            return
+
+        self.writer.write(line, term["species_key"])
+        self.count += 1
+
+
+def process_backbone(namespace_lc: str = "eg") -> int:
+    """Build backbone nanopubs from a gene namespace resource file
+
+    For EG this is the fallback for when the backbone was not built with the EG namespace
+
+    Returns:
+        int: number of backbone nanopubs
+    """
+
+    datafile = namespace_fn(namespace_lc)
+    if not os.path.exists(datafile):
+        log.warning("Missing namespace file for backbone", namespace=namespace_lc, fn=datafile)
+        return 0
 
-hmrz_species = ["TAX:9606", "TAX:10090", "TAX:10116", "TAX:7955"]
+    with open_compressed(datafile, "rt") as fi:
 
+        # Header JSONL record for terminology
+        metadata = json.loads(next(fi))["metadata"]
+        log.info("Metadata", metadata=metadata)
 
-def process_backbone():
+        with BackboneWriter(metadata, namespace_lc) as backbone:
+            for line in fi:
+                backbone.add_term(json.loads(line)["term"])
 
-    # count = 0
-    with gzip.open(eg_datafile, "rt") as fi, gzip.open(backbone_fn, "wt") as fo, gzip.open(
-        backbone_hmrz_fn, "wt"
-    ) as fz:
+    log.info("Built backbone nanopubs", namespace=namespace_lc, count=backbone.count)
 
-        metadata = {}
-        for line in fi:
-            term = json.loads(line)
-            if "metadata" in term:
-                metadata = term["metadata"]
-                print("Metadata", metadata)
+    return backbone.count
 
-                src_template_url = Template(metadata["template_url"])
-                continue
 
-            key = term["term"]["key"]
-            species_key = term["term"]["species_key"]
-            species_label = term["term"]["species_label"]
+def build_backbones(namespaces: List[str] = backbone_namespaces, workers: int = None) -> dict:
+    """Build backbone nanopubs for namespaces in parallel
 
-            assertions = []
-            entity_types = term["term"]["entity_types"]
-            if "Protein" in entity_types:
-                assertions.append(
-                    {"subject": f"g({key})", "relation": "transcribedTo", "object": f"r({key})",}
-                )
-                assertions.append(
-                    {"subject": f"r({key})", "relation": "translatedTo", "object": f"p({key})",}
-                )
+    Returns:
+        dict: number of backbone nanopubs per namespace
+    """
 
-            elif "RNA" in entity_types or "Micro_RNA" in entity_types:
-                assertions.append(
-                    {"subject": f"g({key})", "relation": "transcribedTo", "object": f"r({key})",}
-                )
-            else:
-                continue
+    if workers is None:
+        workers = min(len(namespaces), os.cpu_count() or 1)
 
-            nanopub = {
-                "type": {"name": "BEL", "version": bel_version},
-                "citation": {"uri": src_template_url.safe_substitute(id=term["term"]["id"])},
-                "assertions": assertions,
-                "annotations": [{"type": "Species", "id": species_key, "label": species_label}],
-                "metadata": {"gd_status": "finalized", "nanopub_type": "backbone"},
-            }
+    if workers <= 1:
+        counts = [process_backbone(namespace_lc) for namespace_lc in namespaces]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            counts = pool.map(process_backbone, namespaces)
 
-            fo.write(f'{{"nanopub": {json.dumps(nanopub)}}}\n')
+    return dict(zip(namespaces, counts))
 
-            if species_key in hmrz_species:
-                fz.write(f'{{"nanopub": {json.dumps(nanopub)}}}\n')
 
+def main(
+    namespaces: List[str] = Option(
+        backbone_namespaces, "--namespace", help="Gene namespaces to build backbone nanopubs for"
+    ),
+    workers: int = Option(None, help="Number of namespaces to process in parallel"),
+):
 
-def main():
-    process_backbone()
+    build_backbones([namespace.lower() for namespace in namespaces], workers=workers)
 
 
 if __name__ == "__main__":
-    main()
+    typer.run(main)
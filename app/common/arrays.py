@@ -0,0 +1,82 @@
+"""Directories of NumPy arrays used for the memory-mappable resource indexes"""
+
+import json
+import os
+import shutil
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+
+def save_arrays(index_dir: str, arrays: Dict[str, np.ndarray], metadata: dict = None):
+    """Save arrays as {index_dir}/{name}.npy with a metadata.json file
+
+    The index is written to a temporary directory and then renamed into place
+    (see finalize_dir) so readers never see a partially written index.
+
+    Args:
+        index_dir: index directory
+        arrays: array name -> array
+        metadata: saved as metadata.json
+    """
+
+    tmp_dir = make_tmp_dir(index_dir)
+    write_arrays(tmp_dir, arrays, metadata)
+    finalize_dir(tmp_dir, index_dir)
+
+
+def make_tmp_dir(index_dir: str) -> str:
+    """Create empty temporary directory to build index_dir in"""
+
+    tmp_dir = f"{index_dir.rstrip('/')}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    return tmp_dir
+
+
+def write_arrays(directory: str, arrays: Dict[str, np.ndarray], metadata: dict = None):
+    """Write arrays and metadata.json into directory"""
+
+    for name, array in arrays.items():
+        np.save(f"{directory}/{name}.npy", array)
+
+    with open(f"{directory}/metadata.json", "w") as f:
+        json.dump(metadata or {}, f, indent=4)
+
+
+def finalize_dir(tmp_dir: str, index_dir: str):
+    """Replace index_dir with the completed tmp_dir
+
+    The previous index_dir is renamed aside before the new one is renamed into
+    place and only removed afterwards. index_dir is missing only between the two
+    renames, and a crash there leaves the previous index in {index_dir}.old.
+    """
+
+    index_dir = index_dir.rstrip("/")
+    old_dir = f"{index_dir}.old"
+
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def load_arrays(
+    index_dir: str, names: Iterable[str], mmap: bool = True
+) -> Tuple[Dict[str, np.ndarray], dict]:
+    """Load (memory-mapped) arrays and metadata saved by save_arrays()
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], dict]: arrays by name and metadata
+    """
+
+    mmap_mode = "r" if mmap else None
+
+    with open(f"{index_dir}/metadata.json", "r") as f:
+        metadata = json.load(f)
+
+    arrays = {name: np.load(f"{index_dir}/{name}.npy", mmap_mode=mmap_mode) for name in names}
+
+    return (arrays, metadata)
@@ -0,0 +1,343 @@
+"""Block compressed (BGZF-style) resource files with a sidecar block index
+
+A block compressed resource file is a sequence of independently compressed gzip
+members (or zstd frames) that each hold whole lines, so it is still a valid
+gzip/zstd file for gunzip, zcat and open_compressed. The metadata header line is
+always in its own first block.
+
+The sidecar block index ({resource_fn}.blocks.json) records the byte offset and
+compressed length of every block together with its first line number, line count,
+key range and species keys so that readers can seek straight to the blocks they
+need - e.g. to load shards in parallel or to look up a single key.
+"""
+
+import gzip
+import json
+import os
+import re
+import zlib
+from typing import Iterator, List, Optional, Sequence
+
+import structlog
+
+import app.settings as settings
+from app.common.compressed_io import (
+    codec_for_filename,
+    compression_level,
+    open_compressed,
+    zstd_magic,
+    zstandard,
+)
+from app.common.subsets import line_species_keys
+
+log = structlog.getLogger(__name__)
+
+# Record keys of terms and orthologs as serialized by json.dumps()
+record_key_re = re.compile(r'^\{"(?:term|ortholog)": \{"(?:key|subject_key)": "([^"]*)"')
+
+
+def block_index_fn(resource_fn: str) -> str:
+    """Sidecar block index filename, e.g. eg.jsonl.gz -> eg.jsonl.gz.blocks.json"""
+
+    return f"{resource_fn}.blocks.json"
+
+
+def line_record_key(line: str) -> Optional[str]:
+    """Term key or ortholog subject key of a serialized resource record"""
+
+    match = record_key_re.match(line)
+    if match:
+        return match.group(1)
+
+    return None
+
+
+class BlockedWriter(object):
+    """Write whole lines into independently compressed blocks and the block index
+
+    Lines must be written complete (ending with a newline), as the resource builders do.
+
+    Usage:
+        with BlockedWriter(resource_fn) as fo:
+            fo.write(metadata_line)
+            fo.write(term_line)
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        index_fn: str = None,
+        block_size: int = None,
+        compresslevel: int = None,
+        codec: str = None,
+    ):
+
+        self.name = filename
+        self.index_fn = index_fn or block_index_fn(filename)
+        self.block_size = block_size or settings.RESOURCE_BLOCK_SIZE
+        self.codec = codec or codec_for_filename(filename)
+        self.compresslevel = compression_level(self.codec, compresslevel)
+
+        if self.codec == "zstd":
+            if zstandard is None:
+                raise ImportError("zstandard package is required to write zstd files")
+            self._compressor = zstandard.ZstdCompressor(level=self.compresslevel)
+
+        self.blocks = []
+        self._lines = []
+        self._size = 0
+        self._offset = 0
+        self._line_count = 0
+        self._closed = False
+
+        self._file = open(self.name, "wb")
+
+    def _compress(self, data: bytes) -> bytes:
+
+        if self.codec == "zstd":
+            return self._compressor.compress(data)
+
+        return gzip.compress(data, self.compresslevel, mtime=0)
+
+    def _flush_block(self):
+
+        if not self._lines:
+            return
+
+        header = self._lines[0].startswith('{"metadata"')
+        keys = [key for key in map(line_record_key, self._lines) if key is not None]
+        species = set()
+        if not header:
+            for line in self._lines:
+                species.update(line_species_keys(line))
+            species.discard("")
+
+        data = self._compress("".join(self._lines).encode("utf-8"))
+        self._file.write(data)
+
+        self.blocks.append(
+            {
+                "offset": self._offset,
+                "length": len(data),
+                "line": self._line_count,
+                "lines": len(self._lines),
+                "header": header,
+                "min_key": min(keys) if keys else None,
+                "max_key": max(keys) if keys else None,
+                "species": sorted(species),
+            }
+        )
+
+        self._offset += len(data)
+        self._line_count += len(self._lines)
+        self._lines = []
+        self._size = 0
+
+    def write(self, line: str) -> int:
+
+        self._lines.append(line)
+        self._size += len(line)
+
+        # Metadata header gets its own block so it can be read without any terms
+        if line.startswith('{"metadata"') or self._size >= self.block_size:
+            self._flush_block()
+
+        return len(line)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def close(self):
+
+        if self._closed:
+            return
+
+        self._flush_block()
+        self._file.close()
+        self._closed = True
+
+        index = {
+            "resource_fn": os.path.basename(self.name),
+            "codec": self.codec,
+            "size": self._offset,
+            "lines": self._line_count,
+            "block_size": self.block_size,
+            "blocks": self.blocks,
+        }
+        with open(self.index_fn, "w") as f:
+            json.dump(index, f)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def block_compress(resource_fn: str, block_size: int = None, compresslevel: int = None) -> int:
+    """Rewrite resource file in place as block compressed file with a block index
+
+    Args:
+        resource_fn: resource file, e.g. namespaces/eg.jsonl.gz
+        block_size: uncompressed block size - defaults to settings.RESOURCE_BLOCK_SIZE
+        compresslevel: compression level - defaults to the resource compression level
+
+    Returns:
+        int: number of blocks
+    """
+
+    tmp_fn = f"{resource_fn}.tmp"
+    tmp_index_fn = f"{block_index_fn(resource_fn)}.tmp"
+
+    with open_compressed(resource_fn, "rt") as fi, BlockedWriter(
+        tmp_fn,
+        index_fn=tmp_index_fn,
+        block_size=block_size,
+        compresslevel=compresslevel,
+        codec=codec_for_filename(resource_fn),
+    ) as fo:
+        for line in fi:
+            fo.write(line)
+
+    # Index is updated last - a stale index is detected by its file size
+    os.replace(tmp_fn, resource_fn)
+    os.replace(tmp_index_fn, block_index_fn(resource_fn))
+
+    log.info("Block compressed file", resource_fn=resource_fn, blocks=len(fo.blocks))
+
+    return len(fo.blocks)
+
+
+class BlockedResource(object):
+    """Random access to a block compressed resource file using its block index
+
+    Usage:
+        resource = BlockedResource(resource_fn)
+        resource.metadata()
+        resource.find("EG:207")  # -> {"term": {"key": "EG:207", ...}}
+        for line in resource.lines(resource.species_blocks(["TAX:9606"])):
+            ...
+        resource.shards(8)  # -> 8 lists of contiguous block indexes for parallel loaders
+    """
+
+    def __init__(self, resource_fn: str, index_fn: str = None):
+
+        self.resource_fn = resource_fn
+
+        index_fn = index_fn or block_index_fn(resource_fn)
+        with open(index_fn, "r") as f:
+            self.index = json.load(f)
+
+        self.blocks = self.index["blocks"]
+        self.codec = self.index["codec"]
+
+        # Rebuilding the resource file without the block index makes the index stale
+        if os.path.getsize(resource_fn) != self.index["size"] or os.path.getmtime(
+            index_fn
+        ) < os.path.getmtime(resource_fn):
+            raise ValueError(f"Block index is out of date for {resource_fn}")
+
+        if self.codec == "zstd":
+            if zstandard is None:
+                raise ImportError(f"zstandard package is required to read zstd file {resource_fn}")
+            self._decompressor = zstandard.ZstdDecompressor()
+
+        self._file = open(resource_fn, "rb")
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def _decompress(self, data: bytes) -> bytes:
+
+        if data[:4] == zstd_magic:
+            return self._decompressor.decompress(data)
+
+        return zlib.decompress(data, wbits=16 + zlib.MAX_WBITS)
+
+    def read_block(self, block_idx: int) -> List[str]:
+        """Lines of block - seeks to the block and only inflates that block"""
+
+        block = self.blocks[block_idx]
+        self._file.seek(block["offset"])
+        data = self._decompress(self._file.read(block["length"]))
+
+        return data.decode("utf-8").splitlines(keepends=True)
+
+    def lines(self, block_idxs: Sequence[int] = None) -> Iterator[str]:
+        """Lines of blocks in order - defaults to all blocks"""
+
+        if block_idxs is None:
+            block_idxs = range(len(self.blocks))
+
+        for block_idx in block_idxs:
+            yield from self.read_block(block_idx)
+
+    def metadata(self) -> dict:
+        """Metadata header of the resource file"""
+
+        for line in self.read_block(0):
+            if line.startswith('{"metadata"'):
+                return json.loads(line)["metadata"]
+
+        return {}
+
+    def key_blocks(self, key: str) -> List[int]:
+        """Indexes of blocks whose key range contains key"""
+
+        return [
+            block_idx
+            for block_idx, block in enumerate(self.blocks)
+            if block["min_key"] is not None and block["min_key"] <= key <= block["max_key"]
+        ]
+
+    def find(self, key: str) -> Optional[dict]:
+        """Record with term key (or ortholog subject key) - only inflates matching blocks"""
+
+        for block_idx in self.key_blocks(key):
+            for line in self.read_block(block_idx):
+                if line_record_key(line) == key:
+                    return json.loads(line)
+
+        return None
+
+    def species_blocks(self, species_keys: Sequence[str]) -> List[int]:
+        """Indexes of blocks with records of any of the species"""
+
+        species_keys = set(species_keys)
+
+        return [
+            block_idx
+            for block_idx, block in enumerate(self.blocks)
+            if species_keys.intersection(block["species"])
+        ]
+
+    def shards(self, count: int) -> List[List[int]]:
+        """Split blocks (excluding the metadata block) into count contiguous shards
+        of about the same compressed size
+        """
+
+        block_idxs = [idx for idx, block in enumerate(self.blocks) if not block["header"]]
+
+        total = sum([self.blocks[idx]["length"] for idx in block_idxs])
+        shards = [[] for _ in range(max(count, 1))]
+        size = 0
+        for block_idx in block_idxs:
+            shard_idx = min(size * len(shards) // max(total, 1), len(shards) - 1)
+            shards[shard_idx].append(block_idx)
+            size += self.blocks[block_idx]["length"]
+
+        return [shard for shard in shards if shard]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
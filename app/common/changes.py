@@ -0,0 +1,249 @@
+"""Incremental change streams of resource files for downstream stores
+
+Each run compares the records of a resource file with the per-record content
+hashes saved by the previous run and writes a change stream of upserts and
+deletes, so Elasticsearch/ArangoDB can apply the changes instead of a full reload.
+
+Content hashes are computed over the canonical record (sorted keys, lists in
+canonical order) so nondeterministic ordering of e.g. synonyms is not a change.
+
+Files per resource file, e.g. namespaces/eg.jsonl.gz:
+
+    changes/namespaces/eg.changes.jsonl.gz: change stream
+        {"metadata": {"resource_fn": "eg.jsonl.gz", "version": ..., "previous_version": ...}}
+        {"op": "upsert", "key": "EG:207", "record": {"term": {...}}}
+        {"op": "delete", "key": "EG:208"}
+    changes/namespaces/eg.hashes/: content hash sidecar of the published release
+        key_hashes.npy: sorted 64 bit key hashes (uint64)
+        content_hashes.npy: 64 bit record content hash per key hash (uint64)
+        key_records.npy: index into the keys string table per key hash (int64)
+        keys.bin, keys_offsets.npy: record keys (string table)
+        metadata.json: resource file, version and counts
+    changes/namespaces/eg.hashes.pending/: sidecar of the current run
+
+Without a previous sidecar every record is an upsert and the change stream is
+marked full. A run only writes the pending sidecar - commit_change_stream()
+replaces the sidecar with it once the resource and change stream files are
+published. Until then every run is relative to the last published release
+(previous_version in the header), however often the change streams are rebuilt.
+"""
+
+import itertools
+import json
+import os
+from array import array
+from typing import List, Tuple
+
+import numpy as np
+import structlog
+
+import app.settings as settings
+from app.common.arrays import finalize_dir, load_arrays, make_tmp_dir, write_arrays
+from app.common.compressed_io import codec_for_filename, open_compressed
+from app.common.diff import line_key
+from app.common.hashes import record_hash
+from app.common.string_table import StringTable, StringTableWriter
+from app.indexes.keys import key_hash
+
+log = structlog.getLogger(__name__)
+
+hash_arrays = ["key_hashes", "content_hashes", "key_records"]
+
+batch_size = 100000
+
+
+def change_dir(resource_fn: str) -> str:
+    """Change stream directory for the resource type of resource file"""
+
+    resource_type = os.path.basename(os.path.dirname(os.path.abspath(resource_fn)))
+
+    return f"{settings.DATA_DIR}/changes/{resource_type}"
+
+
+def changes_fn(resource_fn: str) -> str:
+    """Change stream file, e.g. namespaces/eg.jsonl.gz -> changes/namespaces/eg.changes.jsonl.gz"""
+
+    (name, ext) = os.path.basename(resource_fn).split(".", 1)
+
+    return f"{change_dir(resource_fn)}/{name}.changes.{ext}"
+
+
+def hashes_dir(resource_fn: str) -> str:
+    """Content hash sidecar directory of resource file"""
+
+    name = os.path.basename(resource_fn).split(".")[0]
+
+    return f"{change_dir(resource_fn)}/{name}.hashes"
+
+
+def pending_hashes_dir(resource_fn: str) -> str:
+    """Content hash sidecar directory of the current, not yet published run"""
+
+    return f"{hashes_dir(resource_fn)}.pending"
+
+
+def content_hash(line: str) -> int:
+    """64 bit hash of the canonical record - the same as the hash embedded by hashes.py"""
+
+    return int(record_hash(json.loads(line)), 16)
+
+
+class ChangeStream(object):
+    """Compare batches of records against the previous content hashes"""
+
+    def __init__(self, resource_fn: str, fo, keys_table: StringTableWriter):
+
+        self.fo = fo
+        self.keys_table = keys_table
+
+        self.key_hashes = array("Q")
+        self.content_hashes = array("Q")
+        self.key_records = array("q")
+        self.upserts = 0
+        self.deletes = 0
+
+        self.previous = None
+        if os.path.exists(f"{hashes_dir(resource_fn)}/metadata.json"):
+            (self.previous, self.previous_metadata) = load_arrays(
+                hashes_dir(resource_fn), hash_arrays
+            )
+            self.previous_keys = StringTable(hashes_dir(resource_fn), "keys")
+
+        self.batch: List[Tuple[str, str]] = []
+
+    def add(self, key: str, line: str):
+
+        self.batch.append((key, line))
+        if len(self.batch) >= batch_size:
+            self.flush()
+
+    def flush(self):
+
+        if not self.batch:
+            return
+
+        key_hashes = np.array([key_hash(key) for (key, _) in self.batch], dtype=np.uint64)
+        content_hashes = np.array(
+            [content_hash(line) for (_, line) in self.batch], dtype=np.uint64
+        )
+
+        changed = np.ones(len(self.batch), dtype=bool)
+        if self.previous is not None and len(self.previous["key_hashes"]):
+            previous_key_hashes = self.previous["key_hashes"]
+            idx = np.searchsorted(previous_key_hashes, key_hashes)
+            idx[idx >= len(previous_key_hashes)] = 0
+            found = previous_key_hashes[idx] == key_hashes
+            changed = ~found | (self.previous["content_hashes"][idx] != content_hashes)
+
+        for position in np.flatnonzero(changed):
+            (key, line) = self.batch[position]
+            self.fo.write(
+                json.dumps({"op": "upsert", "key": key})[:-1] + f', "record": {line}}}\n'
+            )
+        self.upserts += int(changed.sum())
+
+        for (key, _) in self.batch:
+            self.key_records.append(self.keys_table.append(key))
+        self.key_hashes.extend(key_hashes.tolist())
+        self.content_hashes.extend(content_hashes.tolist())
+
+        self.batch = []
+
+    def finish(self) -> dict:
+        """Write deletes of previous keys no longer present and return the hash arrays"""
+
+        self.flush()
+
+        key_hashes = np.frombuffer(self.key_hashes, dtype=np.uint64)
+        order = np.argsort(key_hashes, kind="stable")
+        arrays = {
+            "key_hashes": key_hashes[order],
+            "content_hashes": np.frombuffer(self.content_hashes, dtype=np.uint64)[order],
+            "key_records": np.frombuffer(self.key_records, dtype=np.int64)[order],
+        }
+
+        if self.previous is not None:
+            deleted = ~np.isin(self.previous["key_hashes"], arrays["key_hashes"])
+            for idx in np.flatnonzero(deleted):
+                key = self.previous_keys[int(self.previous["key_records"][idx])]
+                self.fo.write(json.dumps({"op": "delete", "key": key}) + "\n")
+            self.deletes = int(deleted.sum())
+
+        return arrays
+
+
+def update_change_stream(resource_fn: str) -> dict:
+    """Write the change stream of resource file and its pending content hash sidecar
+
+    Returns:
+        dict: change stream metadata with upsert and delete counts
+    """
+
+    os.makedirs(change_dir(resource_fn), exist_ok=True)
+
+    tmp_dir = make_tmp_dir(pending_hashes_dir(resource_fn))
+    tmp_changes_fn = f"{changes_fn(resource_fn)}.tmp"
+
+    with open_compressed(resource_fn, "rt") as fi, open_compressed(
+        tmp_changes_fn, "wt", codec=codec_for_filename(resource_fn)
+    ) as fo, StringTableWriter(tmp_dir, "keys") as keys_table:
+
+        changes = ChangeStream(resource_fn, fo, keys_table)
+
+        metadata = {
+            "resource_fn": os.path.basename(resource_fn),
+            "version": None,
+            "previous_version": None,
+            "full": changes.previous is None,
+        }
+        if changes.previous is not None:
+            metadata["previous_version"] = changes.previous_metadata.get("version")
+
+        # Resource files without a metadata header, e.g. backbone nanopubs, have no version
+        first_line = fi.readline()
+        if first_line.startswith('{"metadata"'):
+            metadata["version"] = json.loads(first_line)["metadata"].get("version")
+            first_line = ""
+        fo.write(json.dumps({"metadata": metadata}) + "\n")
+
+        for line in itertools.chain([first_line] if first_line else [], fi):
+            line = line.rstrip("\n")
+            changes.add(line_key(line), line)
+
+        arrays = changes.finish()
+
+    metadata.update(
+        {
+            "records": len(arrays["key_hashes"]),
+            "upserts": changes.upserts,
+            "deletes": changes.deletes,
+        }
+    )
+
+    write_arrays(tmp_dir, arrays, metadata)
+    os.replace(tmp_changes_fn, changes_fn(resource_fn))
+    finalize_dir(tmp_dir, pending_hashes_dir(resource_fn))
+
+    log.info("Change stream", changes_fn=changes_fn(resource_fn), **metadata)
+
+    return metadata
+
+
+def commit_change_stream(resource_fn: str) -> bool:
+    """Replace the content hash sidecar of resource file with the pending one
+
+    Run after publishing the resource and change stream files, so the next change
+    stream is relative to this release.
+
+    Returns:
+        bool: a pending sidecar was committed
+    """
+
+    if not os.path.exists(f"{pending_hashes_dir(resource_fn)}/metadata.json"):
+        return False
+
+    finalize_dir(pending_hashes_dir(resource_fn), hashes_dir(resource_fn))
+
+    log.info("Committed change stream sidecar", hashes_dir=hashes_dir(resource_fn))
+
+    return True
@@ -1,6 +1,5 @@
 import datetime
 import ftplib
-import gzip
 import os
 import pathlib
 import re
@@ -16,6 +15,7 @@ import yaml
 from dateutil import parser
 
 import app.settings as settings
+from app.common.compressed_io import default_levels, open_compressed
 from app.common.text import timestamp_to_date
 
 log = structlog.get_logger()
@@ -40,6 +40,20 @@ def file_newer(check_file: str, base_file: str) -> bool:
     return cf_modtime_ts > bf_modtime_ts
 
 
+def open_download(download_fn: str, mode: str = "wb"):
+    """Open download file for writing compressed with the download codec and compression level
+
+    The codec of a download file is detected when reading it so download filenames are unchanged
+    """
+
+    codec = settings.DOWNLOAD_CODEC
+    compresslevel = settings.DOWNLOAD_COMPRESSION_LEVEL
+    if compresslevel is None:
+        compresslevel = default_levels[codec]
+
+    return open_compressed(download_fn, mode, compresslevel=compresslevel, codec=codec)
+
+
 def get_web_file(
     url: str,
     download_fn: str,
@@ -102,7 +116,7 @@ def get_web_file(
     if need_download:
 
         if not re.search("\.gz$", url):
-            file_open_fn = gzip.open
+            file_open_fn = open_download
         else:
             file_open_fn = open
 
@@ -172,13 +186,13 @@ def get_ftp_file(
             return (changed, "Remote file is not newer than local file")
 
         if compress_flag:
-            file_open_fn = gzip.open
+            file_open_fn = open_download
         else:
             file_open_fn = open
 
         # Retrieve and save file
         if compress_flag:
-            with gzip.open(download_fn, "wb") as f:
+            with open_download(download_fn) as f:
                 ftp.retrbinary(f"RETR {filename}", f.write)
         else:
             with open(download_fn, "wb") as f:
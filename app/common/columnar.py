@@ -0,0 +1,257 @@
+"""Columnar Parquet export of namespace terms
+
+The Term schema (app/schemas/main.py) maps to an Arrow schema - scalar fields
+are string columns, list fields (synonyms, equivalence_keys, ...) list<string>
+columns - so analytics can read a few columns of one namespace and species
+without parsing JSON lines.
+
+The terms of all namespace resource files share one hive partitioned dataset:
+
+    exports/parquet/terms/namespace=EG/species=TAX_9606/eg_000.parquet
+    exports/parquet/terms/namespace=EG/species=other/eg_000.parquet
+    exports/parquet/terms/namespace=CHEBI/species=none/chebi_000.parquet
+    exports/parquet/terms/_manifests/eg.json
+
+Only the species of the species subsets (settings.SPECIES_SUBSETS) get their
+own partition, the terms of all other species go to species=other (EG alone has
+thousands of species, most with a handful of genes) - the species_key column is
+still there to filter on. The namespace is only stored as the partition.
+Species partition values are the species keys with "_" for ":" - never numeric,
+so hive partitioning infers a string species column.
+
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(f"{export_dir}/terms", format="parquet", partitioning="hive")
+    dataset.to_table(columns=["key", "label"], filter=ds.field("species") == "TAX_9606")
+
+Terms are buffered per partition and written as record batches (one row group
+each), either in the same pass as the resource file (SubsetWriter sink, when
+settings.PARQUET_EXPORT is set) or from an existing resource file. Each resource
+file replaces only its own files, listed in its manifest.
+"""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Tuple
+
+import structlog
+from pydantic.fields import SHAPE_LIST
+
+import app.settings as settings
+from app.common.arrays import make_tmp_dir
+from app.common.compressed_io import open_compressed
+from app.common.subsets import get_species_subsets
+from app.schemas.main import Term
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+log = structlog.getLogger(__name__)
+
+export_dir = f"{settings.DATA_DIR}/exports/parquet"
+
+default_batch_rows = 65536
+
+# Partition values of terms without a species and of species without their own partition
+no_species = "none"
+other_species = "other"
+
+
+def terms_dir(directory: str = export_dir) -> str:
+    """Term dataset directory"""
+
+    return f"{directory}/terms"
+
+
+def manifest_fn(resource_fn: str, directory: str = export_dir) -> str:
+    """Manifest of the dataset files of resource file"""
+
+    name = os.path.basename(resource_fn).split(".")[0]
+
+    return f"{terms_dir(directory)}/_manifests/{name}.json"
+
+
+def term_columns() -> List[Tuple[str, bool]]:
+    """(column, is list) of the Term schema fields - namespace is the partition"""
+
+    return [
+        (name, field.shape == SHAPE_LIST)
+        for name, field in Term.__fields__.items()
+        if name != "namespace"
+    ]
+
+
+def term_schema():
+    """Arrow schema of the Term columns"""
+
+    return pyarrow.schema(
+        [
+            (name, pyarrow.list_(pyarrow.string()) if is_list else pyarrow.string())
+            for (name, is_list) in term_columns()
+        ]
+    )
+
+
+def species_partitions() -> Dict[str, str]:
+    """Species key -> species partition value for the species with their own partition"""
+
+    species_keys = set()
+    for species_set in get_species_subsets().values():
+        species_keys.update(species_set)
+
+    return {species_key: species_key.replace(":", "_") for species_key in species_keys}
+
+
+class TermParquetWriter(object):
+    """Write the term records of a resource file into the partitioned Parquet dataset
+
+    Non-term records are ignored. Used as an extra sink of SubsetWriter so the
+    dataset files are written in the same pass as the resource file.
+
+    Usage:
+        with TermParquetWriter(resource_fn) as fo:
+            fo.write(term_line)
+    """
+
+    def __init__(
+        self, resource_fn: str, directory: str = export_dir, batch_rows: int = default_batch_rows
+    ):
+
+        if pyarrow is None:
+            raise ImportError("pyarrow package is required to write Parquet files")
+
+        self.resource_fn = resource_fn
+        self.directory = directory
+        self.batch_rows = batch_rows
+        self.name = os.path.basename(resource_fn).split(".")[0]
+
+        self.columns = term_columns()
+        self.schema = term_schema()
+        self.species = species_partitions()
+
+        self.buffers: Dict[str, dict] = {}
+        self.writers: Dict[str, "pyarrow.parquet.ParquetWriter"] = {}
+        self.counts: Dict[str, int] = {}
+
+    def __enter__(self):
+
+        os.makedirs(terms_dir(self.directory), exist_ok=True)
+        self.tmp_dir = make_tmp_dir(f"{terms_dir(self.directory)}/_{self.name}")
+
+        return self
+
+    def partition(self, term: dict) -> str:
+
+        species_key = term.get("species_key")
+        if not species_key:
+            species = no_species
+        else:
+            species = self.species.get(species_key, other_species)
+
+        return f"namespace={term.get('namespace')}/species={species}"
+
+    def write(self, line: str, record: dict = None):
+        """Add term line - record is the parsed line if the caller already has it"""
+
+        if not line.startswith('{"term"'):
+            return
+
+        if record is None:
+            record = json.loads(line)
+        term = record["term"]
+        partition = self.partition(term)
+
+        buffer = self.buffers.get(partition)
+        if buffer is None:
+            buffer = self.buffers[partition] = {name: [] for (name, _) in self.columns}
+            self.counts[partition] = 0
+
+        for (name, is_list) in self.columns:
+            value = term.get(name)
+            buffer[name].append(value if value or not is_list else None)
+        self.counts[partition] += 1
+
+        if len(buffer["key"]) >= self.batch_rows:
+            self.flush(partition)
+
+    def flush(self, partition: str):
+
+        buffer = self.buffers[partition]
+        if not buffer["key"]:
+            return
+
+        writer = self.writers.get(partition)
+        if writer is None:
+            os.makedirs(f"{self.tmp_dir}/{partition}")
+            writer = self.writers[partition] = pyarrow.parquet.ParquetWriter(
+                f"{self.tmp_dir}/{partition}/{self.name}_000.parquet",
+                self.schema,
+                compression="zstd",
+            )
+
+        writer.write_batch(pyarrow.RecordBatch.from_pydict(buffer, schema=self.schema))
+        for values in buffer.values():
+            values.clear()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            for partition in self.buffers:
+                self.flush(partition)
+
+        for writer in self.writers.values():
+            writer.close()
+
+        # Only resource files with terms get dataset files, e.g. not backbone nanopubs
+        if exc_type is not None or not self.writers:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return
+
+        # Replace the previous files of this resource file only
+        previous_manifest_fn = manifest_fn(self.resource_fn, self.directory)
+        if os.path.exists(previous_manifest_fn):
+            with open(previous_manifest_fn, "r") as f:
+                for filename in json.load(f)["files"]:
+                    if os.path.exists(f"{terms_dir(self.directory)}/{filename}"):
+                        os.remove(f"{terms_dir(self.directory)}/{filename}")
+
+        files = {}
+        for partition in sorted(self.writers):
+            filename = f"{partition}/{self.name}_000.parquet"
+            os.makedirs(f"{terms_dir(self.directory)}/{partition}", exist_ok=True)
+            os.replace(f"{self.tmp_dir}/{filename}", f"{terms_dir(self.directory)}/{filename}")
+            files[filename] = self.counts[partition]
+
+        shutil.rmtree(self.tmp_dir)
+
+        manifest = {
+            "resource_fn": os.path.basename(self.resource_fn),
+            "terms": sum(files.values()),
+            "files": files,
+        }
+        os.makedirs(os.path.dirname(previous_manifest_fn), exist_ok=True)
+        with open(f"{previous_manifest_fn}.tmp", "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(f"{previous_manifest_fn}.tmp", previous_manifest_fn)
+
+        log.info(
+            "Parquet terms",
+            resource_fn=self.resource_fn,
+            partitions=len(files),
+            terms=manifest["terms"],
+        )
+
+
+def derive_parquet(
+    resource_fn: str, directory: str = export_dir, batch_rows: int = default_batch_rows
+):
+    """Write the terms of an existing namespace resource file into the Parquet dataset"""
+
+    with open_compressed(resource_fn, "rt") as fi, TermParquetWriter(
+        resource_fn, directory, batch_rows
+    ) as fo:
+        for line in fi:
+            fo.write(line)
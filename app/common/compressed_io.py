@@ -0,0 +1,504 @@
+"""Pipelined gzip/zstd file I/O
+
+Drop-in replacement for gzip.open where decompression and compression run in
+background threads (zlib releases the GIL) so parsing/serializing in the main
+thread overlaps with inflating the source file and deflating the result file.
+
+The codec for writing is given by the filename extension (.zst for zstd, otherwise gzip)
+or the codec argument. The codec for reading is detected from the file contents.
+
+Reading: a reader thread inflates (and decodes) blocks ahead into a bounded queue.
+
+Writing: writes are collected into blocks which a writer thread deflates into the
+result file. With threads > 1 each block is compressed in parallel as a separate
+gzip member - the concatenated multi-member gzip file is readable by gzip/gunzip.
+"""
+
+import codecs
+import collections
+import concurrent.futures
+import gzip
+import os
+import queue
+import threading
+import time
+from typing import Iterator, Tuple, Union
+
+import structlog
+
+import app.settings as settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = structlog.getLogger(__name__)
+
+default_block_size = 4 * 1024 * 1024
+default_queue_blocks = 8
+
+default_levels = {"gzip": 9, "zstd": 3}
+zstd_magic = b"\x28\xb5\x2f\xfd"
+
+_eof = object()
+
+
+def codec_for_filename(filename: str) -> str:
+    """Compression codec for filename based on extension"""
+
+    if filename.endswith(".zst"):
+        return "zstd"
+
+    return "gzip"
+
+
+def compression_level(codec: str, compresslevel: int = None) -> int:
+    """Compression level to use for codec
+
+    Defaults to settings.RESOURCE_COMPRESSION_LEVEL for the resource codec - it is not
+    valid for other codecs, e.g. zstd level 19 for the fixed gzip outputs - and to
+    default_levels otherwise.
+    """
+
+    if compresslevel is None and codec == settings.RESOURCE_CODEC:
+        compresslevel = settings.RESOURCE_COMPRESSION_LEVEL
+    if compresslevel is None:
+        compresslevel = default_levels[codec]
+
+    return compresslevel
+
+
+def open_compressed(
+    filename: str,
+    mode: str = "rt",
+    compresslevel: int = None,
+    threads: int = None,
+    codec: str = None,
+    encoding: str = "utf-8",
+    block_size: int = default_block_size,
+    queue_blocks: int = default_queue_blocks,
+):
+    """Open gzip or zstd file for pipelined reading or writing
+
+    Args:
+        filename: gzip/zstd filename
+        mode: r, rb, rt, w, wb, wt - defaults to binary as for gzip.open if no t
+        compresslevel: compression level for writing - defaults to settings.RESOURCE_COMPRESSION_LEVEL
+            or the codec default (gzip: 9, zstd: 3)
+        threads: number of parallel compression threads for writing
+            1 - single gzip member written by a background thread
+            > 1 - multi-member gzip with blocks compressed in parallel or multi-threaded zstd
+            defaults to settings.COMPRESSION_THREADS
+        codec: gzip or zstd for writing - defaults to codec for the filename extension
+        encoding: text encoding for text modes
+        block_size: size of blocks passed between threads
+        queue_blocks: number of blocks to buffer between threads
+
+    Returns:
+        PipelinedReader or PipelinedWriter file object
+    """
+
+    text = "t" in mode
+    if not text:
+        encoding = None
+
+    if "r" in mode:
+        return PipelinedReader(
+            filename, encoding=encoding, block_size=block_size, queue_blocks=queue_blocks
+        )
+    elif "w" in mode:
+        if threads is None:
+            threads = settings.COMPRESSION_THREADS
+        if codec is None:
+            codec = codec_for_filename(filename)
+        if codec == "zstd" and zstandard is None:
+            raise ImportError("zstandard package is required to write zstd files")
+
+        return PipelinedWriter(
+            filename,
+            codec=codec,
+            compresslevel=compression_level(codec, compresslevel),
+            threads=threads,
+            encoding=encoding,
+            block_size=block_size,
+            queue_blocks=queue_blocks,
+        )
+    else:
+        raise ValueError(f"Invalid mode: {mode}")
+
+
+def _open_decompressed(filename: str):
+    """Open binary decompressed stream of gzip or zstd file"""
+
+    raw = open(filename, "rb")
+    if raw.read(4) == zstd_magic:
+        if zstandard is None:
+            raw.close()
+            raise ImportError(f"zstandard package is required to read zstd file {filename}")
+        raw.seek(0)
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+
+    raw.seek(0)
+    return gzip.GzipFile(fileobj=raw, mode="rb")
+
+
+class PipelinedReader(object):
+    """Gzip/zstd file reader with decompression in a background thread"""
+
+    def __init__(
+        self,
+        filename: str,
+        encoding: str = None,
+        block_size: int = default_block_size,
+        queue_blocks: int = default_queue_blocks,
+    ):
+
+        self.name = filename
+        self.encoding = encoding
+        self.block_size = block_size
+
+        self._empty = "" if encoding else b""
+        self._newline = "\n" if encoding else b"\n"
+        self._buffer = self._empty
+        self._pos = 0
+        self._eof = False
+        self._closed = False
+        self._line_iter = None
+
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        """Put item on queue unless reader is closed"""
+
+        while not self._closed:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _read_ahead(self):
+        """Inflate blocks of the file into the queue - runs in reader thread"""
+
+        try:
+            with _open_decompressed(self.name) as f:
+                if self.encoding:
+                    decoder = codecs.getincrementaldecoder(self.encoding)()
+
+                pending_cr = False
+                while True:
+                    data = f.read(self.block_size)
+                    if self.encoding:
+                        block = decoder.decode(data, final=not data)
+
+                        # Universal newlines as for gzip.open text modes
+                        if pending_cr:
+                            block = "\r" + block
+                            pending_cr = False
+                        if data and block.endswith("\r"):
+                            block = block[:-1]
+                            pending_cr = True
+                        if "\r" in block:
+                            block = block.replace("\r\n", "\n").replace("\r", "\n")
+                    else:
+                        block = data
+
+                    if block and not self._put(block):
+                        return
+                    if not data:
+                        break
+
+        except Exception as e:
+            self._put(e)
+
+        finally:
+            self._put(_eof)
+
+    def _next_block(self) -> Union[str, bytes, None]:
+        """Get next block from reader thread - None at end of file"""
+
+        if self._eof:
+            return None
+
+        block = self._queue.get()
+        if block is _eof:
+            self._eof = True
+            return None
+        if isinstance(block, Exception):
+            self._eof = True
+            raise block
+
+        return block
+
+    def read(self, size: int = -1) -> Union[str, bytes]:
+        """Read up to size characters/bytes - or the rest of the file if size < 0
+
+        Reading a given size isn't supported once line iteration/readline has started.
+        """
+
+        if self._line_iter is not None:
+            if size is None or size < 0:
+                return self._empty.join(self._line_iter)
+            raise ValueError("Cannot read(size) after iterating over lines")
+
+        if size is None or size < 0:
+            parts = [self._buffer[self._pos :]]
+            block = self._next_block()
+            while block is not None:
+                parts.append(block)
+                block = self._next_block()
+
+            self._buffer = self._empty
+            self._pos = 0
+            return self._empty.join(parts)
+
+        while len(self._buffer) - self._pos < size:
+            block = self._next_block()
+            if block is None:
+                break
+            self._buffer = self._buffer[self._pos :] + block
+            self._pos = 0
+
+        data = self._buffer[self._pos : self._pos + size]
+        self._pos += len(data)
+
+        return data
+
+    def _lines(self) -> Iterator[Union[str, bytes]]:
+        """Split blocks into lines"""
+
+        newline = self._newline
+        while True:
+            block = self._next_block()
+            if block is None:
+                tail = self._buffer[self._pos :]
+                self._buffer = self._empty
+                self._pos = 0
+                if tail:
+                    yield tail
+                return
+
+            lines = (self._buffer[self._pos :] + block).split(newline)
+            self._buffer = lines.pop()
+            self._pos = 0
+            for line in lines:
+                yield line + newline
+
+    def readline(self) -> Union[str, bytes]:
+        return next(iter(self), self._empty)
+
+    def readlines(self):
+        return list(self)
+
+    def __iter__(self):
+
+        if self._line_iter is None:
+            self._line_iter = self._lines()
+
+        return self._line_iter
+
+    def __next__(self) -> Union[str, bytes]:
+        return next(iter(self))
+
+    def close(self):
+
+        if self._closed:
+            return
+
+        self._closed = True
+
+        # Unblock reader thread if waiting on a full queue
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        self._thread.join()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PipelinedWriter(object):
+    """Gzip/zstd file writer with compression in background thread(s)"""
+
+    def __init__(
+        self,
+        filename: str,
+        codec: str = "gzip",
+        compresslevel: int = 9,
+        threads: int = 1,
+        encoding: str = None,
+        block_size: int = default_block_size,
+        queue_blocks: int = default_queue_blocks,
+    ):
+
+        self.name = filename
+        self.codec = codec
+        self.compresslevel = compresslevel
+        self.threads = max(threads, 1)
+        self.encoding = encoding
+        self.block_size = block_size
+
+        self._parts = []
+        self._size = 0
+        self._error = None
+        self._closed = False
+
+        self._queue = queue.Queue(maxsize=queue_blocks)
+        self._thread = threading.Thread(target=self._write_behind, daemon=True)
+        self._thread.start()
+
+    def _write_behind(self):
+        """Deflate queued blocks into file - runs in writer thread"""
+
+        try:
+            if self.codec == "zstd":
+                self._write_zstd()
+            elif self.threads == 1:
+                with gzip.open(self.name, "wb", compresslevel=self.compresslevel) as f:
+                    for block in iter(self._queue.get, _eof):
+                        f.write(block)
+            else:
+                self._write_members()
+
+        except Exception as e:
+            self._error = e
+
+            # Drain queue so the main thread isn't blocked on a full queue
+            for block in iter(self._queue.get, _eof):
+                pass
+
+    def _write_members(self):
+        """Compress blocks in parallel into separate gzip members written in order"""
+
+        pending = collections.deque()
+        with open(self.name, "wb") as f, concurrent.futures.ThreadPoolExecutor(
+            self.threads
+        ) as executor:
+            for block in iter(self._queue.get, _eof):
+                pending.append(executor.submit(gzip.compress, block, self.compresslevel))
+                while len(pending) > self.threads or (pending and pending[0].done()):
+                    f.write(pending.popleft().result())
+
+            while pending:
+                f.write(pending.popleft().result())
+
+    def _write_zstd(self):
+        """Compress blocks into zstd file using zstd's own worker threads if threads > 1"""
+
+        compressor = zstandard.ZstdCompressor(
+            level=self.compresslevel, threads=self.threads if self.threads > 1 else 0
+        )
+        with open(self.name, "wb") as f, compressor.stream_writer(f) as writer:
+            for block in iter(self._queue.get, _eof):
+                writer.write(block)
+
+    def _check_error(self):
+        if self._error:
+            raise self._error
+
+    def _flush_block(self):
+
+        if not self._parts:
+            return
+
+        self._check_error()
+
+        if self.encoding:
+            block = "".join(self._parts).encode(self.encoding)
+        else:
+            block = b"".join(self._parts)
+
+        self._parts = []
+        self._size = 0
+        self._queue.put(block)
+
+    def write(self, data: Union[str, bytes]) -> int:
+
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= self.block_size:
+            self._flush_block()
+
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self._flush_block()
+
+    def close(self):
+
+        if self._closed:
+            return
+
+        self._flush_block()
+        self._closed = True
+        self._queue.put(_eof)
+        self._thread.join()
+        self._check_error()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def recompress(
+    filename: str, compresslevel: int = None, codec: str = None, threads: int = None
+) -> Tuple[int, int]:
+    """Recompress file in place, e.g. at a higher compression level for publishing
+
+    Args:
+        filename: gzip/zstd file to recompress
+        compresslevel: new compression level
+        codec: new codec - defaults to codec for the filename extension
+        threads: number of compression threads
+
+    Returns:
+        Tuple[int, int]: file size before and after recompression
+    """
+
+    old_size = os.path.getsize(filename)
+    tmp_fn = f"{filename}.tmp"
+
+    start = time.time()
+    with open_compressed(filename, "rb") as fi, open_compressed(
+        tmp_fn, "wb", compresslevel=compresslevel, threads=threads, codec=codec
+    ) as fo:
+        for block in iter(lambda: fi.read(default_block_size), b""):
+            fo.write(block)
+
+    os.replace(tmp_fn, filename)
+    new_size = os.path.getsize(filename)
+
+    log.info(
+        "Recompressed file",
+        filename=filename,
+        old_size=old_size,
+        new_size=new_size,
+        secs=round(time.time() - start, 2),
+    )
+
+    return (old_size, new_size)
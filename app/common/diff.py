@@ -0,0 +1,245 @@
+"""Release-to-release diff of resource files by record key
+
+Both resource files are streamed as (sort key, key, line) rows and merged in
+key order. Builders mostly write records in source order, e.g. EG in numeric
+gene id order, so the sort key orders numeric ids numerically. If either file
+turns out not to be in sort key order the diff restarts with both files
+externally sorted (joins.external_sort) so memory stays bounded by the
+memory budget regardless of the file sizes.
+
+Records are keyed by term key, ortholog subject and object keys or - for other
+records, e.g. backbone nanopubs - by the whole line (added/removed only).
+List values are compared ignoring order, e.g. reordered synonyms are not a change.
+
+Diff file records:
+
+    {"op": "added", "key": "EG:207", "record": {"term": {...}}}
+    {"op": "removed", "key": "EG:208", "record": {"term": {...}}}
+    {"op": "changed", "key": "EG:209", "changes": {"label": ["OLD", "NEW"]}, "record": {...}}
+"""
+
+import json
+import re
+from typing import Iterator, Optional, Tuple
+
+import structlog
+
+import app.settings as settings
+from app.common.compressed_io import open_compressed
+from app.common.joins import external_sort
+
+log = structlog.getLogger(__name__)
+
+ops = ["added", "removed", "changed"]
+
+# Key of term lines as serialized by json.dumps()
+term_key_re = re.compile(r'^\{"term": \{"key": "([^"]*)"')
+
+
+class KeyOrderError(Exception):
+    """Resource file is not in sort key order"""
+
+
+def sort_key(key: str) -> str:
+    """Sort key of record key - numeric ids sort numerically, e.g. EG:9 < EG:10"""
+
+    (prefix, _, id) = key.partition(":")
+    if id.isdigit():
+        return f"{prefix}\x01{len(id):08d}{id}"
+
+    return f"{prefix}\x02{id}"
+
+
+def line_key(line: str) -> str:
+    """Record key of resource line"""
+
+    match = term_key_re.match(line)
+    if match:
+        return match.group(1)
+
+    record = json.loads(line)
+    if "term" in record:
+        return record["term"]["key"]
+    elif "ortholog" in record:
+        return f"{record['ortholog']['subject_key']} {record['ortholog']['object_key']}"
+
+    return line
+
+
+def resource_version(resource_fn: str) -> Optional[str]:
+    """Version from the metadata header of resource file"""
+
+    with open_compressed(resource_fn, "rt") as fi:
+        line = fi.readline()
+
+    if line.startswith('{"metadata"'):
+        return json.loads(line)["metadata"].get("version")
+
+    return None
+
+
+def keyed_rows(resource_fn: str) -> Iterator[Tuple[str, str, str]]:
+    """(sort key, key, line) rows of resource file records - metadata header skipped"""
+
+    with open_compressed(resource_fn, "rt") as fi:
+        for line in fi:
+            if line.startswith('{"metadata"'):
+                continue
+
+            line = line.rstrip("\n")
+            key = line_key(line)
+            yield (sort_key(key), key, line)
+
+
+def checked_order(rows: Iterator[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, str]]:
+    """Pass through rows raising KeyOrderError on the first row out of sort key order"""
+
+    previous = None
+    for row in rows:
+        if previous is not None and row[0] < previous:
+            raise KeyOrderError(row[1])
+        previous = row[0]
+        yield row
+
+
+def grouped(rows: Iterator[Tuple[str, str, str]]) -> Iterator[Tuple[str, str, str, int]]:
+    """Collapse consecutive rows with the same key - last record wins
+
+    Returns:
+        Iterator[Tuple[str, str, str, int]]: sort key, key, line and number of rows with key
+    """
+
+    current = None
+    count = 0
+    for row in rows:
+        if current is not None and row[0] == current[0]:
+            current = row
+            count += 1
+            continue
+
+        if current is not None:
+            yield current + (count,)
+        (current, count) = (row, 1)
+
+    if current is not None:
+        yield current + (count,)
+
+
+def normalized(value):
+    """Value with lists in canonical order for order insensitive comparison"""
+
+    if isinstance(value, list):
+        return sorted(
+            [normalized(item) for item in value], key=lambda item: json.dumps(item, sort_keys=True)
+        )
+    elif isinstance(value, dict):
+        return {key: normalized(item) for key, item in value.items()}
+
+    return value
+
+
+def record_changes(old_line: str, new_line: str) -> Optional[dict]:
+    """Changed fields of record as {field: [old value, new value]} or None if unchanged"""
+
+    if old_line == new_line:
+        return None
+
+    old_record = json.loads(old_line)
+    new_record = json.loads(new_line)
+    record_type = next(iter(new_record))
+    old_values = old_record.get(record_type) or {}
+    new_values = new_record.get(record_type) or {}
+
+    changes = {}
+    for field in sorted(set(old_values) | set(new_values)):
+        old_value = old_values.get(field)
+        new_value = new_values.get(field)
+        if old_value != new_value and normalized(old_value) != normalized(new_value):
+            changes[field] = [old_value, new_value]
+
+    return changes or None
+
+
+def _merge(old_rows, new_rows, fo, summary: dict):
+    """Merge key sorted rows of the old and new file writing diff records"""
+
+    def emit(op: str, key: str, line: str, changes: dict = None):
+        summary[op] += 1
+        diff_record = {"op": op, "key": key}
+        if changes:
+            diff_record["changes"] = changes
+        fo.write(json.dumps(diff_record)[:-1] + f', "record": {line}}}\n')
+
+    old_iter = grouped(old_rows)
+    new_iter = grouped(new_rows)
+    old = next(old_iter, None)
+    new = next(new_iter, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            emit("removed", old[1], old[2])
+            summary["duplicate_keys"] += old[3] - 1
+            old = next(old_iter, None)
+        elif old is None or new[0] < old[0]:
+            emit("added", new[1], new[2])
+            summary["duplicate_keys"] += new[3] - 1
+            new = next(new_iter, None)
+        else:
+            changes = record_changes(old[2], new[2])
+            if changes:
+                emit("changed", new[1], new[2], changes)
+                for field in changes:
+                    summary["field_changes"][field] = summary["field_changes"].get(field, 0) + 1
+            else:
+                summary["unchanged"] += 1
+            summary["duplicate_keys"] += old[3] - 1 + new[3] - 1
+            old = next(old_iter, None)
+            new = next(new_iter, None)
+
+
+def diff_resources(
+    old_fn: str,
+    new_fn: str,
+    diff_fn: str,
+    memory_budget: int = settings.JOIN_MEMORY_BUDGET,
+    work_dir: str = None,
+) -> dict:
+    """Diff two releases of a resource file by record key
+
+    Args:
+        old_fn: previous resource file
+        new_fn: new resource file
+        diff_fn: diff file to write (added/removed/changed records)
+        memory_budget: approximate number of bytes to hold in memory for external sorts
+        work_dir: directory for the external sort runs
+
+    Returns:
+        dict: summary with added/removed/changed/unchanged counts and changes per field
+    """
+
+    for presorted in (True, False):
+        summary = {op: 0 for op in ops}
+        summary.update({"unchanged": 0, "duplicate_keys": 0, "field_changes": {}})
+
+        if presorted:
+            old_rows = checked_order(keyed_rows(old_fn))
+            new_rows = checked_order(keyed_rows(new_fn))
+        else:
+            old_rows = external_sort(keyed_rows(old_fn), 0, memory_budget, work_dir)
+            new_rows = external_sort(keyed_rows(new_fn), 0, memory_budget, work_dir)
+
+        try:
+            with open_compressed(diff_fn, "wt") as fo:
+                _merge(old_rows, new_rows, fo, summary)
+            break
+        except KeyOrderError as e:
+            log.info("Resource file is not key sorted - using external sort", key=str(e))
+
+    summary["field_changes"] = dict(
+        sorted(summary["field_changes"].items(), key=lambda item: (-item[1], item[0]))
+    )
+    summary["presorted"] = presorted
+    summary["old_version"] = resource_version(old_fn)
+    summary["new_version"] = resource_version(new_fn)
+
+    return summary
@@ -0,0 +1,255 @@
+"""Elasticsearch bulk NDJSON files of namespace terms
+
+Term records are written as ready-to-POST _bulk request bodies (action line plus
+document line) split into chunks of at most settings.ES_BULK_CHUNK_SIZE
+uncompressed bytes, so loading is just streaming the chunk files to the _bulk API.
+
+Each document is the term with a precomputed completion suggester field:
+
+    {"index": {"_index": "terms", "_id": "EG:207"}}
+    {"key": "EG:207", ..., "autocomplete": [
+        {"input": ["AKT1"], "weight": 10, "contexts": {"species": ["TAX:9606"], "entity_types": [...]}},
+        {"input": ["PKB", "RAC"], "weight": 5, "contexts": {...}}
+    ]}
+
+Chunks are gzip compressed (POST with Content-Encoding: gzip) and live next to
+the resource file with a manifest:
+
+    namespaces/es_bulk/eg/eg_000.ndjson.gz ...
+    namespaces/es_bulk/eg/manifest.json
+
+The index mapping (resources/es_terms_mapping.json) makes autocomplete a
+completion field with species and entity_types category contexts - the index is
+created with it before the first chunks are posted.
+"""
+
+import json
+import os
+import shutil
+from typing import List
+
+import requests
+import structlog
+
+import app.settings as settings
+from app.common.arrays import finalize_dir, make_tmp_dir
+from app.common.compressed_io import open_compressed
+
+log = structlog.getLogger(__name__)
+
+label_weight = 10
+synonym_weight = 5
+
+# Completion suggester contexts for terms without species or entity types
+all_context = "all"
+
+mapping_fn = f"{settings.RESOURCES_DIR}/es_terms_mapping.json"
+
+
+def es_bulk_dir(resource_fn: str) -> str:
+    """Bulk chunk directory of resource file, e.g. namespaces/eg.jsonl.gz -> namespaces/es_bulk/eg"""
+
+    name = os.path.basename(resource_fn).split(".")[0]
+
+    return f"{os.path.dirname(resource_fn)}/es_bulk/{name}"
+
+
+def autocomplete(term: dict) -> List[dict]:
+    """Completion suggester inputs of term - label weighted over synonyms"""
+
+    contexts = {
+        "species": [term.get("species_key") or all_context],
+        "entity_types": term.get("entity_types") or [all_context],
+    }
+
+    label = term.get("label") or term.get("name") or term.get("id")
+    synonyms = sorted(
+        {synonym for synonym in term.get("synonyms") or [] if synonym and synonym != label}
+    )
+
+    suggestions = []
+    if label:
+        suggestions.append({"input": [label], "weight": label_weight, "contexts": contexts})
+    if synonyms:
+        suggestions.append({"input": synonyms, "weight": synonym_weight, "contexts": contexts})
+
+    return suggestions
+
+
+def bulk_lines(term: dict, index: str) -> str:
+    """Bulk action and document lines of term"""
+
+    document = dict(term)
+    document["autocomplete"] = autocomplete(term)
+
+    action = {"index": {"_index": index, "_id": term["key"]}}
+
+    return f"{json.dumps(action)}\n{json.dumps(document)}\n"
+
+
+class BulkWriter(object):
+    """Write the term records of a resource file as size capped bulk NDJSON chunks
+
+    Non-term records (metadata, orthologs, nanopubs) are ignored. Used as an extra
+    sink of SubsetWriter for namespace term files so the chunks are written in the
+    same pass as the resource file.
+
+    Usage:
+        with BulkWriter(resource_fn) as fo:
+            fo.write(term_line)
+    """
+
+    def __init__(self, resource_fn: str, index: str = None, chunk_size: int = None):
+
+        self.resource_fn = resource_fn
+        self.index = index or settings.ES_TERMS_INDEX
+        self.chunk_size = chunk_size or settings.ES_BULK_CHUNK_SIZE
+        self.name = os.path.basename(resource_fn).split(".")[0]
+
+        self.chunks = []
+        self.fo = None
+
+    def __enter__(self):
+
+        self.tmp_dir = make_tmp_dir(es_bulk_dir(self.resource_fn))
+
+        return self
+
+    def _next_chunk(self):
+
+        if self.fo is not None:
+            self.fo.close()
+
+        filename = f"{self.name}_{len(self.chunks):03d}.ndjson.gz"
+        self.fo = open_compressed(f"{self.tmp_dir}/{filename}", "wt", codec="gzip")
+        self.chunks.append({"filename": filename, "documents": 0, "bytes": 0})
+
+    def write(self, line: str, record: dict = None):
+        """Add term line - record is the parsed line if the caller already has it"""
+
+        if not line.startswith('{"term"'):
+            return
+
+        if record is None:
+            record = json.loads(line)
+        lines = bulk_lines(record["term"], self.index)
+        size = len(lines.encode("utf-8"))
+
+        chunk = self.chunks[-1] if self.chunks else None
+        if chunk is None or (chunk["documents"] and chunk["bytes"] + size > self.chunk_size):
+            self._next_chunk()
+            chunk = self.chunks[-1]
+
+        self.fo.write(lines)
+        chunk["documents"] += 1
+        chunk["bytes"] += size
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if self.fo is not None:
+            self.fo.close()
+
+        # Only resource files with terms get bulk chunks
+        if exc_type is not None or not self.chunks:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            # Don't leave an empty es_bulk directory behind
+            try:
+                os.rmdir(os.path.dirname(self.tmp_dir))
+            except OSError:
+                pass
+            return
+
+        manifest = {
+            "resource_fn": os.path.basename(self.resource_fn),
+            "index": self.index,
+            "documents": sum([chunk["documents"] for chunk in self.chunks]),
+            "chunks": self.chunks,
+        }
+        with open(f"{self.tmp_dir}/manifest.json", "w") as f:
+            json.dump(manifest, f, indent=4)
+
+        finalize_dir(self.tmp_dir, es_bulk_dir(self.resource_fn))
+
+        log.info(
+            "Elasticsearch bulk chunks",
+            resource_fn=self.resource_fn,
+            chunks=len(self.chunks),
+            documents=manifest["documents"],
+        )
+
+
+def derive_es_bulk(resource_fn: str, index: str = None, chunk_size: int = None):
+    """Write bulk NDJSON chunks of an existing namespace resource file"""
+
+    with open_compressed(resource_fn, "rt") as fi, BulkWriter(resource_fn, index, chunk_size) as fo:
+        for line in fi:
+            fo.write(line)
+
+
+def create_index(es_url: str, index: str) -> bool:
+    """Create index with the terms mapping if it doesn't exist yet
+
+    Returns:
+        bool: index was created
+    """
+
+    index_url = f"{es_url.rstrip('/')}/{index}"
+
+    r = requests.head(index_url)
+    if r.status_code == 200:
+        return False
+    elif r.status_code != 404:
+        r.raise_for_status()
+
+    with open(mapping_fn, "r") as f:
+        mapping = json.load(f)
+
+    r = requests.put(index_url, json=mapping)
+    r.raise_for_status()
+
+    log.info("Created Elasticsearch index", index=index, mapping_fn=mapping_fn)
+
+    return True
+
+
+def post_es_bulk(resource_fn: str, es_url: str) -> int:
+    """POST the bulk chunks of resource file to Elasticsearch as they are
+
+    Resource files without bulk chunks (no manifest) are skipped with a warning.
+
+    Returns:
+        int: number of documents with errors
+    """
+
+    directory = es_bulk_dir(resource_fn)
+    if not os.path.exists(f"{directory}/manifest.json"):
+        log.warning("No Elasticsearch bulk chunks to load", resource_fn=resource_fn)
+        return 0
+
+    with open(f"{directory}/manifest.json", "r") as f:
+        manifest = json.load(f)
+
+    create_index(es_url, manifest["index"])
+
+    errors = 0
+    for chunk in manifest["chunks"]:
+        with open(f"{directory}/{chunk['filename']}", "rb") as f:
+            r = requests.post(
+                f"{es_url.rstrip('/')}/_bulk",
+                data=f,
+                headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+            )
+        r.raise_for_status()
+
+        result = r.json()
+        if result.get("errors"):
+            errors += sum([1 for item in result["items"] if item["index"].get("error")])
+
+    log.info(
+        "Loaded Elasticsearch bulk chunks",
+        resource_fn=resource_fn,
+        documents=manifest["documents"],
+        errors=errors,
+    )
+
+    return errors
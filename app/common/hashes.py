@@ -0,0 +1,177 @@
+"""Per-record content hashes and a whole-file Merkle digest for resource files
+
+Each record gets the 64 bit hash of its canonical serialization (sorted keys,
+lists in canonical order, without the hash itself) as a hex string:
+
+    {"term": {"key": "EG:207", ...}, "hash": "5c1b0e6f2d8a9e41"}
+
+The metadata header gets the root of a binary Merkle tree over the record hashes
+in file order, so a published file can be verified and two files compared with
+a single digest:
+
+    {"metadata": {..., "content_digest": {"algorithm": "blake2b-merkle", "root": "...", ...}}}
+
+The tree is built as records are streamed with a stack of subtree roots so memory
+is O(log n). Odd subtrees are combined right to left at the end (as RFC 6962).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import List, Tuple
+
+import structlog
+
+from app.common.compressed_io import codec_for_filename, open_compressed
+from app.common.diff import normalized
+
+log = structlog.getLogger(__name__)
+
+digest_algorithm = "blake2b-merkle"
+
+
+def record_hash(record: dict) -> str:
+    """Hex 64 bit hash of the canonical serialization of record - excluding its hash"""
+
+    record = {key: value for key, value in record.items() if key != "hash"}
+    canonical = json.dumps(normalized(record), sort_keys=True, separators=(",", ":"))
+
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class MerkleDigest(object):
+    """Streaming binary Merkle tree root over record hashes"""
+
+    def __init__(self):
+
+        self.stack: List[Tuple[int, bytes]] = []
+        self.count = 0
+
+    @staticmethod
+    def _node(left: bytes, right: bytes) -> bytes:
+        return hashlib.blake2b(b"\x01" + left + right, digest_size=32).digest()
+
+    def add(self, hex_hash: str):
+
+        node = hashlib.blake2b(b"\x00" + bytes.fromhex(hex_hash), digest_size=32).digest()
+        level = 0
+        while self.stack and self.stack[-1][0] == level:
+            node = self._node(self.stack.pop()[1], node)
+            level += 1
+
+        self.stack.append((level, node))
+        self.count += 1
+
+    def root(self) -> str:
+
+        if not self.stack:
+            return hashlib.blake2b(b"", digest_size=32).hexdigest()
+
+        node = self.stack[-1][1]
+        for (_, left) in reversed(self.stack[:-1]):
+            node = self._node(left, node)
+
+        return node.hex()
+
+
+def embed_hashes(resource_fn: str) -> dict:
+    """Rewrite resource file in place with per-record hashes and the Merkle digest
+
+    The records are written to a temporary body file first, then the metadata
+    header with the digest is written as its own gzip member (zstd frame) and the
+    compressed body is appended - so the records are only compressed once.
+
+    Returns:
+        dict: content digest
+    """
+
+    codec = codec_for_filename(resource_fn)
+    body_fn = f"{resource_fn}.body.tmp"
+    tmp_fn = f"{resource_fn}.tmp"
+
+    metadata = None
+    digest = MerkleDigest()
+
+    with open_compressed(resource_fn, "rt") as fi, open_compressed(
+        body_fn, "wt", codec=codec
+    ) as fo:
+        for line in fi:
+            record = json.loads(line)
+            if "metadata" in record:
+                metadata = record["metadata"]
+                continue
+
+            record["hash"] = record_hash(record)
+            digest.add(record["hash"])
+            fo.write(json.dumps(record) + "\n")
+
+    content_digest = {
+        "algorithm": digest_algorithm,
+        "records": digest.count,
+        "root": digest.root(),
+    }
+
+    with open_compressed(tmp_fn, "wt", codec=codec) as fo:
+        if metadata is not None:
+            metadata["content_digest"] = content_digest
+            fo.write(json.dumps({"metadata": metadata}) + "\n")
+
+    with open(tmp_fn, "ab") as fo, open(body_fn, "rb") as fi:
+        shutil.copyfileobj(fi, fo)
+
+    os.remove(body_fn)
+    os.replace(tmp_fn, resource_fn)
+
+    log.info("Embedded record hashes", resource_fn=resource_fn, **content_digest)
+
+    return content_digest
+
+
+def verify_hashes(resource_fn: str) -> dict:
+    """Verify the record hashes and Merkle digest of resource file
+
+    Returns:
+        dict: records, mismatched record keys (up to 10), digest and whether the file is valid
+    """
+
+    header_digest = None
+    digest = MerkleDigest()
+    mismatched = 0
+    samples = []
+
+    with open_compressed(resource_fn, "rt") as fi:
+        for line in fi:
+            record = json.loads(line)
+            if "metadata" in record:
+                header_digest = record["metadata"].get("content_digest")
+                continue
+
+            expected = record_hash(record)
+            if record.get("hash") != expected:
+                mismatched += 1
+                if len(samples) < 10:
+                    value = record.get("term") or record.get("ortholog") or {}
+                    samples.append(value.get("key") or value.get("subject_key"))
+            digest.add(expected)
+
+    root = digest.root()
+    result = {
+        "resource_fn": resource_fn,
+        "records": digest.count,
+        "mismatched": mismatched,
+        "samples": samples,
+        "root": root,
+        "digest_checked": header_digest is not None,
+        "valid": mismatched == 0,
+    }
+
+    # Resource files without a metadata header, e.g. backbone nanopubs, only have record hashes
+    if header_digest is not None:
+        result["valid"] = (
+            mismatched == 0
+            and header_digest.get("root") == root
+            and header_digest.get("records") == digest.count
+        )
+
+    return result
@@ -0,0 +1,293 @@
+import glob
+import heapq
+import itertools
+import os
+import re
+import struct
+import tempfile
+import zlib
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import structlog
+
+import app.settings as settings
+from app.common.collect_sources import file_newer
+from app.common.compressed_io import open_compressed, zstandard, zstd_magic
+
+log = structlog.getLogger(__name__)
+
+Row = Sequence[str]
+
+
+class JoinSource(NamedTuple):
+    """Keyed TSV source to join on
+
+    name: used to name the restartable sorted run file for this source
+    filename: source data file - used for size estimates and sorted run freshness
+    rows: callable returning an iterable of row tuples for this source
+    key_col: index of the join key in the row tuples
+    version: part of the sorted run file name - bump it when rows or key_col change
+        so the sorted runs of the previous row function are not reused
+    """
+
+    name: str
+    filename: str
+    rows: Callable[[], Iterable[Row]]
+    key_col: int = 0
+    version: str = "1"
+
+
+# Compressed bytes read to check that a compressed file is a single gzip member / zstd frame
+size_probe_bytes = 4 * 1024 * 1024
+
+
+def _single_member(filename: str, decompressor) -> bool:
+    """Check that the first gzip member/zstd frame is the whole file
+
+    Only the first size_probe_bytes are decompressed - a first member that is not
+    finished by then is assumed to be the only one (our own multi-member files
+    use smaller members, see compressed_io.default_block_size).
+    """
+
+    with open(filename, "rb") as f:
+        read = 0
+        while read < size_probe_bytes:
+            data = f.read(64 * 1024)
+            if not data:
+                return True
+            read += len(data)
+
+            decompressor.decompress(data)
+            if decompressor.eof:
+                return not decompressor.unused_data and not f.read(1)
+
+    return True
+
+
+def estimated_size(filename: str) -> Optional[int]:
+    """Estimate uncompressed size of source file - None if it is unknown
+
+    Plain files: the file size. Single member gzip: the ISIZE trailer (uncompressed
+    size mod 2**32). Single frame zstd: the frame content size. The trailers and
+    headers of multi-member gzip and multi-frame zstd files (e.g. written by
+    compressed_io with threads) only cover one member, so their size is unknown.
+    """
+
+    size = os.path.getsize(filename)
+
+    with open(filename, "rb") as f:
+        magic = f.read(4)
+
+        if magic[:2] == b"\x1f\x8b":
+            f.seek(-4, os.SEEK_END)
+            (isize,) = struct.unpack("<I", f.read(4))
+
+            # ISIZE smaller than the compressed size: over 4 GiB (ISIZE wrapped around)
+            if isize < size or not _single_member(filename, zlib.decompressobj(wbits=31)):
+                return None
+
+            return isize
+
+        elif magic == zstd_magic:
+            if zstandard is None:
+                return None
+
+            f.seek(0)
+            content_size = zstandard.get_frame_parameters(f.read(18)).content_size
+            if content_size == zstandard.CONTENTSIZE_UNKNOWN or not _single_member(
+                filename, zstandard.ZstdDecompressor().decompressobj()
+            ):
+                return None
+
+            return content_size
+
+    return size
+
+
+def external_sort(
+    rows: Iterable[Row],
+    key_col: int = 0,
+    memory_budget: int = settings.JOIN_MEMORY_BUDGET,
+    work_dir: str = None,
+) -> Iterator[Row]:
+    """Sort rows by key_col, spilling sorted runs to temporary files over the memory budget
+
+    Args:
+        rows: row tuples - fields must not contain tabs or newlines
+        key_col: index of the sort key in the row tuples
+        memory_budget: approximate number of bytes of row data to hold in memory
+        work_dir: directory for the temporary sorted runs
+
+    Returns:
+        Iterator[Row]: rows sorted by key_col
+    """
+
+    key_fn = itemgetter(key_col)
+
+    runs = []
+    chunk = []
+    chunk_size = 0
+
+    try:
+        for row in rows:
+            chunk.append(row)
+            chunk_size += sum(map(len, row)) + len(row)
+
+            if chunk_size >= memory_budget:
+                runs.append(_write_run(sorted(chunk, key=key_fn), work_dir))
+                chunk = []
+                chunk_size = 0
+
+        chunk.sort(key=key_fn)
+
+        if not runs:
+            yield from chunk
+            return
+
+        if chunk:
+            runs.append(_write_run(chunk, work_dir))
+            chunk = []
+
+        log.info("External sort", runs=len(runs))
+        yield from heapq.merge(*[_read_run(run_fn) for run_fn in runs], key=key_fn)
+
+    finally:
+        for run_fn in runs:
+            os.remove(run_fn)
+
+
+def _write_run(rows: List[Row], work_dir: str = None) -> str:
+    """Write sorted run to temporary file"""
+
+    (fd, run_fn) = tempfile.mkstemp(suffix=".tsv.gz", dir=work_dir)
+    os.close(fd)
+    with open_compressed(run_fn, "wt", compresslevel=1) as fo:
+        for row in rows:
+            fo.write("\t".join(row))
+            fo.write("\n")
+
+    return run_fn
+
+
+def _read_run(run_fn: str) -> Iterator[Row]:
+    """Read sorted run file"""
+
+    with open_compressed(run_fn, "rt") as fi:
+        for line in fi:
+            yield tuple(line[:-1].split("\t"))
+
+
+def sorted_source(
+    source: JoinSource, memory_budget: int = settings.JOIN_MEMORY_BUDGET, work_dir: str = None,
+) -> Iterator[Row]:
+    """Rows of source sorted by join key
+
+    The sorted rows are saved as a pipeline stage in work_dir and reused as long
+    as they are newer than the source file and were written by the same source
+    version (it is part of the file name).
+    """
+
+    if work_dir is None:
+        work_dir = settings.JOIN_WORK_DIR
+
+    os.makedirs(work_dir, exist_ok=True)
+
+    sorted_fn = f"{work_dir}/{source.name}.v{source.version}.sorted.tsv.gz"
+
+    if file_newer(sorted_fn, source.filename):
+        log.info("Reusing sorted join source", source=source.name, sorted_fn=sorted_fn)
+    else:
+        # Remove the sorted runs of previous source versions
+        stale_re = re.compile(rf"{re.escape(source.name)}(\.[^.]+)?\.sorted\.tsv\.gz")
+        for stale_fn in glob.glob(f"{glob.escape(work_dir)}/{glob.escape(source.name)}.*"):
+            if stale_fn != sorted_fn and stale_re.fullmatch(os.path.basename(stale_fn)):
+                os.remove(stale_fn)
+
+        tmp_fn = f"{sorted_fn}.tmp"
+        with open_compressed(tmp_fn, "wt", compresslevel=1) as fo:
+            for row in external_sort(
+                source.rows(), source.key_col, memory_budget=memory_budget, work_dir=work_dir
+            ):
+                fo.write("\t".join(row))
+                fo.write("\n")
+
+        os.replace(tmp_fn, sorted_fn)
+
+    return _read_run(sorted_fn)
+
+
+def cogroup(
+    sources: List[JoinSource],
+    memory_budget: int = settings.JOIN_MEMORY_BUDGET,
+    work_dir: str = None,
+) -> Iterator[Tuple[str, List[List[Row]]]]:
+    """Group rows of all sources by join key (full outer join)
+
+    Uses an in-memory hash join if the sources fit in the memory budget, otherwise
+    (or if the size of a source is unknown) a sort-merge join over externally
+    sorted (and restartable) source runs.
+
+    Both joins return the keys in sorted order and the rows of each source in
+    source order.
+
+    Args:
+        sources: keyed sources to join
+        memory_budget: approximate number of bytes of source data to hold in memory
+        work_dir: directory for sorted source runs
+
+    Returns:
+        Iterator[Tuple[str, List[List[Row]]]]: join key and list of matching rows per source
+    """
+
+    sizes = [estimated_size(source.filename) for source in sources]
+    total_size = None if None in sizes else sum(sizes)
+
+    if total_size is not None and total_size <= memory_budget:
+        log.info("Hash join", sources=[source.name for source in sources], size=total_size)
+        yield from _hash_cogroup(sources)
+    else:
+        log.info("Sort-merge join", sources=[source.name for source in sources], size=total_size)
+        yield from _merge_cogroup(sources, memory_budget, work_dir)
+
+
+def _hash_cogroup(sources: List[JoinSource]) -> Iterator[Tuple[str, List[List[Row]]]]:
+
+    groups = {}
+    for idx, source in enumerate(sources):
+        key_col = source.key_col
+        for row in source.rows():
+            key = row[key_col]
+            if key not in groups:
+                groups[key] = [[] for _ in sources]
+            groups[key][idx].append(row)
+
+    for key in sorted(groups):
+        yield key, groups[key]
+
+
+def _merge_cogroup(
+    sources: List[JoinSource], memory_budget: int, work_dir: str
+) -> Iterator[Tuple[str, List[List[Row]]]]:
+
+    streams = [
+        _tagged_rows(idx, source, sorted_source(source, memory_budget, work_dir))
+        for idx, source in enumerate(sources)
+    ]
+
+    merged = heapq.merge(*streams, key=itemgetter(0))
+    for key, tagged_rows in itertools.groupby(merged, key=itemgetter(0)):
+        group = [[] for _ in sources]
+        for (_, idx, row) in tagged_rows:
+            group[idx].append(row)
+
+        yield key, group
+
+
+def _tagged_rows(
+    idx: int, source: JoinSource, rows: Iterable[Row]
+) -> Iterator[Tuple[str, int, Row]]:
+
+    key_col = source.key_col
+    for row in rows:
+        yield (row[key_col], idx, row)
@@ -1,8 +1,11 @@
 import datetime
-import gzip
+import glob
 import json
+import os
+from typing import List
 
 import app.settings as settings
+from app.common.compressed_io import open_compressed
 from app.common.text import dt_now
 from app.schemas.main import Namespace, Term
 
@@ -43,10 +46,37 @@ def get_metadata(namespace_def, version: str = None) -> dict:
 def get_species_labels():
     """Get species labels with overrides from TAXONOMY_LABELS setting"""
 
-    species_labels_fn = f"{settings.DATA_DIR}/namespaces/tax_labels.json.gz"
-    with gzip.open(species_labels_fn, "r") as fi:
+    species_labels_fn = f"{settings.DATA_DIR}/namespaces/tax_labels.json.{settings.RESOURCE_EXT}"
+    with open_compressed(species_labels_fn, "r") as fi:
         species_labels = json.load(fi)
 
     species_labels.update(settings.TAXONOMY_LABELS)
 
     return species_labels
+
+
+def get_namespace_resource_fns(namespaces: List[str] = None) -> List[str]:
+    """Get full namespace resource files - species subset files are skipped
+
+    Args:
+        namespaces: namespace prefixes to include, e.g. ["EG", "HGNC"], defaults to all
+
+    Returns:
+        List[str]: namespace resource filenames
+    """
+
+    subset_suffixes = tuple([f"_{subset}" for subset in settings.SPECIES_SUBSETS or {}])
+
+    resource_fns = []
+    for resource_fn in sorted(
+        glob.glob(f"{settings.DATA_DIR}/namespaces/*.jsonl.{settings.RESOURCE_EXT}")
+    ):
+        name = os.path.basename(resource_fn).split(".")[0]
+        if subset_suffixes and name.endswith(subset_suffixes):
+            continue
+        if namespaces and name not in [namespace.lower() for namespace in namespaces]:
+            continue
+
+        resource_fns.append(resource_fn)
+
+    return resource_fns
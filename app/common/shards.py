@@ -0,0 +1,184 @@
+"""Sharded resource files for parallel downstream loading
+
+A resource file can additionally be written as N shard files, partitioned by
+record key hash (even shard sizes) or by species (all records of a species in
+one shard). Every shard repeats the metadata header so it is a valid resource
+file on its own. The manifest lists the shards with their record counts.
+
+Shards live in a directory next to the resource file so they are not picked up
+by the resource file globs:
+
+    namespaces/eg.jsonl.gz
+    namespaces/shards/eg/eg_000.jsonl.gz ... eg_015.jsonl.gz
+    namespaces/shards/eg/manifest.json
+"""
+
+import json
+import os
+import zlib
+from typing import List
+
+import structlog
+
+import app.settings as settings
+from app.common.arrays import finalize_dir, make_tmp_dir
+from app.common.blocked import line_record_key
+from app.common.compressed_io import codec_for_filename, open_compressed
+from app.common.subsets import line_species_keys
+
+log = structlog.getLogger(__name__)
+
+shard_by_options = ["key", "species"]
+
+
+def shard_dir(resource_fn: str) -> str:
+    """Shard directory of resource file, e.g. namespaces/eg.jsonl.gz -> namespaces/shards/eg"""
+
+    name = os.path.basename(resource_fn).split(".")[0]
+
+    return f"{os.path.dirname(resource_fn)}/shards/{name}"
+
+
+def shard_fns(resource_fn: str, count: int) -> List[str]:
+    """Shard filenames of resource file, e.g. eg_000.jsonl.gz ... eg_015.jsonl.gz"""
+
+    (name, ext) = os.path.basename(resource_fn).split(".", 1)
+
+    return [f"{shard_dir(resource_fn)}/{name}_{idx:03d}.{ext}" for idx in range(count)]
+
+
+def shard_manifest(resource_fn: str) -> dict:
+    """Shard manifest of resource file with absolute shard filenames"""
+
+    directory = shard_dir(resource_fn)
+    with open(f"{directory}/manifest.json", "r") as f:
+        manifest = json.load(f)
+
+    for shard in manifest["shards"]:
+        shard["filename"] = f"{directory}/{shard['filename']}"
+
+    return manifest
+
+
+class ShardWriter(object):
+    """Write the records of a resource file into shard files and the shard manifest
+
+    The shards are written into a temporary directory that replaces the shard
+    directory when closed.
+
+    Usage:
+        with ShardWriter(resource_fn, count=16, shard_by="key") as fo:
+            fo.write(metadata_line)  # repeated in every shard
+            fo.write(term_line)
+    """
+
+    def __init__(self, resource_fn: str, count: int = None, shard_by: str = None):
+
+        self.resource_fn = resource_fn
+        self.count = count or settings.RESOURCE_SHARDS
+        self.shard_by = shard_by or settings.RESOURCE_SHARD_BY
+
+        if self.count < 1:
+            raise ValueError(f"Invalid shard count: {self.count}")
+        if self.shard_by not in shard_by_options:
+            raise ValueError(f"Invalid shard_by: {self.shard_by} - options: {shard_by_options}")
+
+        self.records = [0] * self.count
+        self.species = [set() for _ in range(self.count)]
+        self.routes = {}
+
+    def __enter__(self):
+
+        self.tmp_dir = make_tmp_dir(shard_dir(self.resource_fn))
+        codec = codec_for_filename(self.resource_fn)
+        self.files = [
+            open_compressed(f"{self.tmp_dir}/{os.path.basename(filename)}", "wt", codec=codec)
+            for filename in shard_fns(self.resource_fn, self.count)
+        ]
+
+        return self
+
+    def _shard(self, line: str) -> int:
+
+        if self.shard_by == "species":
+            # Orthologs are sharded by subject species
+            species_keys = line_species_keys(line)
+            species_key = species_keys[0] if species_keys else ""
+
+            shard_idx = self.routes.get(species_key)
+            if shard_idx is None:
+                shard_idx = self.routes[species_key] = (
+                    zlib.crc32(species_key.encode("utf-8")) % self.count
+                )
+                if species_key:
+                    self.species[shard_idx].add(species_key)
+
+            return shard_idx
+
+        # Term key or ortholog subject key - records without a key are hashed as a whole
+        key = line_record_key(line) or line
+
+        return zlib.crc32(key.encode("utf-8")) % self.count
+
+    def write(self, line: str, record: dict = None):
+
+        if line.startswith('{"metadata"'):
+            for fo in self.files:
+                fo.write(line)
+            return
+
+        shard_idx = self._shard(line)
+        self.files[shard_idx].write(line)
+        self.records[shard_idx] += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        for fo in self.files:
+            fo.close()
+
+        if exc_type is not None:
+            return
+
+        manifest = {
+            "resource_fn": os.path.basename(self.resource_fn),
+            "shard_by": self.shard_by,
+            "records": sum(self.records),
+            "shards": [
+                {
+                    "filename": os.path.basename(filename),
+                    "records": self.records[idx],
+                    "species": sorted(self.species[idx]),
+                }
+                for idx, filename in enumerate(shard_fns(self.resource_fn, self.count))
+            ],
+        }
+        if self.shard_by == "key":
+            for shard in manifest["shards"]:
+                del shard["species"]
+
+        with open(f"{self.tmp_dir}/manifest.json", "w") as f:
+            json.dump(manifest, f, indent=4)
+
+        finalize_dir(self.tmp_dir, shard_dir(self.resource_fn))
+
+        log.info(
+            "Sharded resource file",
+            resource_fn=self.resource_fn,
+            shards=self.count,
+            shard_by=self.shard_by,
+            records=manifest["records"],
+        )
+
+
+def derive_shards(resource_fn: str, count: int = None, shard_by: str = None) -> dict:
+    """Write shard files of an existing resource file
+
+    Returns:
+        dict: shard manifest
+    """
+
+    with open_compressed(resource_fn, "rt") as fi, ShardWriter(resource_fn, count, shard_by) as fo:
+        for line in fi:
+            fo.write(line)
+
+    return shard_manifest(resource_fn)
@@ -0,0 +1,98 @@
+"""Memory-mappable table of strings addressed by integer index
+
+Strings are stored as concatenated UTF-8 bytes in {name}.bin with an int64 offsets
+array in {name}_offsets.npy (len(strings) + 1).
+"""
+
+import mmap
+import os
+from array import array
+from typing import Iterator, Union
+
+import numpy as np
+
+
+class StringTableWriter(object):
+    """Append strings to a string table
+
+    With extend=True the existing table in directory is continued - the indexes of
+    its strings are kept.
+
+    Usage:
+        with StringTableWriter(directory, "records") as table:
+            idx = table.append("string")
+    """
+
+    def __init__(self, directory: str, name: str, extend: bool = False):
+
+        self.data_fn = f"{directory}/{name}.bin"
+        self.offsets_fn = f"{directory}/{name}_offsets.npy"
+        self.extend = extend
+
+        self.offsets = array("q", [0])
+        if extend:
+            self.offsets = array("q", np.load(self.offsets_fn).astype(np.int64).tobytes())
+        self.size = self.offsets[-1]
+
+    def __enter__(self):
+
+        self.fo = open(self.data_fn, "ab" if self.extend else "wb")
+        if self.extend:
+            self.fo.truncate(self.size)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.fo.close()
+        np.save(self.offsets_fn, np.frombuffer(self.offsets, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def append(self, string: Union[str, bytes]) -> int:
+        """Append string and return its index"""
+
+        if isinstance(string, str):
+            string = string.encode("utf-8")
+
+        self.fo.write(string)
+        self.size += len(string)
+        self.offsets.append(self.size)
+
+        return len(self.offsets) - 2
+
+
+class StringTable(object):
+    """Read-only memory-mapped string table"""
+
+    def __init__(self, directory: str, name: str):
+
+        self.offsets = np.load(f"{directory}/{name}_offsets.npy", mmap_mode="r")
+
+        data_fn = f"{directory}/{name}.bin"
+        if os.path.getsize(data_fn):
+            with open(data_fn, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        return self.get_bytes(idx).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def get_bytes(self, idx: int) -> bytes:
+        """Encoded string at idx"""
+
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("string table index out of range")
+
+        return self.data[int(self.offsets[idx]) : int(self.offsets[idx + 1])]
@@ -0,0 +1,273 @@
+"""Species subset resource files written in the same pass as the full resource file"""
+
+import json
+import os
+import re
+import sys
+from contextlib import ExitStack
+from typing import Dict, FrozenSet, List, Mapping, Sequence
+
+import structlog
+
+import app.settings as settings
+from app.common.compressed_io import codec_for_filename, open_compressed
+
+log = structlog.getLogger(__name__)
+
+
+def get_species_subsets(subsets: Mapping[str, Sequence[str]] = None) -> Dict[str, FrozenSet[str]]:
+    """Species subsets as frozensets of species keys
+
+    Args:
+        subsets: subset name -> species keys, defaults to settings.SPECIES_SUBSETS
+
+    Returns:
+        Dict[str, FrozenSet[str]]: subset name -> species keys, e.g. {"hmrz": {"TAX:9606", ...}}
+    """
+
+    if subsets is None:
+        subsets = settings.SPECIES_SUBSETS or {}
+
+    return {
+        name: frozenset([species if ":" in str(species) else f"TAX:{species}" for species in species_keys])
+        for name, species_keys in subsets.items()
+    }
+
+
+def subset_fn(resource_fn: str, subset: str) -> str:
+    """Subset filename for resource file, e.g. eg.jsonl.gz -> eg_hmrz.jsonl.gz"""
+
+    return re.sub(r"(\.jsonl?\.)", f"_{subset}\\1", resource_fn, count=1)
+
+
+def resource_sinks(resource_fn: str, terms: bool = False) -> list:
+    """SubsetWriter sinks of resource file enabled in settings
+
+    Shards are written for every resource file, Elasticsearch bulk chunks and the
+    Parquet dataset only for namespace term files (terms=True).
+    """
+
+    # Imported here as these modules import from this module
+    sinks = []
+    if settings.RESOURCE_SHARDS:
+        from app.common.shards import ShardWriter
+
+        sinks.append(ShardWriter(resource_fn))
+
+    if terms and settings.ES_BULK:
+        from app.common.es_bulk import BulkWriter
+
+        sinks.append(BulkWriter(resource_fn))
+
+    if terms and settings.PARQUET_EXPORT:
+        from app.common.columnar import TermParquetWriter
+
+        sinks.append(TermParquetWriter(resource_fn))
+
+    return sinks
+
+
+class SubsetWriter(object):
+    """Write a resource file and all of its species subset files in one pass
+
+    The subset files a species (or species pair) is routed to are computed once
+    per species using frozenset membership tests and cached, so each record
+    costs a single dict lookup.
+
+    Sinks are extra outputs of the full resource file (see resource_sinks) that are
+    written in the same pass. Callers that already have the parsed record can pass
+    it with the line so the sinks don't have to parse the line again.
+
+    Usage:
+        with SubsetWriter(resource_fn, sinks=resource_sinks(resource_fn, terms=True)) as fo:
+            fo.write_all(metadata_line)
+            fo.write(term_line, species_key, term_record)
+            fo.write_pair(ortholog_line, subject_species_key, object_species_key)
+    """
+
+    def __init__(
+        self, resource_fn: str, subsets: Mapping[str, Sequence[str]] = None, sinks: list = None
+    ):
+
+        self.resource_fn = resource_fn
+        self.subsets = get_species_subsets(subsets)
+        self.sinks = sinks or []
+
+        self.routes: Dict = {}
+        self.counts = {name: 0 for name in self.subsets}
+
+    def __enter__(self):
+
+        self.fo = open_compressed(self.resource_fn, "wt")
+        self.subset_files = {
+            name: open_compressed(subset_fn(self.resource_fn, name), "wt") for name in self.subsets
+        }
+
+        # Sinks already entered are exited (discarding their output) if a later one fails
+        self.sink_stack = ExitStack()
+        try:
+            for sink in self.sinks:
+                self.sink_stack.enter_context(sink)
+        except BaseException:
+            self.sink_stack.__exit__(*sys.exc_info())
+            self.fo.close()
+            for fo in self.subset_files.values():
+                fo.close()
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.fo.close()
+        for fo in self.subset_files.values():
+            fo.close()
+
+        self.sink_stack.__exit__(exc_type, exc_value, traceback)
+
+        log.info("Species subsets", resource_fn=self.resource_fn, counts=self.counts)
+
+    def _route(self, *species_keys: str) -> List[str]:
+
+        route = self.routes.get(species_keys)
+        if route is None:
+            route = self.routes[species_keys] = [
+                name
+                for name, species_set in self.subsets.items()
+                if all(species_key in species_set for species_key in species_keys)
+            ]
+
+        return route
+
+    def write_all(self, line: str):
+        """Write line to the resource file and all subset files, e.g. the metadata header"""
+
+        self.fo.write(line)
+        for sink in self.sinks:
+            sink.write(line)
+        for fo in self.subset_files.values():
+            fo.write(line)
+
+    def write(self, line: str, species_key: str = None, record: dict = None):
+        """Write line to the resource file and the subset files containing species_key"""
+
+        self.fo.write(line)
+        for sink in self.sinks:
+            sink.write(line, record)
+
+        if species_key is None:
+            return
+
+        for name in self._route(species_key):
+            self.subset_files[name].write(line)
+            self.counts[name] += 1
+
+    def write_pair(self, line: str, subject_species_key: str, object_species_key: str):
+        """Write line to the resource file and the subset files containing both species"""
+
+        self.fo.write(line)
+        for sink in self.sinks:
+            sink.write(line)
+
+        for name in self._route(subject_species_key, object_species_key):
+            self.subset_files[name].write(line)
+            self.counts[name] += 1
+
+
+# Species keys of terms, orthologs (subject and object) and backbone nanopub annotations
+#   as serialized by json.dumps() - escaped quotes inside other values can't match
+species_key_re = re.compile(
+    r'"(?:species_key|subject_species_key|object_species_key)": "([^"]*)"'
+    r'|"type": "Species", "id": "([^"]*)"'
+)
+
+
+def line_species_keys(line: str) -> tuple:
+    """Species keys of a serialized resource record
+
+    Uses a regex pre-check on the serialized line and only falls back to json.loads()
+    if no species key is found, e.g. for the metadata header
+    """
+
+    species_keys = tuple(
+        [match.group(1) or match.group(2) for match in species_key_re.finditer(line)]
+    )
+    if species_keys:
+        return species_keys
+
+    record = json.loads(line)
+    if "term" in record:
+        return (record["term"].get("species_key") or "",)
+    elif "ortholog" in record:
+        return (
+            record["ortholog"]["subject_species_key"],
+            record["ortholog"]["object_species_key"],
+        )
+
+    return ()
+
+
+def derive_subsets(resource_fn: str, subsets: Mapping[str, Sequence[str]] = None) -> Dict[str, int]:
+    """Write species subset files from an existing full resource file
+
+    All subsets are written in a single pass over the resource file. Records are routed
+    on their serialized species keys without parsing them.
+
+    Args:
+        resource_fn: full resource file, e.g. namespaces/eg.jsonl.gz
+        subsets: subset name -> species keys, defaults to settings.SPECIES_SUBSETS
+
+    Returns:
+        Dict[str, int]: number of records per subset
+    """
+
+    subsets = get_species_subsets(subsets)
+    routes = {}
+    counts = {name: 0 for name in subsets}
+
+    subset_files = {}
+    complete = False
+    try:
+        for name in subsets:
+            subset_files[name] = open_compressed(
+                subset_fn(resource_fn, name) + ".tmp", "wt", codec=codec_for_filename(resource_fn)
+            )
+
+        with open_compressed(resource_fn, "rt") as fi:
+            for line in fi:
+                if line.startswith('{"metadata"'):
+                    for fo in subset_files.values():
+                        fo.write(line)
+                    continue
+
+                species_keys = line_species_keys(line)
+                route = routes.get(species_keys)
+                if route is None:
+                    route = routes[species_keys] = [
+                        name
+                        for name, species_set in subsets.items()
+                        if species_keys
+                        and all(species_key in species_set for species_key in species_keys)
+                    ]
+
+                for name in route:
+                    subset_files[name].write(line)
+                    counts[name] += 1
+
+        complete = True
+    finally:
+        for fo in subset_files.values():
+            fo.close()
+
+        # Don't leave partial subset files behind on errors
+        if not complete:
+            for name in subset_files:
+                if os.path.exists(subset_fn(resource_fn, name) + ".tmp"):
+                    os.remove(subset_fn(resource_fn, name) + ".tmp")
+
+    for name in subsets:
+        os.replace(subset_fn(resource_fn, name) + ".tmp", subset_fn(resource_fn, name))
+
+    log.info("Derived species subsets", resource_fn=resource_fn, counts=counts)
+
+    return counts
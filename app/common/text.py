@@ -36,3 +36,9 @@ def dt_now() -> str:
     """Now as datetime string, e.g. 2020-06-15T14:30:37"""
 
     return datetime.datetime.now().replace(microsecond=0).isoformat()
+
+
+def fold_text(string: str) -> str:
+    """Case fold and normalize whitespace for matching, e.g. ' Tumor  Necrosis' -> 'tumor necrosis'"""
+
+    return " ".join(string.casefold().split())
@@ -0,0 +1,83 @@
+from operator import itemgetter
+from typing import Iterator, Sequence, Tuple
+
+import structlog
+
+from app.common.compressed_io import open_compressed
+
+log = structlog.getLogger(__name__)
+
+default_block_size = 16 * 1024 * 1024
+
+
+def read_tsv(
+    filename: str,
+    columns: Sequence[int],
+    header_lines: int = 0,
+    skip_prefixes: Sequence[str] = (),
+    block_size: int = default_block_size,
+) -> Iterator[Tuple[str, ...]]:
+    """Read selected columns from a (gzipped) tab-separated file
+
+    Reads large decompressed blocks and only splits each line up to the highest
+    requested column. Rows with fewer columns than requested are skipped.
+
+    Args:
+        filename: gzipped TSV file
+        columns: column indexes to return, in the order returned
+        header_lines: number of leading lines to skip
+        skip_prefixes: skip lines starting with any of these prefixes, e.g. comments or repeated headers
+        block_size: number of characters to read per block
+
+    Returns:
+        Iterator[Tuple[str, ...]]: tuple of the selected column values for each row
+    """
+
+    maxsplit = max(columns) + 1
+    min_cols = maxsplit
+    if len(columns) > 1:
+        getter = itemgetter(*columns)
+    else:
+        column = columns[0]
+        getter = lambda cols: (cols[column],)  # noqa: E731
+
+    skip_prefixes = tuple(skip_prefixes)
+    short_rows = 0
+
+    with open_compressed(filename, "rt") as fi:
+
+        remainder = ""
+        while True:
+            block = fi.read(block_size)
+            if not block:
+                break
+
+            lines = (remainder + block).split("\n")
+            remainder = lines.pop()
+
+            if header_lines:
+                skipped = min(header_lines, len(lines))
+                del lines[:skipped]
+                header_lines -= skipped
+
+            for line in lines:
+                if skip_prefixes and line.startswith(skip_prefixes):
+                    continue
+
+                cols = line.split("\t", maxsplit)
+                if len(cols) < min_cols:
+                    if line:
+                        short_rows += 1
+                    continue
+
+                yield getter(cols)
+
+        if remainder and not header_lines and not (skip_prefixes and remainder.startswith(skip_prefixes)):
+            cols = remainder.split("\t", maxsplit)
+            if len(cols) < min_cols:
+                short_rows += 1
+            else:
+                yield getter(cols)
+
+    if short_rows:
+        log.warning("Skipped short rows", filename=filename, short_rows=short_rows)
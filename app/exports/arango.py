@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  arango.py [--namespace EG --namespace HGNC ...] [--chunk-records 1000000] [--workers 4]
+
+Export namespace and ortholog resource files as arangoimport-ready JSONL chunks
+
+Node documents (collection terms) are the terms without their relationship
+lists, which become edge documents:
+
+    equivalence_edges: term <-> equivalence_keys (undirected)
+    parent_edges: term -> parent_keys and child_keys -> term
+    ortholog_edges: ortholog subject <-> object (undirected)
+    obsolete_edges: obsolete_keys -> term (redirect)
+
+Document _keys are deterministic - term keys with characters not allowed in
+ArangoDB keys percent-encoded, edge _keys the hash of the edge type and its
+endpoints (sorted for undirected edges). Every namespace file is processed in
+parallel, then the edges of all files are deduplicated with an external sort.
+
+Export directory files ({DATA_DIR}/exports/arango):
+
+    terms/terms_eg_000.jsonl.gz ...
+    equivalence_edges/equivalence_edges_000.jsonl.gz ...
+    manifest.json: collections, collection types, files and arangoimport commands
+"""
+
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+from functools import partial
+from typing import Dict, Iterator, List, Tuple
+
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.arrays import finalize_dir, make_tmp_dir
+from app.common.compressed_io import open_compressed
+from app.common.joins import external_sort
+from app.common.resources import get_namespace_resource_fns
+
+log = structlog.getLogger(__name__)
+
+export_dir = f"{settings.DATA_DIR}/exports/arango"
+
+node_collection = "terms"
+
+# Edge collection: (term field, direction, undirected)
+#   direction "out": term -> field key, "in": field key -> term
+edge_definitions = {
+    "equivalence_edges": [("equivalence_keys", "out", True)],
+    "parent_edges": [("parent_keys", "out", False), ("child_keys", "in", False)],
+    "obsolete_edges": [("obsolete_keys", "in", False)],
+    "ortholog_edges": [],
+}
+
+# Term fields exported as edges instead of node properties
+edge_fields = ["equivalence_keys", "parent_keys", "child_keys", "obsolete_keys"]
+
+default_chunk_records = 1000000
+
+# Characters allowed in ArangoDB document keys other than letters and digits
+key_disallowed_re = re.compile(r"[^A-Za-z0-9_\-:.@()+,=;$!*']")
+max_key_length = 254
+
+
+def arango_key(key: str) -> str:
+    """Deterministic ArangoDB _key of term key
+
+    Disallowed characters are percent-encoded (as UTF-8), keys that are still too long
+    are truncated with a hash suffix.
+    """
+
+    encoded = key_disallowed_re.sub(
+        lambda match: "".join([f"%{byte:02X}" for byte in match.group(0).encode("utf-8")]), key
+    )
+    if len(encoded) > max_key_length:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+        encoded = f"{encoded[: max_key_length - 17]}_{digest}"
+
+    return encoded
+
+
+def edge_document(collection: str, from_key: str, to_key: str, undirected: bool) -> dict:
+    """Edge document with deterministic _key - undirected endpoints in sorted order"""
+
+    if undirected and to_key < from_key:
+        (from_key, to_key) = (to_key, from_key)
+
+    edge_key = hashlib.blake2b(
+        f"{collection}\t{from_key}\t{to_key}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+    return {
+        "_key": edge_key,
+        "_from": f"{node_collection}/{arango_key(from_key)}",
+        "_to": f"{node_collection}/{arango_key(to_key)}",
+        "from_key": from_key,
+        "to_key": to_key,
+    }
+
+
+class ChunkWriter(object):
+    """Write documents into numbered JSONL chunk files of at most chunk_records documents"""
+
+    def __init__(self, directory: str, prefix: str, chunk_records: int = default_chunk_records):
+
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk_records = chunk_records
+
+        self.filenames = []
+        self.records = 0
+        self.fo = None
+
+    def write(self, line: str):
+
+        if self.records % self.chunk_records == 0:
+            if self.fo is not None:
+                self.fo.close()
+            filename = f"{self.directory}/{self.prefix}_{len(self.filenames):03d}.jsonl.gz"
+            self.fo = open_compressed(filename, "wt", codec="gzip")
+            self.filenames.append(filename)
+
+        self.fo.write(line)
+        self.records += 1
+
+    def close(self):
+        if self.fo is not None:
+            self.fo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def resource_edges(record: dict) -> Iterator[Tuple[str, dict]]:
+    """(edge collection, edge document) of term or ortholog record"""
+
+    if "ortholog" in record:
+        ortholog = record["ortholog"]
+        yield (
+            "ortholog_edges",
+            edge_document("ortholog_edges", ortholog["subject_key"], ortholog["object_key"], True),
+        )
+        return
+
+    term = record["term"]
+    for collection, definitions in edge_definitions.items():
+        for (field, direction, undirected) in definitions:
+            for other_key in term.get(field) or []:
+                if other_key == term["key"]:
+                    continue
+                if direction == "out":
+                    edge = edge_document(collection, term["key"], other_key, undirected)
+                else:
+                    edge = edge_document(collection, other_key, term["key"], undirected)
+                yield (collection, edge)
+
+
+def export_resource(resource_fn: str, work_dir: str, chunk_records: int) -> dict:
+    """Write node chunks and unsorted edge files of one resource file - runs in a worker
+
+    Returns:
+        dict: node files and counts, edge files and counts per edge collection
+    """
+
+    name = os.path.basename(resource_fn).split(".")[0]
+    node_dir = f"{work_dir}/{node_collection}"
+    os.makedirs(node_dir, exist_ok=True)
+
+    edge_files = {}
+    edge_counts = {}
+    nodes = ChunkWriter(node_dir, f"{node_collection}_{name}", chunk_records)
+
+    try:
+        with open_compressed(resource_fn, "rt") as fi:
+            for line in fi:
+                record = json.loads(line)
+                if "term" in record:
+                    term = record["term"]
+                    node = {"_key": arango_key(term["key"])}
+                    node.update(
+                        {field: value for field, value in term.items() if field not in edge_fields}
+                    )
+                    nodes.write(json.dumps(node) + "\n")
+                elif "ortholog" not in record:
+                    continue
+
+                for collection, edge in resource_edges(record):
+                    if collection not in edge_files:
+                        edge_files[collection] = open_compressed(
+                            f"{work_dir}/{collection}.{name}.tsv.gz", "wt", compresslevel=1
+                        )
+                        edge_counts[collection] = 0
+                    edge_files[collection].write(f"{edge['_key']}\t{json.dumps(edge)}\n")
+                    edge_counts[collection] += 1
+    finally:
+        nodes.close()
+        for fo in edge_files.values():
+            fo.close()
+
+    log.info(
+        "Exported resource file", resource_fn=resource_fn, nodes=nodes.records, edges=edge_counts
+    )
+
+    return {
+        "node_files": nodes.filenames,
+        "nodes": nodes.records,
+        "edge_files": {collection: fo.name for collection, fo in edge_files.items()},
+    }
+
+
+def edge_rows(edge_fns: List[str]) -> Iterator[Tuple[str, str]]:
+    """(edge _key, edge line) rows of unsorted edge files"""
+
+    for edge_fn in edge_fns:
+        with open_compressed(edge_fn, "rt") as fi:
+            for line in fi:
+                yield tuple(line.rstrip("\n").split("\t", 1))
+
+
+def dedupe_edges(
+    collection: str, edge_fns: List[str], collection_dir: str, chunk_records: int, work_dir: str
+) -> Tuple[List[str], int]:
+    """Write the unique edges of the edge files sorted by _key into chunk files
+
+    Returns:
+        Tuple[List[str], int]: chunk files and number of unique edges
+    """
+
+    os.makedirs(collection_dir, exist_ok=True)
+
+    previous = None
+    with ChunkWriter(collection_dir, collection, chunk_records) as fo:
+        for (edge_key, line) in external_sort(edge_rows(edge_fns), 0, work_dir=work_dir):
+            if edge_key == previous:
+                continue
+            previous = edge_key
+            fo.write(line + "\n")
+
+    return (fo.filenames, fo.records)
+
+
+def export_arango(
+    namespaces: List[str] = None,
+    chunk_records: int = default_chunk_records,
+    workers: int = None,
+    export_dir: str = export_dir,
+) -> dict:
+    """Export namespace and ortholog resource files for arangoimport
+
+    Args:
+        namespaces: namespace prefixes to export, defaults to all namespace resource files
+        chunk_records: maximum number of documents per chunk file
+        workers: number of resource files to process in parallel
+        export_dir: export directory
+
+    Returns:
+        dict: manifest
+    """
+
+    resource_fns = get_namespace_resource_fns(namespaces)
+    if not namespaces:
+        resource_fns.extend(
+            [
+                ortholog_fn
+                for ortholog_fn in sorted(
+                    glob.glob(f"{settings.DATA_DIR}/orthologs/*.jsonl.{settings.RESOURCE_EXT}")
+                )
+                # skip species subset and partition files, e.g. eg_hmrz, eg_human_mouse
+                if "_" not in os.path.basename(ortholog_fn).split(".")[0]
+            ]
+        )
+
+    if workers is None:
+        workers = min(len(resource_fns), os.cpu_count() or 1) or 1
+
+    tmp_dir = make_tmp_dir(export_dir)
+    work_dir = f"{tmp_dir}/work"
+    os.makedirs(work_dir)
+
+    export = partial(export_resource, work_dir=work_dir, chunk_records=chunk_records)
+    if workers <= 1:
+        results = [export(resource_fn) for resource_fn in resource_fns]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(export, resource_fns)
+
+    node_files = sorted([filename for result in results for filename in result["node_files"]])
+    collections: Dict[str, dict] = {
+        node_collection: {
+            "type": "document",
+            "files": [os.path.relpath(filename, work_dir) for filename in node_files],
+            "documents": sum([result["nodes"] for result in results]),
+        }
+    }
+    shutil.move(f"{work_dir}/{node_collection}", f"{tmp_dir}/{node_collection}")
+
+    for collection in edge_definitions:
+        edge_fns = [
+            result["edge_files"][collection]
+            for result in results
+            if collection in result["edge_files"]
+        ]
+        if not edge_fns:
+            continue
+
+        (chunk_fns, count) = dedupe_edges(
+            collection, edge_fns, f"{tmp_dir}/{collection}", chunk_records, work_dir
+        )
+        collections[collection] = {
+            "type": "edge",
+            "files": [os.path.relpath(filename, tmp_dir) for filename in chunk_fns],
+            "documents": count,
+        }
+
+    shutil.rmtree(work_dir)
+
+    manifest = {
+        "resource_fns": [os.path.basename(resource_fn) for resource_fn in resource_fns],
+        "collections": collections,
+        "commands": [
+            f"arangoimport --server.database belns --collection {collection} "
+            f"--create-collection true --create-collection-type {info['type']} "
+            f"--type jsonl --on-duplicate replace --file {filename}"
+            for collection, info in collections.items()
+            for filename in info["files"]
+        ],
+    }
+    with open(f"{tmp_dir}/manifest.json", "w") as f:
+        json.dump(manifest, f, indent=4)
+
+    finalize_dir(tmp_dir, export_dir)
+
+    log.info(
+        "Exported ArangoDB import files",
+        export_dir=export_dir,
+        documents={collection: info["documents"] for collection, info in collections.items()},
+    )
+
+    return manifest
+
+
+def main(
+    namespaces: List[str] = Option(
+        None, "--namespace", help="Namespaces to export - defaults to all namespaces and orthologs"
+    ),
+    chunk_records: int = Option(default_chunk_records, help="Maximum documents per chunk file"),
+    workers: int = Option(None, help="Number of resource files to process in parallel"),
+):
+
+    export_arango(namespaces, chunk_records=chunk_records, workers=workers)
+
+
+if __name__ == "__main__":
+    typer.run(main)
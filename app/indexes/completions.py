@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  completions.py [--namespace EG --namespace HGNC ...] [--levels 3]
+
+Build the prefix autocomplete index over term labels, names and synonyms
+
+Entries (one per term label, name and synonym) are case folded and sorted so the
+entries matching a prefix are a contiguous range found by binary search. For
+prefixes up to --levels characters, rank ordered permutations of each prefix
+bucket are precomputed so top-k queries for short prefixes only read the first
+few ranked entries of the bucket.
+
+Entries are ranked by match type (label, name, synonym), then by length, then
+alphabetically.
+
+Index directory files:
+
+    folded.bin, folded_offsets.npy: sorted case folded entry strings (string table)
+    strings.bin, strings_offsets.npy: original entry strings (string table)
+    terms.bin, terms_offsets.npy: compact JSON term records (string table)
+    entry_terms.npy: term record index per entry
+    entry_matches.npy: match type per entry - 0: label, 1: name, 2: synonym
+    entry_lengths.npy: folded string length per entry
+    entry_namespaces.npy: namespace code per entry (index into metadata namespaces)
+    entry_taxids.npy: species taxid per entry (0 if none)
+    entry_entity_types.npy: entity types bitmask per entry (bits in metadata entity_types order)
+    rank_order_{level}.npy: entry positions sorted by (folded[:level], rank)
+    metadata.json: namespaces, entity_types, levels and counts
+"""
+
+import bisect
+import json
+import os
+from array import array
+from typing import List, Sequence
+
+import numpy as np
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.arrays import finalize_dir, load_arrays, make_tmp_dir, write_arrays
+from app.common.compressed_io import open_compressed
+from app.common.joins import external_sort
+from app.common.resources import get_namespace_resource_fns
+from app.common.string_table import StringTable, StringTableWriter
+from app.common.text import fold_text
+from app.schemas.main import EntityTypesEnum
+
+log = structlog.getLogger(__name__)
+
+index_dir = f"{settings.DATA_DIR}/indexes/completions"
+
+match_types = ["label", "name", "synonym"]
+entity_types = [entity_type.value for entity_type in EntityTypesEnum]
+
+default_levels = 3
+
+# Ranges up to this size are ranked directly instead of scanning a rank ordered prefix bucket
+direct_rank_max = 2048
+
+entry_arrays = [
+    "entry_terms",
+    "entry_matches",
+    "entry_lengths",
+    "entry_namespaces",
+    "entry_taxids",
+    "entry_entity_types",
+]
+
+
+def species_taxid(species_key: str) -> int:
+    """Taxid of species key, e.g. TAX:9606 -> 9606, 0 if missing"""
+
+    if species_key and species_key.startswith("TAX:"):
+        try:
+            return int(species_key[4:])
+        except ValueError:
+            pass
+
+    return 0
+
+
+def entity_types_mask(types: Sequence[str]) -> int:
+    """Entity types bitmask"""
+
+    mask = 0
+    for entity_type in types or []:
+        if entity_type in entity_types:
+            mask |= 1 << entity_types.index(entity_type)
+
+    return mask
+
+
+def term_entries(term: dict):
+    """Entry (folded, original, match type) tuples of term - unique per folded string"""
+
+    seen = set()
+    values = [(term.get("label"), 0), (term.get("name"), 1)]
+    values.extend([(synonym, 2) for synonym in term.get("synonyms") or []])
+
+    for (value, match_type) in values:
+        if not value:
+            continue
+
+        folded = fold_text(value)
+        if not folded or folded in seen:
+            continue
+        seen.add(folded)
+
+        yield (folded, " ".join(value.split()), match_type)
+
+
+def build_index(
+    namespaces: List[str] = None, levels: int = default_levels, index_dir: str = index_dir
+):
+    """Build completion index from namespace resource files
+
+    Args:
+        namespaces: namespace prefixes to index, defaults to all namespace resource files
+        levels: number of prefix lengths with precomputed rank ordered buckets
+        index_dir: index directory
+    """
+
+    tmp_dir = make_tmp_dir(index_dir)
+    resource_fns = get_namespace_resource_fns(namespaces)
+    namespace_codes = {}
+
+    os.makedirs(settings.JOIN_WORK_DIR, exist_ok=True)
+
+    def entry_rows(terms_table):
+        for resource_fn in resource_fns:
+            log.info("Collecting completions", resource_fn=resource_fn)
+
+            with open_compressed(resource_fn, "rt") as fi:
+                for line in fi:
+                    term = json.loads(line).get("term")
+                    if term is None:
+                        continue
+
+                    term_id = terms_table.append(
+                        json.dumps(
+                            {
+                                "key": term["key"],
+                                "namespace": term["namespace"],
+                                "label": term.get("label", ""),
+                                "species_key": term.get("species_key", ""),
+                                "entity_types": term.get("entity_types") or [],
+                            },
+                            separators=(",", ":"),
+                        )
+                    )
+
+                    namespace_code = namespace_codes.setdefault(
+                        term["namespace"], len(namespace_codes)
+                    )
+                    filters = (
+                        str(term_id),
+                        str(namespace_code),
+                        str(species_taxid(term.get("species_key"))),
+                        str(entity_types_mask(term.get("entity_types"))),
+                    )
+
+                    for (folded, original, match_type) in term_entries(term):
+                        yield (folded, original, str(match_type)) + filters
+
+    arrays = {name: array("q") for name in entry_arrays}
+    buckets = [array("q") for _ in range(levels)]
+    last_prefixes = [None] * levels
+
+    with StringTableWriter(tmp_dir, "terms") as terms_table, StringTableWriter(
+        tmp_dir, "folded"
+    ) as folded_table, StringTableWriter(tmp_dir, "strings") as strings_table:
+
+        for row in external_sort(
+            entry_rows(terms_table),
+            key_col=0,
+            memory_budget=settings.JOIN_MEMORY_BUDGET,
+            work_dir=settings.JOIN_WORK_DIR,
+        ):
+            (folded, original, match_type, term_id, namespace_code, taxid, mask) = row
+
+            folded_table.append(folded)
+            strings_table.append(original)
+
+            arrays["entry_terms"].append(int(term_id))
+            arrays["entry_matches"].append(int(match_type))
+            arrays["entry_lengths"].append(len(folded))
+            arrays["entry_namespaces"].append(int(namespace_code))
+            arrays["entry_taxids"].append(int(taxid))
+            arrays["entry_entity_types"].append(int(mask))
+
+            # Prefix bucket ids per level - increasing with sorted position
+            for level in range(levels):
+                prefix = folded[: level + 1]
+                if prefix != last_prefixes[level]:
+                    last_prefixes[level] = prefix
+                    bucket = (buckets[level][-1] + 1) if buckets[level] else 0
+                else:
+                    bucket = buckets[level][-1]
+                buckets[level].append(bucket)
+
+        entry_count = len(folded_table)
+        term_count = len(terms_table)
+
+    index_dtype = np.uint32 if entry_count < 2 ** 32 else np.int64
+    entry_dtypes = {
+        "entry_terms": np.uint32 if term_count < 2 ** 32 else np.int64,
+        "entry_matches": np.uint8,
+        "entry_lengths": np.uint16,
+        "entry_namespaces": np.uint16,
+        "entry_taxids": np.int64,
+        "entry_entity_types": np.uint32,
+    }
+    entry_data = {
+        name: np.minimum(np.frombuffer(values, dtype=np.int64), np.iinfo(entry_dtypes[name]).max)
+        .astype(entry_dtypes[name])
+        for name, values in arrays.items()
+    }
+
+    positions = np.arange(entry_count, dtype=np.int64)
+    for level in range(levels):
+        bucket_ids = np.frombuffer(buckets[level], dtype=np.int64)
+        rank_order = np.lexsort(
+            (positions, entry_data["entry_lengths"], entry_data["entry_matches"], bucket_ids)
+        )
+        entry_data[f"rank_order_{level + 1}"] = rank_order.astype(index_dtype)
+
+    metadata = {
+        "resource_fns": [os.path.basename(resource_fn) for resource_fn in resource_fns],
+        "namespaces": sorted(namespace_codes, key=namespace_codes.get),
+        "entity_types": entity_types,
+        "levels": levels,
+        "terms": term_count,
+        "entries": entry_count,
+    }
+
+    write_arrays(tmp_dir, entry_data, metadata)
+    finalize_dir(tmp_dir, index_dir)
+
+    log.info("Built completion index", index_dir=index_dir, terms=term_count, entries=entry_count)
+
+
+class CompletionIndex(object):
+    """Top-k prefix completion of term labels, names and synonyms
+
+    Usage:
+        index = CompletionIndex()
+        index.complete("akt", k=10, namespaces=["HGNC"], species=["TAX:9606"], entity_types=["Protein"])
+    """
+
+    def __init__(self, index_dir: str = index_dir):
+
+        with open(f"{index_dir}/metadata.json", "r") as f:
+            levels = json.load(f)["levels"]
+
+        names = entry_arrays + [f"rank_order_{level}" for level in range(1, levels + 1)]
+        (arrays, self.metadata) = load_arrays(index_dir, names)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+        self.levels = levels
+        self.rank_orders = {level: arrays[f"rank_order_{level}"] for level in range(1, levels + 1)}
+        self.namespace_codes = {
+            namespace: code for code, namespace in enumerate(self.metadata["namespaces"])
+        }
+
+        self.folded = StringTable(index_dir, "folded")
+        self.strings = StringTable(index_dir, "strings")
+        self.terms = StringTable(index_dir, "terms")
+
+    def prefix_range(self, folded_prefix: str) -> (int, int):
+        """Range of sorted entry positions starting with folded_prefix"""
+
+        lo = bisect.bisect_left(self.folded, folded_prefix)
+        hi = bisect.bisect_left(self.folded, folded_prefix + "\U0010ffff", lo)
+
+        return (lo, hi)
+
+    def _filter_mask(self, positions: np.ndarray, filters: dict) -> np.ndarray:
+
+        mask = np.ones(len(positions), dtype=bool)
+        if "namespaces" in filters:
+            mask &= np.isin(self.entry_namespaces[positions], filters["namespaces"])
+        if "taxids" in filters:
+            mask &= np.isin(self.entry_taxids[positions], filters["taxids"])
+        if "entity_types" in filters:
+            mask &= (self.entry_entity_types[positions] & filters["entity_types"]) != 0
+
+        return mask
+
+    def _ranked_candidates(self, folded_prefix: str, lo: int, hi: int):
+        """Chunks of entry positions matching the prefix in rank order"""
+
+        level = min(len(folded_prefix), self.levels)
+
+        if level == len(folded_prefix):
+            ranked, bounds = self.rank_orders[level], None
+            (start, end) = (lo, hi)
+        elif hi - lo <= direct_rank_max:
+            positions = np.arange(lo, hi, dtype=np.int64)
+            order = np.lexsort(
+                (positions, self.entry_lengths[lo:hi], self.entry_matches[lo:hi])
+            )
+            yield positions[order]
+            return
+        else:
+            # Scan the rank ordered bucket of the longest precomputed prefix
+            ranked, bounds = self.rank_orders[level], (lo, hi)
+            (start, end) = self.prefix_range(folded_prefix[:level])
+
+        chunk_size = 256
+        while start < end:
+            positions = ranked[start : min(start + chunk_size, end)].astype(np.int64)
+            start += len(positions)
+            chunk_size = min(chunk_size * 4, 65536)
+
+            if bounds is not None:
+                positions = positions[(positions >= bounds[0]) & (positions < bounds[1])]
+
+            yield positions
+
+    def complete(
+        self,
+        prefix: str,
+        k: int = 10,
+        namespaces: List[str] = None,
+        species: List[str] = None,
+        entity_types: List[str] = None,
+    ) -> List[dict]:
+        """Top-k terms with a label, name or synonym starting with prefix
+
+        Args:
+            prefix: prefix to complete - case insensitive
+            k: number of terms to return
+            namespaces: only terms in these namespaces, e.g. ["HGNC", "EG"]
+            species: only terms of these species, e.g. ["TAX:9606"]
+            entity_types: only terms with any of these entity types, e.g. ["Protein"]
+
+        Returns:
+            List[dict]: term records (key, namespace, label, species_key, entity_types)
+                with the matched string and match type (label, name, synonym)
+        """
+
+        folded_prefix = fold_text(prefix)
+        if not folded_prefix or k < 1:
+            return []
+
+        filters = {}
+        if namespaces:
+            filters["namespaces"] = [
+                self.namespace_codes[namespace]
+                for namespace in namespaces
+                if namespace in self.namespace_codes
+            ]
+        if species:
+            filters["taxids"] = [species_taxid(species_key) for species_key in species]
+        if entity_types:
+            filters["entity_types"] = entity_types_mask(entity_types)
+
+        (lo, hi) = self.prefix_range(folded_prefix)
+        if lo >= hi:
+            return []
+
+        results = []
+        seen_terms = set()
+        for positions in self._ranked_candidates(folded_prefix, lo, hi):
+            if filters:
+                positions = positions[self._filter_mask(positions, filters)]
+
+            for position in positions:
+                term_id = int(self.entry_terms[position])
+                if term_id in seen_terms:
+                    continue
+                seen_terms.add(term_id)
+
+                result = json.loads(self.terms[term_id])
+                result["matched"] = self.strings[int(position)]
+                result["match"] = match_types[self.entry_matches[position]]
+                results.append(result)
+
+                if len(results) >= k:
+                    return results
+
+        return results
+
+
+def main(
+    namespaces: List[str] = Option(
+        None, "--namespace", help="Namespaces to index - defaults to all namespace resource files"
+    ),
+    levels: int = Option(default_levels, help="Prefix lengths with precomputed ranked buckets"),
+):
+
+    build_index(namespaces, levels=levels)
+
+
+if __name__ == "__main__":
+    typer.run(main)
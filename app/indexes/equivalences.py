@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  equivalences.py [--namespace EG --namespace HGNC ...]
+
+Build equivalence clusters of all namespace term keys and their equivalence_keys
+
+Keys are interned as integers and merged with a union-find (union by size,
+path compression) so every key gets a cluster id - all keys denoting the
+same entity share the cluster id.
+
+Index directory files:
+
+    key_hashes.npy: sorted 64 bit key hashes (uint64)
+    cluster_ids.npy: cluster id per key hash (int64)
+    keys.bin, keys_offsets.npy: keys in key_hashes order (string table)
+    cluster_indptr.npy: offsets into cluster_members per cluster id (int64)
+    cluster_members.npy: key indexes grouped by cluster id (int64)
+    clusters.jsonl.gz: {"cluster_id": 1, "members": ["EG:207", "HGNC:391", ...]} per cluster of 2+ keys
+    metadata.json: namespaces and counts
+"""
+
+import json
+import os
+from array import array
+from typing import List, Optional, Union
+
+import numpy as np
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.arrays import finalize_dir, load_arrays, make_tmp_dir, write_arrays
+from app.common.compressed_io import open_compressed
+from app.common.resources import get_namespace_resource_fns
+from app.common.string_table import StringTable, StringTableWriter
+from app.indexes.keys import key_hash
+
+log = structlog.getLogger(__name__)
+
+index_dir = f"{settings.DATA_DIR}/indexes/equivalences"
+
+index_arrays = ["key_hashes", "cluster_ids", "cluster_indptr", "cluster_members"]
+
+
+class UnionFind(object):
+    """Integer encoded union-find of interned string keys"""
+
+    def __init__(self):
+
+        self.key_ids = {}
+        self.keys = []
+        self.parent = array("q")
+        self.size = array("q")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str) -> int:
+        """Intern key and return its integer id"""
+
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.parent.append(key_id)
+            self.size.append(1)
+
+        return key_id
+
+    def find(self, key_id: int) -> int:
+        """Root of key_id with path compression"""
+
+        parent = self.parent
+
+        root = key_id
+        while parent[root] != root:
+            root = parent[root]
+
+        while parent[key_id] != root:
+            (parent[key_id], key_id) = (root, parent[key_id])
+
+        return root
+
+    def union(self, key_id_1: int, key_id_2: int):
+        """Merge the sets of the two key ids - union by size"""
+
+        root_1 = self.find(key_id_1)
+        root_2 = self.find(key_id_2)
+        if root_1 == root_2:
+            return
+
+        if self.size[root_1] < self.size[root_2]:
+            (root_1, root_2) = (root_2, root_1)
+
+        self.parent[root_2] = root_1
+        self.size[root_1] += self.size[root_2]
+
+    def roots(self) -> np.ndarray:
+        """Root id per key id"""
+
+        return np.array([self.find(key_id) for key_id in range(len(self.keys))], dtype=np.int64)
+
+
+def build_index(namespaces: List[str] = None, index_dir: str = index_dir):
+    """Build equivalence clusters from namespace resource files
+
+    Args:
+        namespaces: namespace prefixes to include, defaults to all namespace resource files
+        index_dir: index directory
+    """
+
+    union_find = UnionFind()
+    resource_fns = get_namespace_resource_fns(namespaces)
+
+    for resource_fn in resource_fns:
+        log.info("Collecting equivalences", resource_fn=resource_fn)
+
+        with open_compressed(resource_fn, "rt") as fi:
+            for line in fi:
+                term = json.loads(line).get("term")
+                if term is None:
+                    continue
+
+                key_id = union_find.add(term["key"])
+                for equivalence_key in term.get("equivalence_keys") or []:
+                    union_find.union(key_id, union_find.add(equivalence_key))
+
+    # Cluster ids in sorted order of the root key ids (np.unique), not cluster first appearance
+    (_, cluster_ids) = np.unique(union_find.roots(), return_inverse=True)
+    cluster_ids = cluster_ids.astype(np.int64).reshape(-1)
+
+    key_hashes = np.array([key_hash(key) for key in union_find.keys], dtype=np.uint64)
+    order = np.argsort(key_hashes, kind="stable")
+    key_hashes = key_hashes[order]
+    cluster_ids = cluster_ids[order]
+
+    cluster_count = int(cluster_ids.max()) + 1 if len(cluster_ids) else 0
+    cluster_members = np.argsort(cluster_ids, kind="stable").astype(np.int64)
+    cluster_indptr = np.zeros(cluster_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cluster_ids, minlength=cluster_count), out=cluster_indptr[1:])
+
+    tmp_dir = make_tmp_dir(index_dir)
+
+    with StringTableWriter(tmp_dir, "keys") as keys_table:
+        for key_id in order:
+            keys_table.append(union_find.keys[key_id])
+
+    multi_member_clusters = 0
+    with open_compressed(f"{tmp_dir}/clusters.jsonl.{settings.RESOURCE_EXT}", "wt") as fo:
+        for cluster_id in range(cluster_count):
+            start, end = cluster_indptr[cluster_id], cluster_indptr[cluster_id + 1]
+            if end - start < 2:
+                continue
+
+            members = sorted([union_find.keys[order[idx]] for idx in cluster_members[start:end]])
+            fo.write(json.dumps({"cluster_id": cluster_id, "members": members}) + "\n")
+            multi_member_clusters += 1
+
+    arrays = {
+        "key_hashes": key_hashes,
+        "cluster_ids": cluster_ids,
+        "cluster_indptr": cluster_indptr,
+        "cluster_members": cluster_members,
+    }
+
+    metadata = {
+        "resource_fns": [os.path.basename(resource_fn) for resource_fn in resource_fns],
+        "keys": len(key_hashes),
+        "clusters": cluster_count,
+        "multi_member_clusters": multi_member_clusters,
+    }
+
+    write_arrays(tmp_dir, arrays, metadata)
+    finalize_dir(tmp_dir, index_dir)
+
+    log.info("Built equivalence clusters", index_dir=index_dir, **metadata)
+
+
+class EquivalenceClusters(object):
+    """Look up the equivalence cluster of a key
+
+    Usage:
+        clusters = EquivalenceClusters()
+        clusters.cluster_id("HGNC:391") == clusters.cluster_id("EG:207")
+        clusters.members("EG:207")  # -> ["EG:207", "HGNC:391", "SP:P31749", ...]
+    """
+
+    def __init__(self, index_dir: str = index_dir):
+
+        (arrays, self.metadata) = load_arrays(index_dir, index_arrays)
+        self.key_hashes = arrays["key_hashes"]
+        self.cluster_ids = arrays["cluster_ids"]
+        self.cluster_indptr = arrays["cluster_indptr"]
+        self.cluster_members = arrays["cluster_members"]
+        self.keys = StringTable(index_dir, "keys")
+
+    def __len__(self) -> int:
+        return len(self.key_hashes)
+
+    def __contains__(self, key: str) -> bool:
+        return self.key_index(key) is not None
+
+    def key_index(self, key: str) -> Optional[int]:
+        """Index of key in the key arrays or None if key is not in any cluster"""
+
+        key_hash_value = np.uint64(key_hash(key))
+        idx = int(np.searchsorted(self.key_hashes, key_hash_value, side="left"))
+        while idx < len(self.key_hashes) and self.key_hashes[idx] == key_hash_value:
+            if self.keys[idx] == key:
+                return idx
+            idx += 1
+
+        return None
+
+    def cluster_id(self, key: str) -> Optional[int]:
+        """Cluster id of key"""
+
+        idx = self.key_index(key)
+        if idx is None:
+            return None
+
+        return int(self.cluster_ids[idx])
+
+    def members(self, key_or_cluster_id: Union[str, int]) -> List[str]:
+        """Sorted keys in the cluster of key or cluster id"""
+
+        if isinstance(key_or_cluster_id, str):
+            cluster_id = self.cluster_id(key_or_cluster_id)
+            if cluster_id is None:
+                return []
+        else:
+            cluster_id = key_or_cluster_id
+
+        start, end = self.cluster_indptr[cluster_id], self.cluster_indptr[cluster_id + 1]
+
+        return sorted([self.keys[int(idx)] for idx in self.cluster_members[start:end]])
+
+    def equivalents(self, key: str) -> List[str]:
+        """Equivalent keys of key - excluding key"""
+
+        return [member for member in self.members(key) if member != key]
+
+
+def main(
+    namespaces: List[str] = Option(
+        None, "--namespace", help="Namespaces to include - defaults to all namespace resource files"
+    ),
+):
+
+    build_index(namespaces)
+
+
+if __name__ == "__main__":
+    typer.run(main)
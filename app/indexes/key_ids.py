@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  key_ids.py [--namespace EG --namespace HGNC ...] [--no-companions]
+
+Build the global key dictionary - a stable integer id for every key in the
+namespace and ortholog resource files (term keys, alt/obsolete/equivalence/
+parent/child keys, species keys, ortholog subject/object keys)
+
+The dictionary is append-only: every build starts from the previous key string
+table and only appends the keys it has not seen before (in resource file order),
+so a key keeps its id across releases and integer encoded data stays valid.
+Keys no longer in the resource files keep their ids.
+
+Optional companion outputs are the integer encoded, deduplicated and sorted
+(source, target) edges of the current resource files - much smaller to load
+for joins and graphs than the string keys.
+
+Index directory files:
+
+    keys.bin, keys_offsets.npy: keys by key id (string table)
+    key_hashes.npy: sorted 64 bit key hashes (uint64)
+    key_ids.npy: key id per key hash (int64)
+    ortholog_edges.npy: (subject id, object id) rows (uint32)
+    equivalence_edges.npy: (term id, equivalence key id) rows
+    parent_edges.npy: (child id, parent id) rows from parent_keys and child_keys
+    metadata.json: resource files and counts
+"""
+
+import glob
+import json
+import os
+import shutil
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.arrays import finalize_dir, load_arrays, make_tmp_dir, write_arrays
+from app.common.compressed_io import open_compressed
+from app.common.resources import get_namespace_resource_fns
+from app.common.string_table import StringTable, StringTableWriter
+from app.indexes.keys import key_hash
+
+log = structlog.getLogger(__name__)
+
+index_dir = f"{settings.DATA_DIR}/indexes/key_ids"
+
+index_arrays = ["key_hashes", "key_ids"]
+
+companion_arrays = ["ortholog_edges", "equivalence_edges", "parent_edges"]
+
+# Term key fields interned besides the term key
+term_key_fields = [
+    "alt_keys",
+    "obsolete_keys",
+    "equivalence_keys",
+    "parent_keys",
+    "child_keys",
+]
+
+
+def resource_fns(namespaces: List[str] = None) -> List[str]:
+    """Namespace resource files and - for all namespaces - the full ortholog resource files"""
+
+    fns = get_namespace_resource_fns(namespaces)
+    if not namespaces:
+        fns.extend(
+            [
+                ortholog_fn
+                for ortholog_fn in sorted(
+                    glob.glob(f"{settings.DATA_DIR}/orthologs/*.jsonl.{settings.RESOURCE_EXT}")
+                )
+                # skip species subset and partition files, e.g. eg_hmrz, eg_human_mouse
+                if "_" not in os.path.basename(ortholog_fn).split(".")[0]
+            ]
+        )
+
+    return fns
+
+
+class KeyDictionary(object):
+    """Append-only key -> id dictionary writing new keys to the key string table"""
+
+    def __init__(self, keys_table: StringTableWriter, key_ids: Dict[str, int] = None):
+
+        self.keys_table = keys_table
+        self.key_ids = key_ids if key_ids is not None else {}
+        self.new_keys = 0
+
+    def add(self, key: str) -> int:
+        """Id of key - appended to the dictionary if new"""
+
+        key_id = self.key_ids.get(key)
+        if key_id is None:
+            key_id = self.key_ids[key] = self.keys_table.append(key)
+            self.new_keys += 1
+
+        return key_id
+
+
+class EdgeBuffer(object):
+    """(source id, target id) edges collected as packed 64 bit integers"""
+
+    def __init__(self):
+        self.edges = array("Q")
+
+    def add(self, source_id: int, target_id: int):
+        self.edges.append(source_id << 32 | target_id)
+
+    def finish(self, dtype) -> np.ndarray:
+        """Deduplicated edges sorted by source and target id as an (n, 2) array"""
+
+        packed = np.unique(np.frombuffer(self.edges, dtype=np.uint64))
+
+        return np.stack([packed >> np.uint64(32), packed & np.uint64(0xFFFFFFFF)], axis=1).astype(
+            dtype
+        )
+
+
+def build_index(namespaces: List[str] = None, companions: bool = True, index_dir: str = index_dir):
+    """Extend the key dictionary with the keys of the resource files
+
+    Args:
+        namespaces: namespace prefixes to include, defaults to all namespace and ortholog files
+        companions: also write the integer encoded edge arrays
+        index_dir: index directory
+    """
+
+    tmp_dir = make_tmp_dir(index_dir)
+    fns = resource_fns(namespaces)
+
+    # Continue the previous key string table so the existing key ids are kept
+    previous_keys = 0
+    known_keys = {}
+    if os.path.exists(f"{index_dir}/metadata.json"):
+        for filename in ("keys.bin", "keys_offsets.npy"):
+            shutil.copyfile(f"{index_dir}/{filename}", f"{tmp_dir}/{filename}")
+        known_keys = {key: key_id for key_id, key in enumerate(StringTable(tmp_dir, "keys"))}
+        previous_keys = len(known_keys)
+
+    edges = {name: EdgeBuffer() for name in companion_arrays}
+
+    with StringTableWriter(tmp_dir, "keys", extend=bool(previous_keys)) as keys_table:
+        dictionary = KeyDictionary(keys_table, known_keys)
+
+        for resource_fn in fns:
+            log.info("Collecting key ids", resource_fn=resource_fn)
+
+            with open_compressed(resource_fn, "rt") as fi:
+                for line in fi:
+                    record = json.loads(line)
+                    if "term" in record:
+                        term = record["term"]
+                        term_id = dictionary.add(term["key"])
+                        if term.get("species_key"):
+                            dictionary.add(term["species_key"])
+
+                        for field in term_key_fields:
+                            for key in term.get(field) or []:
+                                key_id = dictionary.add(key)
+                                if not companions:
+                                    continue
+                                if field == "equivalence_keys":
+                                    edges["equivalence_edges"].add(term_id, key_id)
+                                elif field == "parent_keys":
+                                    edges["parent_edges"].add(term_id, key_id)
+                                elif field == "child_keys":
+                                    edges["parent_edges"].add(key_id, term_id)
+
+                    elif "ortholog" in record:
+                        ortholog = record["ortholog"]
+                        subject_id = dictionary.add(ortholog["subject_key"])
+                        object_id = dictionary.add(ortholog["object_key"])
+                        dictionary.add(ortholog["subject_species_key"])
+                        dictionary.add(ortholog["object_species_key"])
+                        if companions:
+                            edges["ortholog_edges"].add(subject_id, object_id)
+
+        key_count = len(keys_table)
+        new_keys = dictionary.new_keys
+
+    key_ids = np.arange(key_count, dtype=np.int64)
+    key_hashes = np.fromiter(
+        (key_hash(key) for key in StringTable(tmp_dir, "keys")), dtype=np.uint64, count=key_count
+    )
+    order = np.argsort(key_hashes, kind="stable")
+
+    arrays = {"key_hashes": key_hashes[order], "key_ids": key_ids[order]}
+
+    metadata = {
+        "resource_fns": [os.path.basename(resource_fn) for resource_fn in fns],
+        "keys": key_count,
+        "previous_keys": previous_keys,
+        "new_keys": new_keys,
+        "companions": {},
+    }
+
+    if companions:
+        if key_count >= 2 ** 32:
+            raise ValueError("Packed edges only support up to 2^32 key ids")
+
+        for name, buffer in edges.items():
+            arrays[name] = buffer.finish(np.uint32)
+            metadata["companions"][name] = len(arrays[name])
+
+    write_arrays(tmp_dir, arrays, metadata)
+    finalize_dir(tmp_dir, index_dir)
+
+    log.info(
+        "Built key dictionary",
+        index_dir=index_dir,
+        keys=key_count,
+        new_keys=new_keys,
+        companions=metadata["companions"],
+    )
+
+
+class KeyIds(object):
+    """Map keys to their stable integer ids and back
+
+    Usage:
+        key_ids = KeyIds()
+        key_id = key_ids.id("EG:207")
+        key_ids.key(key_id)  # -> "EG:207"
+        orthologs = key_ids.edges("ortholog_edges")  # (n, 2) array of key ids
+    """
+
+    def __init__(self, index_dir: str = index_dir):
+
+        self.index_dir = index_dir
+        (arrays, self.metadata) = load_arrays(index_dir, index_arrays)
+        self.key_hashes = arrays["key_hashes"]
+        self.key_ids = arrays["key_ids"]
+        self.keys = StringTable(index_dir, "keys")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return self.id(key) is not None
+
+    def id(self, key: str) -> Optional[int]:
+        """Id of key or None if key is not in the dictionary"""
+
+        key_hash_value = np.uint64(key_hash(key))
+        idx = int(np.searchsorted(self.key_hashes, key_hash_value, side="left"))
+        while idx < len(self.key_hashes) and self.key_hashes[idx] == key_hash_value:
+            key_id = int(self.key_ids[idx])
+            if self.keys[key_id] == key:
+                return key_id
+            idx += 1
+
+        return None
+
+    def key(self, key_id: int) -> str:
+        """Key of key id"""
+
+        return self.keys[key_id]
+
+    def edges(self, name: str) -> np.ndarray:
+        """Memory-mapped (source id, target id) companion edge array"""
+
+        if name not in self.metadata.get("companions", {}):
+            raise KeyError(f"No companion edges {name} in {self.index_dir}")
+
+        return np.load(f"{self.index_dir}/{name}.npy", mmap_mode="r")
+
+
+def main(
+    namespaces: List[str] = Option(
+        None,
+        "--namespace",
+        help="Namespaces to include - defaults to all namespace and ortholog resource files",
+    ),
+    companions: bool = Option(True, help="Write the integer encoded edge arrays"),
+):
+
+    build_index(namespaces, companions)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  keys.py [--namespace EG --namespace SP ...]
+
+Build the key index of all namespace resource files
+
+Every primary key, alt_key and obsolete_key is hashed to 64 bits and the sorted
+hashes point to compact term records so that keys can be resolved with a binary
+search of memory-mapped arrays instead of loading the namespace files.
+
+Index directory files:
+
+    key_hashes.npy: sorted 64 bit key hashes (uint64)
+    key_records.npy: term record index per key hash (int64)
+    key_kinds.npy: key kind per key hash - 0: primary key, 1: alt key, 2: obsolete key (uint8)
+    records.bin, records_offsets.npy: compact JSON term records (string table)
+    metadata.json: namespaces and counts
+"""
+
+import hashlib
+import json
+import os
+from array import array
+from typing import List, Optional
+
+import numpy as np
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.arrays import finalize_dir, load_arrays, make_tmp_dir, write_arrays
+from app.common.compressed_io import open_compressed
+from app.common.resources import get_namespace_resource_fns
+from app.common.string_table import StringTable, StringTableWriter
+
+log = structlog.getLogger(__name__)
+
+index_dir = f"{settings.DATA_DIR}/indexes/keys"
+
+key_kinds = ["primary", "alt", "obsolete"]
+
+# Term fields kept in the compact term records
+record_fields = [
+    "key",
+    "namespace",
+    "id",
+    "label",
+    "name",
+    "species_key",
+    "species_label",
+    "entity_types",
+    "annotation_types",
+    "equivalence_keys",
+    "alt_keys",
+    "obsolete_keys",
+]
+
+index_arrays = ["key_hashes", "key_records", "key_kinds"]
+
+
+def key_hash(key: str) -> int:
+    """64 bit hash of key"""
+
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def compact_record(term: dict) -> str:
+    """Compact JSON term record with only the record_fields that are set"""
+
+    record = {field: term[field] for field in record_fields if term.get(field)}
+
+    return json.dumps(record, separators=(",", ":"))
+
+
+def build_index(namespaces: List[str] = None, index_dir: str = index_dir):
+    """Build key index from namespace resource files
+
+    Args:
+        namespaces: namespace prefixes to index, defaults to all namespace resource files
+        index_dir: index directory
+    """
+
+    hashes = array("Q")
+    record_ids = array("q")
+    kinds = array("B")
+
+    tmp_dir = make_tmp_dir(index_dir)
+    resource_fns = get_namespace_resource_fns(namespaces)
+
+    with StringTableWriter(tmp_dir, "records") as records:
+        for resource_fn in resource_fns:
+            log.info("Indexing keys", resource_fn=resource_fn)
+
+            with open_compressed(resource_fn, "rt") as fi:
+                for line in fi:
+                    term = json.loads(line).get("term")
+                    if term is None:
+                        continue
+
+                    record_id = records.append(compact_record(term))
+
+                    for kind, keys in enumerate(
+                        ([term["key"]], term.get("alt_keys") or [], term.get("obsolete_keys") or [])
+                    ):
+                        for key in keys:
+                            hashes.append(key_hash(key))
+                            record_ids.append(record_id)
+                            kinds.append(kind)
+
+        record_count = len(records)
+
+    key_hashes = np.frombuffer(hashes, dtype=np.uint64)
+    order = np.argsort(key_hashes, kind="stable")
+
+    arrays = {
+        "key_hashes": key_hashes[order],
+        "key_records": np.frombuffer(record_ids, dtype=np.int64)[order],
+        "key_kinds": np.frombuffer(kinds, dtype=np.uint8)[order],
+    }
+
+    metadata = {
+        "resource_fns": [os.path.basename(resource_fn) for resource_fn in resource_fns],
+        "records": record_count,
+        "keys": len(key_hashes),
+    }
+
+    write_arrays(tmp_dir, arrays, metadata)
+    finalize_dir(tmp_dir, index_dir)
+
+    log.info("Built key index", index_dir=index_dir, records=record_count, keys=len(key_hashes))
+
+
+class KeyIndex(object):
+    """Resolve primary, alt and obsolete keys to compact term records
+
+    Opening the index only memory-maps the arrays and records.
+
+    Usage:
+        index = KeyIndex()
+        index.resolve("EG:207")  # -> {"key": "EG:207", "label": "AKT1", ..., "match": "primary"}
+    """
+
+    def __init__(self, index_dir: str = index_dir):
+
+        (arrays, self.metadata) = load_arrays(index_dir, index_arrays)
+        self.key_hashes = arrays["key_hashes"]
+        self.key_records = arrays["key_records"]
+        self.key_kinds = arrays["key_kinds"]
+        self.records = StringTable(index_dir, "records")
+
+    def __len__(self) -> int:
+        return len(self.key_hashes)
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.resolve_all(key))
+
+    def record(self, record_id: int) -> dict:
+        """Compact term record by record index"""
+
+        return json.loads(self.records[record_id])
+
+    def resolve_all(self, key: str) -> List[dict]:
+        """All term records matching key, primary key matches first
+
+        Each record includes match: [primary, alt, obsolete] for how key matched
+        """
+
+        key_hash_value = np.uint64(key_hash(key))
+        start = int(np.searchsorted(self.key_hashes, key_hash_value, side="left"))
+        end = int(np.searchsorted(self.key_hashes, key_hash_value, side="right"))
+
+        matches = []
+        for idx in range(start, end):
+            kind = key_kinds[self.key_kinds[idx]]
+            record = self.record(int(self.key_records[idx]))
+
+            # Guard against hash collisions
+            if kind == "primary":
+                matched = record["key"] == key
+            else:
+                matched = key in record.get(f"{kind}_keys", [])
+
+            if matched:
+                record["match"] = kind
+                matches.append(record)
+
+        matches.sort(key=lambda record: key_kinds.index(record["match"]))
+
+        return matches
+
+    def resolve(self, key: str) -> Optional[dict]:
+        """Best term record matching key - primary over alt over obsolete keys"""
+
+        matches = self.resolve_all(key)
+        if matches:
+            return matches[0]
+
+        return None
+
+
+def main(
+    namespaces: List[str] = Option(
+        None, "--namespace", help="Namespaces to index - defaults to all namespace resource files"
+    ),
+):
+
+    build_index(namespaces)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  trigrams.py [--namespace EG --namespace HGNC ...] [--force]
+
+Build the trigram fuzzy search index over term labels, names and synonyms
+
+The index has one segment per namespace resource file so only the segments of
+changed namespace files are rebuilt. Entry strings are case folded with all
+non-alphanumeric characters removed ("IL-6" and "il 6" -> "il6") and padded,
+then split into trigrams. Each trigram has a posting list of entry ids.
+
+Segment directory files ({index_dir}/{namespace file name}/):
+
+    trigrams.npy: sorted trigram codes (uint64 - 3 x 21 bit code points)
+    postings_indptr.npy: offsets into postings per trigram (int64)
+    postings.npy: sorted entry ids per trigram (uint32)
+    entry_terms.npy, entry_matches.npy, entry_namespaces.npy, entry_taxids.npy,
+    entry_entity_types.npy: per entry term record index and filters as in completions.py
+    entry_trigram_counts.npy: number of unique trigrams per entry (uint16)
+    strings.bin, strings_offsets.npy: original entry strings (string table)
+    terms.bin, terms_offsets.npy: compact JSON term records (string table)
+    metadata.json: resource file, namespaces and counts
+"""
+
+import glob
+import json
+import math
+import os
+import re
+import shutil
+from array import array
+from typing import List
+
+import numpy as np
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.arrays import finalize_dir, load_arrays, make_tmp_dir, write_arrays
+from app.common.collect_sources import file_newer
+from app.common.compressed_io import open_compressed
+from app.common.resources import get_namespace_resource_fns
+from app.common.string_table import StringTable, StringTableWriter
+from app.indexes.completions import entity_types_mask, match_types, species_taxid, term_entries
+
+log = structlog.getLogger(__name__)
+
+index_dir = f"{settings.DATA_DIR}/indexes/trigrams"
+
+segment_arrays = [
+    "trigrams",
+    "postings_indptr",
+    "postings",
+    "entry_terms",
+    "entry_matches",
+    "entry_namespaces",
+    "entry_taxids",
+    "entry_entity_types",
+    "entry_trigram_counts",
+]
+
+non_alphanumeric_re = re.compile(r"[\W_]+")
+
+
+def trigram_text(string: str) -> str:
+    """Normalized and padded text for trigrams, e.g. 'IL-6' -> '  il6 '"""
+
+    normalized = non_alphanumeric_re.sub("", string.casefold())
+    if not normalized:
+        return ""
+
+    return f"  {normalized} "
+
+
+def trigrams(string: str) -> List[int]:
+    """Sorted unique trigram codes of string"""
+
+    text = trigram_text(string)
+
+    return sorted(
+        {
+            (ord(text[idx]) << 42) | (ord(text[idx + 1]) << 21) | ord(text[idx + 2])
+            for idx in range(len(text) - 2)
+        }
+    )
+
+
+def segment_name(resource_fn: str) -> str:
+    return os.path.basename(resource_fn).split(".")[0]
+
+
+def build_segment(resource_fn: str, segment_dir: str):
+    """Build trigram index segment for one namespace resource file"""
+
+    tmp_dir = make_tmp_dir(segment_dir)
+
+    pair_trigrams = array("Q")
+    pair_entries = array("I")
+    entries = {
+        name: array("q")
+        for name in [
+            "entry_terms",
+            "entry_matches",
+            "entry_namespaces",
+            "entry_taxids",
+            "entry_entity_types",
+            "entry_trigram_counts",
+        ]
+    }
+    namespace_codes = {}
+
+    with open_compressed(resource_fn, "rt") as fi, StringTableWriter(
+        tmp_dir, "terms"
+    ) as terms_table, StringTableWriter(tmp_dir, "strings") as strings_table:
+
+        for line in fi:
+            term = json.loads(line).get("term")
+            if term is None:
+                continue
+
+            term_id = terms_table.append(
+                json.dumps(
+                    {
+                        "key": term["key"],
+                        "namespace": term["namespace"],
+                        "label": term.get("label", ""),
+                        "species_key": term.get("species_key", ""),
+                        "entity_types": term.get("entity_types") or [],
+                    },
+                    separators=(",", ":"),
+                )
+            )
+            namespace_code = namespace_codes.setdefault(term["namespace"], len(namespace_codes))
+            taxid = species_taxid(term.get("species_key"))
+            mask = entity_types_mask(term.get("entity_types"))
+
+            seen = set()
+            for (_, original, match_type) in term_entries(term):
+                entry_trigrams = trigrams(original)
+                if not entry_trigrams or tuple(entry_trigrams) in seen:
+                    continue
+                seen.add(tuple(entry_trigrams))
+
+                entry_id = strings_table.append(original)
+                pair_trigrams.extend(entry_trigrams)
+                pair_entries.extend([entry_id] * len(entry_trigrams))
+
+                entries["entry_terms"].append(term_id)
+                entries["entry_matches"].append(match_type)
+                entries["entry_namespaces"].append(namespace_code)
+                entries["entry_taxids"].append(taxid)
+                entries["entry_entity_types"].append(mask)
+                entries["entry_trigram_counts"].append(min(len(entry_trigrams), 65535))
+
+        entry_count = len(strings_table)
+
+    # Posting lists - stable sort keeps entry ids sorted within each trigram
+    codes = np.frombuffer(pair_trigrams, dtype=np.uint64)
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    postings = np.frombuffer(pair_entries, dtype=np.uint32)[order]
+    del order
+
+    (unique_codes, counts) = np.unique(codes, return_counts=True)
+    postings_indptr = np.zeros(len(unique_codes) + 1, dtype=np.int64)
+    np.cumsum(counts, out=postings_indptr[1:])
+
+    dtypes = {
+        "entry_terms": np.uint32,
+        "entry_matches": np.uint8,
+        "entry_namespaces": np.uint16,
+        "entry_taxids": np.int64,
+        "entry_entity_types": np.uint32,
+        "entry_trigram_counts": np.uint16,
+    }
+    arrays = {
+        name: np.frombuffer(values, dtype=np.int64).astype(dtypes[name])
+        for name, values in entries.items()
+    }
+    arrays.update(
+        {"trigrams": unique_codes, "postings_indptr": postings_indptr, "postings": postings}
+    )
+
+    metadata = {
+        "resource_fn": os.path.basename(resource_fn),
+        "namespaces": sorted(namespace_codes, key=namespace_codes.get),
+        "entries": entry_count,
+        "trigrams": len(unique_codes),
+        "postings": len(postings),
+    }
+
+    write_arrays(tmp_dir, arrays, metadata)
+    finalize_dir(tmp_dir, segment_dir)
+
+    log.info("Built trigram segment", segment_dir=segment_dir, **metadata)
+
+
+def build_index(namespaces: List[str] = None, force: bool = False, index_dir: str = index_dir):
+    """Build or incrementally update the trigram index
+
+    Only segments older than their namespace resource file are rebuilt. Segments of
+    namespace files that no longer exist are removed when all namespaces are indexed.
+
+    Args:
+        namespaces: namespace prefixes to index, defaults to all namespace resource files
+        force: rebuild all segments
+        index_dir: index directory
+    """
+
+    os.makedirs(index_dir, exist_ok=True)
+    resource_fns = get_namespace_resource_fns(namespaces)
+
+    for resource_fn in resource_fns:
+        segment_dir = f"{index_dir}/{segment_name(resource_fn)}"
+        if not force and file_newer(f"{segment_dir}/metadata.json", resource_fn):
+            log.info("Trigram segment is current", segment_dir=segment_dir)
+            continue
+
+        build_segment(resource_fn, segment_dir)
+
+    if not namespaces:
+        current = {segment_name(resource_fn) for resource_fn in resource_fns}
+        for segment_dir in glob.glob(f"{index_dir}/*/"):
+            if os.path.basename(segment_dir.rstrip("/")) not in current:
+                log.info("Removing trigram segment", segment_dir=segment_dir)
+                shutil.rmtree(segment_dir)
+
+
+class TrigramSegment(object):
+    """Memory-mapped trigram index segment"""
+
+    def __init__(self, segment_dir: str):
+
+        (arrays, self.metadata) = load_arrays(segment_dir, segment_arrays)
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+        self.namespace_codes = {
+            namespace: code for code, namespace in enumerate(self.metadata["namespaces"])
+        }
+        self.strings = StringTable(segment_dir, "strings")
+        self.terms = StringTable(segment_dir, "terms")
+
+    def postings_for(self, code: int) -> np.ndarray:
+
+        idx = int(np.searchsorted(self.trigrams, np.uint64(code)))
+        if idx >= len(self.trigrams) or int(self.trigrams[idx]) != code:
+            return self.postings[:0]
+
+        return self.postings[self.postings_indptr[idx] : self.postings_indptr[idx + 1]]
+
+    def search(
+        self,
+        query_trigrams: List[int],
+        min_similarity: float,
+        namespaces: List[str] = None,
+        taxids: List[int] = None,
+        entity_types: int = 0,
+    ):
+        """Entry ids and Jaccard trigram similarities of entries similar to the query"""
+
+        posting_lists = sorted([self.postings_for(code) for code in query_trigrams], key=len)
+
+        # An entry with similarity >= min_similarity shares at least min_common query trigrams
+        #   so it must be in one of the (query trigrams - min_common + 1) shortest posting lists
+        min_common = max(1, math.ceil(min_similarity * len(query_trigrams)))
+        candidate_lists = posting_lists[: len(query_trigrams) - min_common + 1]
+        candidate_lists = [postings for postings in candidate_lists if len(postings)]
+        if not candidate_lists:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        candidates = np.unique(np.concatenate(candidate_lists)).astype(np.int64)
+
+        mask = np.ones(len(candidates), dtype=bool)
+        if namespaces is not None:
+            codes = [self.namespace_codes[ns] for ns in namespaces if ns in self.namespace_codes]
+            mask &= np.isin(self.entry_namespaces[candidates], codes)
+        if taxids is not None:
+            mask &= np.isin(self.entry_taxids[candidates], taxids)
+        if entity_types:
+            mask &= (self.entry_entity_types[candidates] & entity_types) != 0
+        candidates = candidates[mask]
+
+        common = np.zeros(len(candidates), dtype=np.int64)
+        for postings in posting_lists:
+            if not len(postings) or not len(candidates):
+                continue
+            idx = np.searchsorted(postings, candidates)
+            found = idx < len(postings)
+            found[found] = postings[idx[found]] == candidates[found]
+            common += found
+
+        entry_counts = self.entry_trigram_counts[candidates].astype(np.int64)
+        similarities = common / (len(query_trigrams) + entry_counts - common)
+
+        keep = similarities >= min_similarity
+
+        return (candidates[keep], similarities[keep])
+
+
+class TrigramIndex(object):
+    """Top-k fuzzy search of term labels, names and synonyms
+
+    Usage:
+        index = TrigramIndex()
+        index.search("interleukin 6", k=10, namespaces=["HGNC"], species=["TAX:9606"])
+    """
+
+    def __init__(self, index_dir: str = index_dir):
+
+        self.segments = [
+            TrigramSegment(segment_dir.rstrip("/"))
+            for segment_dir in sorted(glob.glob(f"{index_dir}/*/"))
+            if os.path.exists(f"{segment_dir}/metadata.json")
+        ]
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        namespaces: List[str] = None,
+        species: List[str] = None,
+        entity_types: List[str] = None,
+        min_similarity: float = 0.3,
+    ) -> List[dict]:
+        """Top-k terms most similar to query
+
+        Args:
+            query: search string
+            k: number of terms to return
+            namespaces: only terms in these namespaces, e.g. ["HGNC", "EG"]
+            species: only terms of these species, e.g. ["TAX:9606"]
+            entity_types: only terms with any of these entity types, e.g. ["Protein"]
+            min_similarity: minimum Jaccard similarity of the trigram sets
+
+        Returns:
+            List[dict]: term records with the matched string, match type and similarity
+        """
+
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+
+        taxids = [species_taxid(species_key) for species_key in species] if species else None
+        mask = entity_types_mask(entity_types) if entity_types else 0
+
+        candidates = []
+        for segment_idx, segment in enumerate(self.segments):
+            if namespaces and not set(namespaces) & set(segment.namespace_codes):
+                continue
+
+            (entry_ids, similarities) = segment.search(
+                query_trigrams, min_similarity, namespaces, taxids, mask
+            )
+
+            # Best entry of each of the top k terms of the segment
+            order = np.lexsort((entry_ids, segment.entry_matches[entry_ids], -similarities))
+            segment_terms = set()
+            for idx in order:
+                entry_id = int(entry_ids[idx])
+                term_id = int(segment.entry_terms[entry_id])
+                if term_id in segment_terms:
+                    continue
+                segment_terms.add(term_id)
+
+                rank = (-float(similarities[idx]), int(segment.entry_matches[entry_id]))
+                candidates.append((rank, segment_idx, entry_id))
+                if len(segment_terms) >= k:
+                    break
+
+        results = []
+        for (rank, segment_idx, entry_id) in sorted(candidates)[:k]:
+            segment = self.segments[segment_idx]
+
+            result = json.loads(segment.terms[int(segment.entry_terms[entry_id])])
+            result["matched"] = segment.strings[entry_id]
+            result["match"] = match_types[segment.entry_matches[entry_id]]
+            result["similarity"] = round(-rank[0], 4)
+            results.append(result)
+
+        return results
+
+
+def main(
+    namespaces: List[str] = Option(
+        None, "--namespace", help="Namespaces to index - defaults to all namespace resource files"
+    ),
+    force: bool = Option(False, help="Rebuild all segments, not only changed namespace files"),
+):
+
+    build_index(namespaces, force=force)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -7,7 +7,6 @@ Usage:  hgnc.py
 """
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -22,6 +21,7 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_ftp_file
 from app.common.resources import get_metadata, get_species_labels
 from app.common.text import quote_id
@@ -40,7 +40,7 @@ species_key = "TAX:CHANGEME"
 
 download_url = "ftp://CHANGEME"
 download_fn = f"{settings.DOWNLOAD_DIR}/CHANGEME.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 
 def build_json():
@@ -55,7 +55,7 @@ def build_json():
 
     species_labels = get_species_labels()
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo:
+    with open_compressed(download_fn, "rt") as fi, open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
@@ -8,8 +8,8 @@ Usage:  chembl.py
 
 import copy
 import datetime
-import gzip
 import json
+import multiprocessing
 import os
 import re
 import sqlite3
@@ -24,6 +24,7 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_chembl_version, get_ftp_file
 from app.common.resources import get_metadata
 from app.common.text import quote_id, strip_quotes
@@ -44,9 +45,74 @@ chembl_version = get_chembl_version(
 
 download_url = f"ftp://ftp.ebi.ac.uk/pub/databases/chembl/ChEMBLdb/latest/chembl_{chembl_version}_sqlite.tar.gz"
 download_fn = f"{settings.DOWNLOAD_DIR}/chembl_{chembl_version}_sqlite.tar.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 download_db_fn = f"{settings.DOWNLOAD_DIR}/chembl_{chembl_version}/chembl_{chembl_version}_sqlite/chembl_{chembl_version}.db"
 
+# Tuned sqlite settings - mmap_size is capped by sqlite's compile-time SQLITE_MAX_MMAP_SIZE
+sqlite_mmap_size = 32 * 1024 ** 3
+sqlite_cache_kib = 2 * 1024 ** 2
+
+
+def connect_db(db_filename: str, tuned: bool = False) -> sqlite3.Connection:
+    """Open ChEMBL sqlite db
+
+    The tuned connection is read-only and immutable (no locking or journal checks)
+    with a large mmap window and page cache since the ChEMBL db is ~20Gb and is
+    only ever scanned once per build.
+    """
+
+    if tuned:
+        conn = sqlite3.connect(f"file:{db_filename}?mode=ro&immutable=1", uri=True)
+        conn.execute(f"PRAGMA mmap_size={sqlite_mmap_size}")
+        conn.execute(f"PRAGMA cache_size=-{sqlite_cache_kib}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=1")
+    else:
+        conn = sqlite3.connect(db_filename)
+
+    conn.row_factory = sqlite3.Row
+
+    return conn
+
+
+def make_record(
+    chembl_id: str,
+    pref_name: str,
+    syns: List[str],
+    standard_inchi_key: str,
+    chebi_par_id: str,
+) -> Mapping[str, Any]:
+    """Collect chembl molecule query results into a term record"""
+
+    src_id = chembl_id.replace("CHEMBL", "")
+    chembl_id = chembl_id.replace("CHEMBL", "CHEMBL:")
+
+    alt_keys = []
+
+    if pref_name:
+        pref_name = pref_name.lower()
+        alt_keys.append(f"CHEMBL:{quote_id(pref_name)}")
+        name = pref_name
+    elif syns:
+        name = syns[0]
+    else:
+        name = chembl_id
+
+    record = {
+        "name": name,
+        "pref_name": pref_name,
+        "chembl_id": chembl_id,
+        "src_id": src_id,
+        "alt_keys": alt_keys,
+        "syns": copy.copy(syns),
+    }
+    if standard_inchi_key:
+        record["inchi_key"] = f"INCHIKEY:{standard_inchi_key}"
+    if chebi_par_id:
+        record["chebi_id"] = f"CHEBI:{chebi_par_id}"
+
+    return record
+
 
 def query_db() -> Iterable[Mapping[str, Any]]:
     """Generator to run chembl term queries using sqlite chembl db"""
@@ -54,13 +120,7 @@ def query_db() -> Iterable[Mapping[str, Any]]:
         "This script requires MANUAL interaction to get latest chembl and untar it."
     )
 
-    db_filename = (
-        f"{settings.DOWNLOAD_DIR}/"
-        f"chembl_{chembl_version}/chembl_{chembl_version}_sqlite/chembl_{chembl_version}.db"
-    )
-
-    conn = sqlite3.connect(db_filename)
-    conn.row_factory = sqlite3.Row
+    conn = connect_db(download_db_fn)
 
     main_sql = """
         SELECT
@@ -77,8 +137,6 @@ def query_db() -> Iterable[Mapping[str, Any]]:
     with conn:
         for row in conn.execute(main_sql):
 
-            chembl_id = row["chembl_id"].replace("CHEMBL", "CHEMBL:")
-            src_id = row["chembl_id"].replace("CHEMBL", "")
             syns = row["syns"]
 
             if syns:
@@ -86,74 +144,149 @@ def query_db() -> Iterable[Mapping[str, Any]]:
             else:
                 syns = []
 
-            pref_name = row["pref_name"]
-            alt_keys = []
-            namespace_value = src_id
+            yield make_record(
+                row["chembl_id"],
+                row["pref_name"],
+                syns,
+                row["standard_inchi_key"],
+                row["chebi_par_id"],
+            )
 
-            if pref_name:
-                pref_name = pref_name.lower()
-                alt_keys.append(f"CHEMBL:{quote_id(pref_name)}")
-                name = pref_name
-            elif syns:
-                name = syns[0]
-            else:
-                name = chembl_id
 
-            record = {
-                "name": name,
-                "pref_name": pref_name,
-                "chembl_id": chembl_id,
-                "src_id": src_id,
-                "alt_keys": alt_keys,
-                "syns": copy.copy(syns),
-            }
-            if row["standard_inchi_key"]:
-                record["inchi_key"] = f'INCHIKEY:{row["standard_inchi_key"]}'
-            if row["chebi_par_id"]:
-                record["chebi_id"] = f"CHEBI:{row['chebi_par_id']}"
+def query_db_batches(batch_size: int = 10000) -> Iterable[List[Mapping[str, Any]]]:
+    """Generator of batches of chembl term records using the tuned sqlite connection
+
+    Synonym rows are streamed in molregno order (the molecule_dictionary primary key)
+    and collapsed here instead of using GROUP BY/group_concat which forces sqlite to
+    build a temporary B-tree over the whole join.
+    """
+    log.error(
+        "This script requires MANUAL interaction to get latest chembl and untar it."
+    )
+
+    conn = connect_db(download_db_fn, tuned=True)
 
-            yield record
+    main_sql = """
+        SELECT
+            md.molregno, chembl_id, synonyms, standard_inchi_key,
+            chebi_par_id, molecule_type, pref_name
+        FROM
+            molecule_dictionary md
+        LEFT OUTER JOIN compound_structures cs ON md.molregno=cs.molregno
+        LEFT OUTER JOIN molecule_synonyms ms ON md.molregno=ms.molregno
+        ORDER
+            by md.molregno
+    """
 
+    with conn:
+        cursor = conn.execute(main_sql)
+
+        batch = []
+        current = None
+        syns = []
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            for row in rows:
+                if current is None or row["molregno"] != current["molregno"]:
+                    if current is not None:
+                        batch.append(
+                            make_record(
+                                current["chembl_id"],
+                                current["pref_name"],
+                                syns,
+                                current["standard_inchi_key"],
+                                current["chebi_par_id"],
+                            )
+                        )
+                    current = row
+                    syns = []
+
+                if row["synonyms"]:
+                    syns.append(row["synonyms"].lower())
+
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if current is not None:
+            batch.append(
+                make_record(
+                    current["chembl_id"],
+                    current["pref_name"],
+                    syns,
+                    current["standard_inchi_key"],
+                    current["chebi_par_id"],
+                )
+            )
+        if batch:
+            yield batch
+
+
+def record_to_jsonl(record: Mapping[str, Any]) -> str:
+    """Convert chembl record into Term JSONL line"""
+
+    key = f"{namespace}:{record['src_id']}"
+    if not record["pref_name"]:
+        name = key
+        label = ""
+    else:
+        name = record["pref_name"]
+        label = name
+
+    term = Term(
+        key=key,
+        namespace=namespace,
+        id=record["src_id"],
+        alt_keys=record["alt_keys"],
+        label=label,
+        name=name,
+        synonyms=copy.copy(list(set(record["syns"]))),
+        entity_types=["Abundance"],
+    )
 
-def build_json():
+    if record.get("chebi_id", None):
+        term.equivalence_keys.append(record["chebi_id"])
+    if record.get("inchi_key", None):
+        term.equivalence_keys.append(record["inchi_key"])
+
+    return "{}\n".format(json.dumps({"term": term.dict()}))
+
+
+def records_to_jsonl(records: List[Mapping[str, Any]]) -> str:
+    """Convert batch of chembl records into Term JSONL lines - run in worker processes"""
+
+    return "".join([record_to_jsonl(record) for record in records])
+
+
+def build_json(tuned: bool = True, workers: int = None, batch_size: int = 10000):
     """Build CHEMBL namespace json load file
 
     There are multiple tables that have to be joined and records collapsed to the Parent ID.
+
+    Args:
+        tuned: use read-only, molregno ordered and batched queries with Term
+            construction spread across a pool of worker processes
+        workers: number of worker processes for the tuned mode, defaults to cpu count
+        batch_size: number of rows/records per fetchmany batch for the tuned mode
     """
 
-    with gzip.open(resource_fn, mode="wt") as fo:
+    with open_compressed(resource_fn, mode="wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
         fo.write("{}\n".format(json.dumps({"metadata": metadata})))
 
-        for record in query_db():
-            key = f"{namespace}:{record['src_id']}"
-            if not record["pref_name"]:
-                name = key
-                label = ""
-            else:
-                name = record["pref_name"]
-                label = name
-
-            term = Term(
-                key=key,
-                namespace=namespace,
-                id=record["src_id"],
-                alt_keys=record["alt_keys"],
-                label=label,
-                name=name,
-                synonyms=copy.copy(list(set(record["syns"]))),
-                entity_types=["Abundance"],
-            )
-
-            if record.get("chebi_id", None):
-                term.equivalence_keys.append(record["chebi_id"])
-            if record.get("inchi_key", None):
-                term.equivalence_keys.append(record["inchi_key"])
-
-            # Add term to JSONL
-            fo.write("{}\n".format(json.dumps({"term": term.dict()})))
+        if tuned:
+            with multiprocessing.Pool(workers) as pool:
+                for lines in pool.imap(records_to_jsonl, query_db_batches(batch_size)):
+                    fo.write(lines)
+        else:
+            for record in query_db():
+                fo.write(record_to_jsonl(record))
 
 
 def main(
@@ -163,6 +296,10 @@ def main(
     force_download: bool = Option(
         False, help="Force re-downloading of source data file"
     ),
+    tuned: bool = Option(
+        True, help="Use read-only, ordered, batched queries and parallel Term construction"
+    ),
+    workers: int = Option(None, help="Number of worker processes for tuned mode"),
 ):
 
     (changed, msg) = get_ftp_file(
@@ -173,7 +310,7 @@ def main(
         log.info("Collect download file", result=msg, changed=changed)
 
     if changed or overwrite:
-        build_json()
+        build_json(tuned=tuned, workers=workers)
 
 
 if __name__ == "__main__":
@@ -8,10 +8,10 @@ Usage:  eg.py
 
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
+from contextlib import nullcontext
 
 import structlog
 import yaml
@@ -19,9 +19,12 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.backbone.gene2protein import BackboneWriter
 from app.common.collect_sources import get_ftp_file
 from app.common.resources import get_metadata, get_species_labels
+from app.common.subsets import SubsetWriter, resource_sinks
 from app.common.text import quote_id
+from app.common.tsv import read_tsv
 from app.schemas.main import Term
 from typer import Option
 
@@ -37,9 +40,7 @@ download_url = "ftp://ftp.ncbi.nlm.nih.gov/gene/DATA/GENE_INFO/All_Data.gene_inf
 download_history_url = "ftp://ftp.ncbi.nlm.nih.gov/gene/DATA/gene_history.gz"
 download_fn = f"{settings.DOWNLOAD_DIR}/eg.csv.gz"
 download_history_fn = f"{settings.DOWNLOAD_DIR}/eg_gene_history.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
-resource_fn_hmrz = f"{settings.DATA_DIR}/namespaces/{namespace_lc}_hmrz.jsonl.gz"
-hmrz_species = ["TAX:9606", "TAX:10090", "TAX:10116", "TAX:7955"]
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 
 def get_history():
@@ -50,29 +51,19 @@ def get_history():
     """
 
     history = {}
-    with gzip.open(download_history_fn, "rt") as fi:
-
-        fi.__next__()  # skip header line
-
-        for line in fi:
-            cols = line.split("\t")
-
-            (gene_id, old_gene_id,) = (
-                cols[1],
-                cols[2],
-            )
-            if gene_id != "-":
-                if history.get(gene_id, None):
-                    history[gene_id] = {old_gene_id: 1}
+    for (gene_id, old_gene_id) in read_tsv(download_history_fn, columns=(1, 2), header_lines=1):
+        if gene_id != "-":
+            if history.get(gene_id, None):
+                history[gene_id] = {old_gene_id: 1}
 
     return history
 
 
-def build_json():
+def build_json(backbone: bool = True):
     """Build EG namespace json load file
 
     Args:
-        force (bool): build json result regardless of file mod dates
+        backbone (bool): also build the gene2protein backbone nanopubs from the terms
 
     Returns:
         None
@@ -99,30 +90,18 @@ def build_json():
         "rRNA": ["Gene", "RNA"],
     }
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(
-        resource_fn, "wt"
-    ) as fo, gzip.open(resource_fn_hmrz, "wt") as fz:
+    with SubsetWriter(
+        resource_fn, sinks=resource_sinks(resource_fn, terms=True)
+    ) as fo, (
+        BackboneWriter(metadata) if backbone else nullcontext()
+    ) as backbone_writer:
 
         # Header JSONL record for terminology
-        metadata = get_metadata(namespace_def)
-        fo.write("{}\n".format(json.dumps({"metadata": metadata})))
-        fz.write("{}\n".format(json.dumps({"metadata": metadata})))
-
-        fi.__next__()  # skip header line
-
-        for line in fi:
-
-            cols = line.split("\t")
-            (tax_src_id, gene_id, symbol, syns, dbxrefs, desc, gene_type, name) = (
-                cols[0],
-                cols[1],
-                cols[2],
-                cols[4],
-                cols[5],
-                cols[8],
-                cols[9],
-                cols[11],
-            )
+        fo.write_all("{}\n".format(json.dumps({"metadata": metadata})))
+
+        for (tax_src_id, gene_id, symbol, syns, dbxrefs, desc, gene_type, name) in read_tsv(
+            download_fn, columns=(0, 1, 2, 4, 5, 8, 9, 11), header_lines=1
+        ):
             species_key = f"TAX:{tax_src_id}"
 
             # Process synonyms
@@ -190,10 +169,12 @@ def build_json():
                 ]
 
             # Add term to JSONL
-            fo.write("{}\n".format(json.dumps({"term": term.dict()})))
+            term_dict = term.dict()
+            term_record = {"term": term_dict}
+            fo.write("{}\n".format(json.dumps(term_record)), species_key, term_record)
 
-            if species_key in hmrz_species:
-                fz.write("{}\n".format(json.dumps({"term": term.dict()})))
+            if backbone_writer is not None:
+                backbone_writer.add_term(term_dict)
 
     log.info(f"Equivalence Prefixes {json.dumps(collect_prefixes, indent=4)}")
 
@@ -208,6 +189,9 @@ def main(
     force_download: bool = Option(
         False, help="Force re-downloading of source data file"
     ),
+    backbone: bool = Option(
+        True, help="Build backbone nanopubs in the same pass as the namespace"
+    ),
 ):
 
     (changed, msg) = get_ftp_file(
@@ -221,7 +205,7 @@ def main(
         log.info("Collect download file", result=msg, changed=changed)
 
     if changed or overwrite:
-        build_json()
+        build_json(backbone=backbone)
 
 
 if __name__ == "__main__":
@@ -7,7 +7,6 @@ Usage:  do.py
 """
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -22,6 +21,7 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_web_file
 from app.common.resources import get_metadata
 from app.common.text import quote_id
@@ -38,12 +38,12 @@ namespace_def = settings.NAMESPACE_DEFINITIONS[namespace_lc]
 
 download_url = "http://purl.obolibrary.org/obo/doid.obo"
 download_fn = f"{settings.DOWNLOAD_DIR}/{namespace_lc}.obo.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 
 def build_json():
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo:
+    with open_compressed(download_fn, "rt") as fi, open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
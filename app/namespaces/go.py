@@ -8,7 +8,6 @@ Usage:  go.py
 
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -23,6 +22,7 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_web_file
 from app.common.resources import get_metadata
 from app.common.text import quote_id
@@ -39,7 +39,7 @@ namespace_def = settings.NAMESPACE_DEFINITIONS[namespace_lc]
 
 download_url = "http://purl.obolibrary.org/obo/go.obo"
 download_fn = f"{settings.DOWNLOAD_DIR}/go.obo.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 complex_parent_id = "GO:0032991"
 
@@ -64,7 +64,7 @@ def build_json():
 
     # collect parents/hierarchy
     parent_ids = {}
-    with gzip.open(download_fn, "rt") as fi:
+    with open_compressed(download_fn, "rt") as fi:
         id_re = re.compile("id:\s+(\S+)\s*")
         isa_re = re.compile("is_a:\s+(\S+)\s")
 
@@ -80,7 +80,7 @@ def build_json():
                 else:
                     parent_ids[goid] = {isa_id: 1}
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo:
+    with open_compressed(download_fn, "rt") as fi, open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
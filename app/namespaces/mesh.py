@@ -8,7 +8,6 @@ Usage:  mesh.py
 
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -19,6 +18,7 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_ftp_file, get_mesh_version
 from app.common.resources import get_metadata, get_species_labels
 from app.common.text import quote_id
@@ -50,7 +50,7 @@ download_descriptors_url = (
 )
 download_descriptors_fn = f"{settings.DOWNLOAD_DIR}/mesh_d{version}.bin.gz"
 
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 
 def process_types(mesh_tree_ids):
@@ -105,9 +105,9 @@ def build_json():
 
     blankline_regex = re.compile("\s*$")
 
-    with gzip.open(download_descriptors_fn, "rt") as fid, gzip.open(
+    with open_compressed(download_descriptors_fn, "rt") as fid, open_compressed(
         download_concepts_fn, "rt"
-    ) as fic, gzip.open(resource_fn, "wt") as fo:
+    ) as fic, open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
@@ -7,14 +7,13 @@ Usage:  mgi.py
 """
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
 import sys
 import tempfile
 from pathlib import Path
-from typing import TextIO
+from typing import Iterable, TextIO, Tuple
 
 import structlog
 import yaml
@@ -22,9 +21,12 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_web_file
+from app.common.joins import JoinSource, cogroup
 from app.common.resources import get_metadata, get_species_labels
 from app.common.text import quote_id
+from app.common.tsv import read_tsv
 from app.schemas.main import Term
 from typer import Option
 
@@ -51,7 +53,32 @@ download_fn = f"{settings.DOWNLOAD_DIR}/mgi_MRK_List2.rpt.gz"
 download_fn2 = f"{settings.DOWNLOAD_DIR}/mgi_MRK_SwissProt.rpt.gz"
 download_fn3 = f"{settings.DOWNLOAD_DIR}/mgi_MGI_EntrezGene.rpt.gz"
 
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
+
+
+def marker_rows() -> Iterable[Tuple[str, ...]]:
+    """MGI marker rows - (mgi_id, symbol, name, marker_type, gene_type, synonyms)"""
+
+    for (mgi_id, *cols) in read_tsv(download_fn, columns=(0, 6, 8, 9, 10, 11), header_lines=1):
+        yield (mgi_id.replace("MGI:", ""), *cols)
+
+
+def swissprot_rows() -> Iterable[Tuple[str, str]]:
+    """Swissprot equivalence rows - (mgi_id, space separated SP accessions)"""
+
+    for (mgi_id, status, sp_accessions) in read_tsv(download_fn2, columns=(0, 2, 6)):
+        if status == "W":
+            continue
+        yield (mgi_id.replace("MGI:", ""), sp_accessions.rstrip())
+
+
+def entrezgene_rows() -> Iterable[Tuple[str, str]]:
+    """EntrezGene equivalence rows - (mgi_id, eg_id)"""
+
+    for (mgi_id, status, eg_id) in read_tsv(download_fn3, columns=(0, 2, 8)):
+        if status == "W":
+            continue
+        yield (mgi_id.replace("MGI:", ""), eg_id)
 
 
 def build_json():
@@ -95,51 +122,24 @@ def build_json():
         "SRP RNA gene": ["Gene", "RNA"],
     }
 
-    # Swissprot equivalents
-    sp_eqv = {}
-    with gzip.open(download_fn2, "rt") as fi:
-
-        for line in fi:
-            cols = line.rstrip().split("\t")
-            if cols[2] == "W":
-                continue
-            (mgi_id, sp_accession) = (cols[0], cols[6])
-            mgi_id = mgi_id.replace("MGI:", "")
-            sp_eqv[mgi_id] = sp_accession.split(" ")
-
-    # EntrezGene equivalents
-    eg_eqv = {}
-    with gzip.open(download_fn3, "rt") as fi:
-
-        for line in fi:
-            cols = line.split("\t")
-            if cols[2] == "W":
-                continue
-            (mgi_id, eg_id) = (cols[0], cols[8])
-            mgi_id = mgi_id.replace("MGI:", "")
-            eg_eqv[mgi_id] = [eg_id]
-
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo:
+    with open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
         fo.write("{}\n".format(json.dumps({"metadata": metadata})))
 
-        firstline = fi.readline()
-        firstline = firstline.split("\t")
-
-        for line in fi:
-            cols = line.split("\t")
-            (mgi_id, symbol, name, marker_type, gene_type, synonyms) = (
-                cols[0],
-                cols[6],
-                cols[8],
-                cols[9],
-                cols[10],
-                cols[11],
-            )
+        for mgi_id, (genes, sp_rows, eg_rows) in cogroup(
+            [
+                JoinSource("mgi_MRK_List2", download_fn, marker_rows),
+                JoinSource("mgi_MRK_SwissProt", download_fn2, swissprot_rows),
+                JoinSource("mgi_MGI_EntrezGene", download_fn3, entrezgene_rows),
+            ]
+        ):
+            # Skip equivalences without a gene marker record
+            if not genes:
+                continue
 
-            mgi_id = mgi_id.replace("MGI:", "")
+            (mgi_id, symbol, name, marker_type, gene_type, synonyms) = genes[0]
 
             # Skip non-gene entries
             if marker_type != "Gene":
@@ -155,18 +155,18 @@ def build_json():
             else:
                 entity_types = bel_entity_type_map[gene_type]
 
+            # Only the last equivalence row of an MGI id is used
             equivalences = []
-            if mgi_id in sp_eqv:
-                for sp_accession in sp_eqv[mgi_id]:
+            for (_, sp_accessions) in sp_rows[-1:]:
+                for sp_accession in sp_accessions.split(" "):
                     if not sp_accession:
                         continue
                     equivalences.append(f"SP:{sp_accession}")
 
-            if mgi_id in eg_eqv:
-                for eg_id in eg_eqv[mgi_id]:
-                    if not eg_id:
-                        continue
-                    equivalences.append(f"EG:{eg_id}")
+            for (_, eg_id) in eg_rows[-1:]:
+                if not eg_id:
+                    continue
+                equivalences.append(f"EG:{eg_id}")
 
             term = Term(
                 key=f"{namespace}:{mgi_id}",
@@ -7,10 +7,8 @@ Usage:  hgnc.py
 """
 import copy
 import datetime
-import gzip
 import json
 import os
-import re
 import sys
 import tempfile
 from pathlib import Path
@@ -22,9 +20,11 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_ftp_file
 from app.common.resources import get_metadata, get_species_labels
 from app.common.text import quote_id
+from app.common.tsv import read_tsv
 from app.schemas.main import Term
 from typer import Option
 
@@ -40,7 +40,7 @@ species_key = "TAX:10116"
 
 download_url = "ftp://ftp.rgd.mcw.edu/pub/data_release/GENES_RAT.txt"
 download_fn = f"{settings.DOWNLOAD_DIR}/rgd.txt.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 
 def build_json():
@@ -84,40 +84,28 @@ def build_json():
         "tec": [],
     }
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo:
+    with open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
         fo.write("{}\n".format(json.dumps({"metadata": metadata})))
 
-        for line in fi:
-            if re.match(
-                "#|GENE_RGD_ID", line, flags=0
-            ):  # many of the file header lines are comments
-                continue
-
-            cols = line.split("\t")
-            (
-                rgd_id,
-                symbol,
-                name,
-                desc,
-                ncbi_gene_id,
-                uniprot_id,
-                old_symbols,
-                old_names,
-                gene_type,
-            ) = (
-                cols[0],
-                cols[1],
-                cols[2],
-                cols[3],
-                cols[20],
-                cols[21],
-                cols[29],
-                cols[30],
-                cols[36],
-            )
+        # many of the file header lines are comments
+        for (
+            rgd_id,
+            symbol,
+            name,
+            desc,
+            ncbi_gene_id,
+            uniprot_id,
+            old_symbols,
+            old_names,
+            gene_type,
+        ) in read_tsv(
+            download_fn,
+            columns=(0, 1, 2, 3, 20, 21, 29, 30, 36),
+            skip_prefixes=("#", "GENE_RGD_ID"),
+        ):
             # print(f'ID: {rgd_id}, S: {symbol}, N: {name}, D: {desc}, nbci_gene_id: {ncbi_gene_id}, up: {uniprot_id}, old_sym: {old_symbols}, old_names: {old_names}, gt: {gene_type}')
 
             synonyms = [val for val in old_symbols.split(";") + old_names.split(";") if val]
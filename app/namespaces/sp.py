@@ -8,7 +8,6 @@ Usage:  sp.py
 
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -20,8 +19,10 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_ftp_file
 from app.common.resources import get_metadata, get_species_labels
+from app.common.subsets import SubsetWriter, resource_sinks
 from app.common.text import quote_id
 from app.schemas.main import Term
 from typer import Option
@@ -41,9 +42,7 @@ namespace_def = settings.NAMESPACE_DEFINITIONS[namespace_lc]
 
 download_url = "ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/uniprot_sprot.dat.gz"
 download_fn = f"{settings.DOWNLOAD_DIR}/sp_uniprot_sprot.dat.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
-resource_fn_hmrz = f"{settings.DATA_DIR}/namespaces/{namespace_lc}_hmrz.jsonl.gz"
-hmrz_species = ["TAX:9606", "TAX:10090", "TAX:10116", "TAX:7955"]
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
 species_labels = get_species_labels()
 model_org_prefixes = ["HGNC", "MGI", "RGD", "ZFIN"]
@@ -204,14 +203,13 @@ def process_record(record: List[str]) -> Term:
 def build_json():
     """Build Swissprot namespace jsonl load file"""
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo, gzip.open(
-        resource_fn_hmrz, "wt"
-    ) as fz:
+    with open_compressed(download_fn, "rt") as fi, SubsetWriter(
+        resource_fn, sinks=resource_sinks(resource_fn, terms=True)
+    ) as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
-        fo.write("{}\n".format(json.dumps({"metadata": metadata})))
-        fz.write("{}\n".format(json.dumps({"metadata": metadata})))
+        fo.write_all("{}\n".format(json.dumps({"metadata": metadata})))
 
         record = []
         for line in fi:
@@ -220,9 +218,8 @@ def build_json():
             if re.match("^//", line):
                 term = process_record(record)
 
-                fo.write("{}\n".format(json.dumps({"term": term.dict()})))
-                if term.species_key in hmrz_species:
-                    fz.write("{}\n".format(json.dumps({"term": term.dict()})))
+                term_record = {"term": term.dict()}
+                fo.write("{}\n".format(json.dumps(term_record)), term.species_key, term_record)
 
                 record = []
 
@@ -8,7 +8,6 @@ Usage:  tax.py
 
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -22,8 +21,10 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_ftp_file
 from app.common.resources import get_metadata, get_species_labels
+from app.common.subsets import SubsetWriter, resource_sinks
 from app.common.text import quote_id
 from app.schemas.main import Term
 from typer import Option
@@ -39,11 +40,9 @@ namespace_def = settings.NAMESPACE_DEFINITIONS[namespace_lc]
 download_url = "ftp://ftp.ncbi.nih.gov/pub/taxonomy/taxdump.tar.gz"
 download_fn = f"{settings.DOWNLOAD_DIR}/taxdump.tar.gz"
 
-species_labels_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}_labels.json.gz"
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
-resource_fn_hmrz = f"{settings.DATA_DIR}/namespaces/{namespace_lc}_hmrz.jsonl.gz"
+species_labels_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}_labels.json.{settings.RESOURCE_EXT}"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
 
-hmrz_species = ["TAX:9606", "TAX:10090", "TAX:10116", "TAX:7955"]
 
 
 def build_json():
@@ -127,14 +126,11 @@ def build_json():
                     if not re.search("sp.", name):
                         terms[id]["alt_keys"].append(f"{namespace}:{quote_id(name)}")
 
-    with gzip.open(resource_fn, "wt") as fo, gzip.open(
-        resource_fn_hmrz, "wt"
-    ) as fz:
+    with SubsetWriter(resource_fn, sinks=resource_sinks(resource_fn, terms=True)) as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
-        fo.write("{}\n".format(json.dumps({"metadata": metadata})))
-        fz.write("{}\n".format(json.dumps({"metadata": metadata})))
+        fo.write_all("{}\n".format(json.dumps({"metadata": metadata})))
 
         for id in terms:
 
@@ -156,10 +152,10 @@ def build_json():
             )
 
             # Add terms record to JSONL
-            fo.write("{}\n".format(json.dumps({"term": term.dict()})))
-
-            if terms[id]["species_key"] in hmrz_species:
-                fz.write("{}\n".format(json.dumps({"term": term.dict()})))
+            term_record = {"term": term.dict()}
+            fo.write(
+                "{}\n".format(json.dumps(term_record)), terms[id]["species_key"], term_record
+            )
 
 
     # Create species label file
@@ -170,7 +166,7 @@ def build_json():
             continue
         species_labels[terms[id]["key"]] = terms[id]["label"]    
 
-    with gzip.open(species_labels_fn, "wt") as fo:
+    with open_compressed(species_labels_fn, "wt") as fo:
         json.dump(species_labels, fo)
 
 
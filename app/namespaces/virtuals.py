@@ -7,7 +7,6 @@ Usage:  virtuals.py
 """
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -21,6 +20,7 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.resources import get_metadata, get_species_labels
 from app.schemas.main import Term
 from typer import Option
@@ -38,9 +38,9 @@ def build_json():
     for key in settings.NAMESPACE_DEFINITIONS:
         doc = settings.NAMESPACE_DEFINITIONS[key]
         if doc["namespace_type"] in ["virtual", "identifers_org"]:
-            resource_fn = f"{settings.DATA_DIR}/namespaces/{key}.jsonl.gz"
+            resource_fn = f"{settings.DATA_DIR}/namespaces/{key}.jsonl.{settings.RESOURCE_EXT}"
 
-            with gzip.open(resource_fn, "wt") as fo:
+            with open_compressed(resource_fn, "wt") as fo:
                 # Header JSONL record for terminology
                 metadata = get_metadata(doc)
                 fo.write("{}\n".format(json.dumps({"metadata": metadata})))
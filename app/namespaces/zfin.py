@@ -7,14 +7,12 @@ Usage:  hgnc.py
 """
 import copy
 import datetime
-import gzip
 import json
 import os
-import re
 import sys
 import tempfile
 from pathlib import Path
-from typing import TextIO
+from typing import Iterable, List, TextIO, Tuple
 
 import structlog
 import yaml
@@ -22,9 +20,12 @@ import yaml
 import app.settings as settings
 import app.setup_logging
 import typer
+from app.common.compressed_io import open_compressed
 from app.common.collect_sources import get_web_file
+from app.common.joins import JoinSource, cogroup
 from app.common.resources import get_metadata, get_species_labels
 from app.common.text import quote_id
+from app.common.tsv import read_tsv
 from app.schemas.main import Term
 from typer import Option
 
@@ -50,7 +51,59 @@ aliases_fn = download_fn
 genes_fn = download_fn2
 transcripts_fn = download_fn3
 
-resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.gz"
+resource_fn = f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
+
+
+def alias_rows() -> Iterable[Tuple[str, ...]]:
+    """Gene alias rows - (src_id, name, symbol, synonym)"""
+
+    for row in read_tsv(aliases_fn, columns=(0, 1, 2, 3)):
+        if row[0].startswith("ZDB-GENE-"):
+            yield row
+
+
+def transcript_rows() -> Iterable[Tuple[str, ...]]:
+    """Current gene transcript rows - (gene_id, transcript name, transcript type)"""
+
+    for (name, gene_id, tscript_type, status) in read_tsv(transcripts_fn, columns=(2, 3, 5, 6)):
+        if "withdrawn" in status.lower() or "artifact" in status.lower():
+            continue
+        yield (gene_id, name, tscript_type)
+
+
+def gene_rows() -> Iterable[Tuple[str, ...]]:
+    """Gene rows - (src_id, symbol, eg_id)"""
+
+    for (src_id, symbol, eg_id) in read_tsv(genes_fn, columns=(0, 2, 3)):
+        yield (src_id, symbol, eg_id.strip())
+
+
+def get_entity_types(transcripts: List[Tuple[str, ...]]) -> List[str]:
+    """Get BEL entity types from gene transcript types"""
+
+    types = set([tscript_type for (_, _, tscript_type) in transcripts])
+
+    entity_types = []
+    for type_ in types:
+        if type_ in [
+            "lincRNA",
+            "ncRNA",
+            "scRNA",
+            "snRNA",
+            "snoRNA",
+            "antisense",
+            "aberrant processed transcript",
+            "pseudogenic transcript",
+        ]:
+            entity_types.extend(["Gene", "RNA"])
+        elif type_ in ["mRNA", "V-gene"]:
+            entity_types.extend(["Gene", "RNA", "Protein"])
+        elif type_ in ["miRNA"]:
+            entity_types.extend(["Gene", "Micro_RNA"])
+        else:
+            print(f"Unknown gene type: {type_}")
+
+    return list(set(entity_types))
 
 
 def build_json():
@@ -58,81 +111,37 @@ def build_json():
 
     species_labels = get_species_labels()
 
-    terms = {}
-    with gzip.open(aliases_fn, "rt") as fi:
-        for line in fi:
-            if re.match("ZDB-GENE-", line):
-                (src_id, name, symbol, syn, *extra) = line.split("\t")
-                # print('Syn', syn)
-                if src_id in terms:
-                    terms[src_id]["synonyms"].append(syn)
-                else:
-                    terms[src_id] = {"name": name, "symbol": symbol, "synonyms": [syn]}
-
-    with gzip.open(transcripts_fn, "rt") as fi:
-        transcript_types = {}
-        for line in fi:
-            (tscript_id, so_id, name, gene_id, clone_id, tscript_type, status, *extra) = line.split(
-                "\t"
-            )
-            if "withdrawn" in status.lower() or "artifact" in status.lower():
-                continue
-            if gene_id in transcript_types:
-                transcript_types[gene_id][tscript_type] = 1
-            else:
-                transcript_types[gene_id] = {tscript_type: 1}
-
-        for gene_id in transcript_types:
-            types = transcript_types[gene_id].keys()
-
-            entity_types = []
-            for type_ in types:
-                if type_ in [
-                    "lincRNA",
-                    "ncRNA",
-                    "scRNA",
-                    "snRNA",
-                    "snoRNA",
-                    "antisense",
-                    "aberrant processed transcript",
-                    "pseudogenic transcript",
-                ]:
-                    entity_types.extend(["Gene", "RNA"])
-                elif type_ in ["mRNA", "V-gene"]:
-                    entity_types.extend(["Gene", "RNA", "Protein"])
-                elif type_ in ["miRNA"]:
-                    entity_types.extend(["Gene", "Micro_RNA"])
-                else:
-                    print(f"Unknown gene type: {type_}")
-
-            entity_types = list(set(entity_types))
-
-            if gene_id in terms:
-                terms[gene_id]["entity_types"] = list(entity_types)
-            else:
-                terms[gene_id] = {"name": name, "entity_types": list(entity_types)}
-
-    with gzip.open(genes_fn, "rt") as fi:
-        for line in fi:
-            (src_id, so_id, symbol, eg_id, *extra) = line.split("\t")
-            if src_id in terms:
-                terms[src_id]["equivalences"] = [f"EG:{eg_id.strip()}"]
-                if terms[src_id].get("symbol", None) and symbol:
-                    terms[src_id]["symbol"] = symbol
-            else:
-                log.debug(f"No term record for ZFIN {src_id} to add equivalences to")
-                continue
-
-    with gzip.open(resource_fn, "wt") as fo:
+    with open_compressed(resource_fn, "wt") as fo:
 
         # Header JSONL record for terminology
         metadata = get_metadata(namespace_def)
         fo.write("{}\n".format(json.dumps({"metadata": metadata})))
 
-        for term_id in terms:
+        for term_id, (aliases, transcripts, genes) in cogroup(
+            [
+                JoinSource("zfin_aliases", aliases_fn, alias_rows),
+                JoinSource("zfin_transcripts", transcripts_fn, transcript_rows),
+                JoinSource("zfin_gene", genes_fn, gene_rows),
+            ]
+        ):
+            if not aliases and not transcripts:
+                log.debug(f"No term record for ZFIN {term_id} to add equivalences to")
+                continue
+
+            symbol = None
+            if aliases:
+                (_, name, symbol, _) = aliases[0]
+            else:
+                (_, name, _) = transcripts[-1]
+
+            equivalences = []
+            for (_, gene_symbol, eg_id) in genes:
+                equivalences = [f"EG:{eg_id}"]
+                if symbol and gene_symbol:
+                    symbol = gene_symbol
 
-            label = terms[term_id].get("symbol", terms[term_id].get("name", term_id))
-            name = terms[term_id].get("name", term_id)
+            label = symbol or name or term_id
+            name = name or term_id
 
             term = Term(
                 key=f"{namespace}:{term_id}",
@@ -142,9 +151,9 @@ def build_json():
                 name=name,
                 species_key=species_key,
                 species_label=species_labels[species_key],
-                synonyms=list(set(terms[term_id].get("synonyms", []))),
-                entity_types=terms[term_id].get("entity_types", []),
-                equivalence_keys=terms[term_id].get("equivalences", []),
+                synonyms=list(set([syn for (_, _, _, syn) in aliases])),
+                entity_types=get_entity_types(transcripts),
+                equivalence_keys=equivalences,
             )
 
             if term.id != term.label:
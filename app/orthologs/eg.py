@@ -8,7 +8,6 @@ Usage:  eg.py  -- orthologs
 
 import copy
 import datetime
-import gzip
 import json
 import os
 import re
@@ -21,7 +20,11 @@ import app.setup_logging
 import typer
 from app.common.collect_sources import get_ftp_file
 from app.common.resources import get_metadata, get_species_labels
+from app.common.subsets import SubsetWriter, resource_sinks
 from app.common.text import dt_now, quote_id
+from app.common.tsv import read_tsv
+from app.orthologs.index import OrthologIndexBuilder
+from app.orthologs.partitions import OrthologPartitions
 from app.schemas.main import Orthologs, ResourceMetadata
 from typer import Option
 
@@ -34,9 +37,8 @@ namespace_def = settings.NAMESPACE_DEFINITIONS[namespace_lc]
 download_url = "ftp://ftp.ncbi.nlm.nih.gov/gene/DATA/gene_orthologs.gz"
 download_fn = f"{settings.DOWNLOAD_DIR}/eg_orthologs.csv.gz"
 download_history_fn = f"{settings.DOWNLOAD_DIR}/eg_gene_history.json.gz"
-resource_fn = f"{settings.DATA_DIR}/orthologs/{namespace_lc}.jsonl.gz"
-resource_fn_hmrz = f"{settings.DATA_DIR}/orthologs/{namespace_lc}_hmrz.jsonl.gz"
-hmrz_species = ["TAX:9606", "TAX:10090", "TAX:10116", "TAX:7955"]
+resource_fn = f"{settings.DATA_DIR}/orthologs/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
+index_dir = f"{settings.DATA_DIR}/orthologs/{namespace_lc}_index"
 
 
 orthologs_metadata = ResourceMetadata(
@@ -50,29 +52,29 @@ orthologs_metadata = ResourceMetadata(
 
 
 def build_json():
-    """Build EG orthologs json load file"""
+    """Build EG orthologs json load file and ortholog index"""
 
-    with gzip.open(download_fn, "rt") as fi, gzip.open(resource_fn, "wt") as fo, gzip.open(
-        resource_fn_hmrz, "wt"
-    ) as fz:
+    index_builder = OrthologIndexBuilder(namespace)
+
+    with SubsetWriter(resource_fn, sinks=resource_sinks(resource_fn)) as fo, OrthologPartitions(
+        namespace_lc, orthologs_metadata
+    ) as partitions:
 
         # Header JSONL record for terminology
-        fo.write("{}\n".format(json.dumps({"metadata": orthologs_metadata})))
-        fz.write("{}\n".format(json.dumps({"metadata": orthologs_metadata})))
-
-        fi.__next__()  # skip header line
-
-        for line in fi:
-            (
-                subject_species_id,
-                subject_gene_id,
-                relationship,
-                object_species_id,
-                object_gene_id,
-            ) = line.rstrip().split("\t")
+        fo.write_all("{}\n".format(json.dumps({"metadata": orthologs_metadata})))
+
+        for (
+            subject_species_id,
+            subject_gene_id,
+            relationship,
+            object_species_id,
+            object_gene_id,
+        ) in read_tsv(download_fn, columns=(0, 1, 2, 3, 4), header_lines=1):
             if relationship != "Ortholog":
                 continue
 
+            index_builder.add(subject_gene_id, subject_species_id, object_gene_id, object_species_id)
+
             subject_species_key = f"TAX:{subject_species_id}"
             object_species_key = f"TAX:{object_species_id}"
 
@@ -96,10 +98,12 @@ def build_json():
             }
 
             # Add ortholog to JSONL
-            fo.write("{}\n".format(json.dumps({"ortholog": ortholog})))
+            line = "{}\n".format(json.dumps({"ortholog": ortholog}))
+            fo.write_pair(line, subject_species_key, object_species_key)
+
+            partitions.write(line, subject_species_id, object_species_id)
 
-            if subject_species_key in hmrz_species and object_species_key in hmrz_species:
-                fz.write("{}\n".format(json.dumps({"ortholog": ortholog})))
+    index_builder.write(index_dir)
 
 
 def main(
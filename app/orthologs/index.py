@@ -0,0 +1,257 @@
+"""Compact memory-mappable ortholog index
+
+Integer gene ids and taxids are stored in NumPy arrays with a CSR adjacency
+from each gene to its orthologs (sorted by ortholog taxid, then gene id) so that
+"orthologs of gene X in species Y" is a binary search and an array slice.
+
+Index directory files:
+
+    genes.npy: sorted gene ids (int64)
+    gene_taxids.npy: taxid per gene (int64)
+    indptr.npy: CSR offsets into indices per gene (int64, len(genes) + 1)
+    indices.npy: ortholog gene indexes (int64)
+    ortholog_taxids.npy: taxid per ortholog in indices (int64)
+    species.npy: sorted taxids (int64)
+    species_indptr.npy: offsets into species_genes per taxid (int64, len(species) + 1)
+    species_genes.npy: gene indexes grouped by taxid (int64)
+    metadata.json: namespace and counts
+"""
+
+from array import array
+from typing import List, Optional, Union
+
+import numpy as np
+import structlog
+
+from app.common.arrays import load_arrays, save_arrays
+
+log = structlog.getLogger(__name__)
+
+index_arrays = [
+    "genes",
+    "gene_taxids",
+    "indptr",
+    "indices",
+    "ortholog_taxids",
+    "species",
+    "species_indptr",
+    "species_genes",
+]
+
+
+def parse_key(key: Union[str, int]) -> int:
+    """Integer id from a resource key, e.g. EG:1234 or TAX:9606 -> 1234 or 9606"""
+
+    if isinstance(key, str):
+        key = key.split(":", 1)[-1]
+
+    return int(key)
+
+
+class OrthologIndexBuilder(object):
+    """Collect ortholog pairs while building the ortholog resource and write the index"""
+
+    def __init__(self, namespace: str):
+
+        self.namespace = namespace
+
+        self.subject_genes = array("q")
+        self.subject_taxids = array("q")
+        self.object_genes = array("q")
+        self.object_taxids = array("q")
+
+        self.skipped = 0
+
+    def add(self, subject_gene_id, subject_taxid, object_gene_id, object_taxid):
+        """Add ortholog pair - ids can be integers, id strings or keys, e.g. 1234 or EG:1234"""
+
+        try:
+            pair = (
+                parse_key(subject_gene_id),
+                parse_key(subject_taxid),
+                parse_key(object_gene_id),
+                parse_key(object_taxid),
+            )
+        except ValueError:
+            self.skipped += 1
+            return
+
+        self.subject_genes.append(pair[0])
+        self.subject_taxids.append(pair[1])
+        self.object_genes.append(pair[2])
+        self.object_taxids.append(pair[3])
+
+    def write(self, index_dir: str):
+        """Write index arrays to index_dir - replaces any existing index"""
+
+        subject_genes = np.frombuffer(self.subject_genes, dtype=np.int64)
+        subject_taxids = np.frombuffer(self.subject_taxids, dtype=np.int64)
+        object_genes = np.frombuffer(self.object_genes, dtype=np.int64)
+        object_taxids = np.frombuffer(self.object_taxids, dtype=np.int64)
+
+        # Genes and their taxids
+        all_genes = np.concatenate([subject_genes, object_genes])
+        all_taxids = np.concatenate([subject_taxids, object_taxids])
+        (genes, first_idx) = np.unique(all_genes, return_index=True)
+        gene_taxids = all_taxids[first_idx]
+
+        # Symmetric, de-duplicated edges between gene indexes
+        subject_idx = np.searchsorted(genes, subject_genes)
+        object_idx = np.searchsorted(genes, object_genes)
+        sources = np.concatenate([subject_idx, object_idx])
+        targets = np.concatenate([object_idx, subject_idx])
+
+        keep = sources != targets
+        sources = sources[keep]
+        targets = targets[keep]
+
+        # Target gene indexes are in gene id order so sorting by (source, taxid, target)
+        #   sorts each gene's orthologs by taxid, then gene id
+        target_taxids = gene_taxids[targets]
+        order = np.lexsort((targets, target_taxids, sources))
+        sources = sources[order]
+        targets = targets[order]
+        target_taxids = target_taxids[order]
+
+        if len(sources):
+            unique = np.ones(len(sources), dtype=bool)
+            unique[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+            sources = sources[unique]
+            targets = targets[unique]
+            target_taxids = target_taxids[unique]
+
+        indptr = np.zeros(len(genes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(genes)), out=indptr[1:])
+
+        # Per species offset table of gene indexes
+        species_genes = np.lexsort((genes, gene_taxids))
+        (species, species_counts) = np.unique(gene_taxids, return_counts=True)
+        species_indptr = np.zeros(len(species) + 1, dtype=np.int64)
+        np.cumsum(species_counts, out=species_indptr[1:])
+
+        arrays = {
+            "genes": genes,
+            "gene_taxids": gene_taxids,
+            "indptr": indptr,
+            "indices": targets,
+            "ortholog_taxids": target_taxids,
+            "species": species,
+            "species_indptr": species_indptr,
+            "species_genes": species_genes,
+        }
+
+        metadata = {
+            "namespace": self.namespace,
+            "genes": len(genes),
+            "orthologs": len(targets),
+            "species": len(species),
+        }
+
+        save_arrays(
+            index_dir,
+            {name: arrays[name].astype(np.int64, copy=False) for name in index_arrays},
+            metadata,
+        )
+
+        log.info("Wrote ortholog index", index_dir=index_dir, skipped=self.skipped, **metadata)
+
+
+class OrthologIndex(object):
+    """Query API for the ortholog index
+
+    Arrays are memory-mapped so opening the index is cheap and only the pages
+    touched by queries are read.
+
+    Usage:
+        index = OrthologIndex(f"{settings.DATA_DIR}/orthologs/eg_index")
+        index.orthologs("EG:4292", "TAX:10090")  # -> ["EG:17350"]
+    """
+
+    def __init__(self, index_dir: str, mmap: bool = True):
+
+        (arrays, self.metadata) = load_arrays(index_dir, index_arrays, mmap=mmap)
+
+        self.namespace = self.metadata["namespace"]
+
+        for name, values in arrays.items():
+            setattr(self, name, values)
+
+    def __len__(self) -> int:
+        return len(self.genes)
+
+    def __contains__(self, key: Union[str, int]) -> bool:
+        return self.gene_index(key) is not None
+
+    def gene_index(self, key: Union[str, int]) -> Optional[int]:
+        """Index of gene in genes array or None if not in the index"""
+
+        try:
+            gene_id = parse_key(key)
+        except ValueError:
+            return None
+
+        idx = int(np.searchsorted(self.genes, gene_id))
+        if idx < len(self.genes) and self.genes[idx] == gene_id:
+            return idx
+
+        return None
+
+    def taxid(self, key: Union[str, int]) -> Optional[int]:
+        """Taxid of gene"""
+
+        idx = self.gene_index(key)
+        if idx is None:
+            return None
+
+        return int(self.gene_taxids[idx])
+
+    def ortholog_ids(self, key: Union[str, int], taxid: Union[str, int] = None) -> np.ndarray:
+        """Ortholog gene ids of gene, optionally only those in species taxid
+
+        Args:
+            key: gene key or id, e.g. EG:4292 or 4292
+            taxid: species key or taxid, e.g. TAX:10090 or 10090
+
+        Returns:
+            np.ndarray: ortholog gene ids sorted by taxid, then gene id
+        """
+
+        (start, end) = self._ortholog_range(key, taxid)
+
+        return self.genes[self.indices[start:end]]
+
+    def orthologs(self, key: Union[str, int], taxid: Union[str, int] = None) -> List[str]:
+        """Ortholog gene keys of gene, optionally only those in species taxid"""
+
+        return [f"{self.namespace}:{gene_id}" for gene_id in self.ortholog_ids(key, taxid)]
+
+    def species_gene_ids(self, taxid: Union[str, int]) -> np.ndarray:
+        """Gene ids with orthologs in species taxid, sorted by gene id"""
+
+        taxid = parse_key(taxid)
+        idx = int(np.searchsorted(self.species, taxid))
+        if idx >= len(self.species) or self.species[idx] != taxid:
+            return self.genes[:0]
+
+        start, end = self.species_indptr[idx], self.species_indptr[idx + 1]
+
+        return self.genes[self.species_genes[start:end]]
+
+    def _ortholog_range(self, key: Union[str, int], taxid: Union[str, int] = None):
+        """Start and end offsets of the orthologs of gene in indices"""
+
+        idx = self.gene_index(key)
+        if idx is None:
+            return (0, 0)
+
+        start, end = int(self.indptr[idx]), int(self.indptr[idx + 1])
+
+        if taxid is not None:
+            taxid = parse_key(taxid)
+            taxids = self.ortholog_taxids[start:end]
+            (start, end) = (
+                start + int(np.searchsorted(taxids, taxid, side="left")),
+                start + int(np.searchsorted(taxids, taxid, side="right")),
+            )
+
+        return (start, end)
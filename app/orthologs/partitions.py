@@ -0,0 +1,106 @@
+"""Fan out ortholog records to species partitioned resource files in one pass"""
+
+import json
+from typing import Dict, List, Tuple
+
+import structlog
+
+import app.settings as settings
+from app.common.compressed_io import open_compressed
+
+log = structlog.getLogger(__name__)
+
+
+def taxid(species_key) -> str:
+    """Taxid string from species key or taxid, e.g. TAX:9606 or 9606 -> "9606" """
+
+    return str(species_key).replace("TAX:", "")
+
+
+class OrthologPartitions(object):
+    """Species partitioned ortholog resource files
+
+    Each partition is written to orthologs/{namespace}_{partition}.jsonl.gz. Routing
+    of an ortholog to its partitions is computed once per (subject, object) taxid pair
+    and then a single dict lookup per ortholog.
+
+    Usage:
+        with OrthologPartitions("eg", metadata) as partitions:
+            partitions.write(line, subject_taxid, object_taxid)
+    """
+
+    def __init__(self, namespace_lc: str, metadata: dict, partitions: dict = None):
+
+        if partitions is None:
+            partitions = settings.ORTHOLOG_PARTITIONS or {}
+
+        self.namespace_lc = namespace_lc
+        self.metadata = metadata
+
+        self.species_sets: Dict[str, frozenset] = {
+            name: frozenset([taxid(species) for species in species_list])
+            for name, species_list in (partitions.get("species_sets") or {}).items()
+        }
+        self.species: Dict[str, str] = {
+            name: taxid(species) for name, species in (partitions.get("species") or {}).items()
+        }
+
+        self.files = {}
+        self.routes: Dict[Tuple[str, str], List] = {}
+        self.counts = {}
+
+    def __enter__(self):
+
+        for name in list(self.species_sets) + list(self.species):
+            resource_fn = (
+                f"{settings.DATA_DIR}/orthologs/{self.namespace_lc}_{name}.jsonl.{settings.RESOURCE_EXT}"
+            )
+            fo = open_compressed(resource_fn, "wt")
+            fo.write("{}\n".format(json.dumps({"metadata": self.metadata})))
+            self.files[name] = fo
+            self.counts[name] = 0
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        for fo in self.files.values():
+            fo.close()
+
+        log.info("Ortholog partitions", namespace=self.namespace_lc, counts=self.counts)
+
+    def route(self, subject_taxid: str, object_taxid: str) -> List[str]:
+        """Partition names for an ortholog between subject and object taxids"""
+
+        names = [
+            name
+            for name, species_set in self.species_sets.items()
+            if subject_taxid in species_set and object_taxid in species_set
+        ]
+        names.extend(
+            [
+                name
+                for name, species in self.species.items()
+                if species in (subject_taxid, object_taxid)
+            ]
+        )
+
+        return names
+
+    def write(self, line: str, subject_taxid: str, object_taxid: str):
+        """Write serialized ortholog line to its partitions
+
+        Args:
+            line: serialized ortholog JSONL record including newline
+            subject_taxid: subject species taxid, e.g. 9606
+            object_taxid: object species taxid, e.g. 10090
+        """
+
+        pair = (subject_taxid, object_taxid)
+        names = self.routes.get(pair)
+        if names is None:
+            names = self.routes[pair] = self.route(subject_taxid, object_taxid)
+
+        for name in names:
+            self.files[name].write(line)
+            self.counts[name] += 1
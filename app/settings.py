@@ -1,3 +1,4 @@
+import importlib.util
 import inspect
 import os
 
@@ -16,6 +17,38 @@ DOWNLOAD_DIR = os.getenv("BELRES_DOWNLOAD_DIR")
 
 UPDATE_CYCLE_DAYS = os.getenv("UPDATE_CYCLE_DAYS", default=7)
 
+# Number of parallel gzip compression threads for resource files - > 1 writes multi-member gzip files
+COMPRESSION_THREADS = int(os.getenv("BELRES_COMPRESSION_THREADS", default=1))
+
+# Resource file (DATA_DIR) and re-compressed download compression codec [gzip, zstd] and level
+#   zstd is only used if the zstandard package is installed, levels default to gzip: 9, zstd: 3
+RESOURCE_CODEC = os.getenv("BELRES_RESOURCE_CODEC", default="gzip")
+RESOURCE_COMPRESSION_LEVEL = os.getenv("BELRES_RESOURCE_COMPRESSION_LEVEL", default=None)
+DOWNLOAD_CODEC = os.getenv("BELRES_DOWNLOAD_CODEC", default="gzip")
+DOWNLOAD_COMPRESSION_LEVEL = os.getenv("BELRES_DOWNLOAD_COMPRESSION_LEVEL", default=None)
+
+# Uncompressed block size of block compressed resource files (app/common/blocked.py)
+RESOURCE_BLOCK_SIZE = int(os.getenv("BELRES_RESOURCE_BLOCK_KB", default=256)) * 1024
+
+# Number of shard files to also write per resource file (0: no shards) and how to partition
+#   the records [key, species] - see app/common/shards.py
+RESOURCE_SHARDS = int(os.getenv("BELRES_RESOURCE_SHARDS", default=0))
+RESOURCE_SHARD_BY = os.getenv("BELRES_RESOURCE_SHARD_BY", default="key")
+
+# Elasticsearch bulk NDJSON chunks of namespace terms written with the resource files
+#   (app/common/es_bulk.py) - chunk size is in uncompressed MB
+ES_BULK = os.getenv("BELRES_ES_BULK", default="").lower() in ("1", "true", "yes")
+ES_BULK_CHUNK_SIZE = int(os.getenv("BELRES_ES_BULK_CHUNK_MB", default=10)) * 1024 * 1024
+ES_TERMS_INDEX = os.getenv("BELRES_ES_TERMS_INDEX", default="terms")
+
+# Partitioned Parquet dataset of namespace terms written with the resource files
+#   (app/common/columnar.py) - requires pyarrow
+PARQUET_EXPORT = os.getenv("BELRES_PARQUET_EXPORT", default="").lower() in ("1", "true", "yes")
+
+# Multi-file source joins - hash join if the sources fit in the budget, else external sort-merge join
+JOIN_MEMORY_BUDGET = int(os.getenv("BELRES_JOIN_MEMORY_MB", default=1024)) * 1024 * 1024
+JOIN_WORK_DIR = os.getenv("BELRES_JOIN_WORK_DIR", default=f"{DOWNLOAD_DIR}/joins")
+
 MAIL_API = os.getenv("BELRES_MAIL_API")
 MAIL_API_KEY = os.getenv("BELRES_MAIL_API_KEY")
 MAIL_FROM = os.getenv("BELRES_MAIL_FROM")
@@ -32,7 +65,28 @@ TAXONOMY_LABELS = yaml.load(
     open(f"{RESOURCES_DIR}/taxonomy_labels.yml", "r").read(), Loader=yaml.SafeLoader
 )
 
-# TODO Not currently used - need to update _hmrz subset to use this for the species_filter
+ORTHOLOG_PARTITIONS = yaml.load(
+    open(f"{RESOURCES_DIR}/ortholog_partitions.yml", "r").read(), Loader=yaml.SafeLoader
+)
+
+if RESOURCE_COMPRESSION_LEVEL is not None:
+    RESOURCE_COMPRESSION_LEVEL = int(RESOURCE_COMPRESSION_LEVEL)
+if DOWNLOAD_COMPRESSION_LEVEL is not None:
+    DOWNLOAD_COMPRESSION_LEVEL = int(DOWNLOAD_COMPRESSION_LEVEL)
+
+if "zstd" in (RESOURCE_CODEC, DOWNLOAD_CODEC):
+    if importlib.util.find_spec("zstandard") is None:
+        RESOURCE_CODEC = DOWNLOAD_CODEC = "gzip"
+
+# Resource filename extension for the resource codec, e.g. eg.jsonl.gz or eg.jsonl.zst
+RESOURCE_EXT = "zst" if RESOURCE_CODEC == "zstd" else "gz"
+
+# Species subsets - BELRES_SPECIES_FILTER overrides the species of the hmrz subset
+SPECIES_SUBSETS = yaml.load(
+    open(f"{RESOURCES_DIR}/species_subsets.yml", "r").read(), Loader=yaml.SafeLoader
+)
+
 SPECIES_FILTER = os.getenv("BELRES_SPECIES_FILTER", default=[])
 if SPECIES_FILTER:
     SPECIES_FILTER = [species.strip() for species in SPECIES_FILTER.split(",")]
+    SPECIES_SUBSETS["hmrz"] = SPECIES_FILTER
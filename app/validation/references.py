@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  references.py [--max-dangling 0] [--samples 10] [--workers 4]
+
+Validate the equivalence_keys, parent_keys and child_keys of all namespace
+resource files point at real terms (primary or alt keys) of the target namespace.
+
+Builds a sorted 64 bit key hash set per namespace prefix, then streams every
+namespace file in parallel and reports dangling references per
+(source namespace, reference field, target namespace) with counts and samples.
+References to namespaces that are not built, e.g. ensembl:, are counted
+separately and are not treated as dangling.
+
+Exits with a non-zero status if there are more than --max-dangling dangling
+references so it can gate publishing.
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+from collections import defaultdict
+from functools import partial
+from typing import Dict, List, Tuple
+
+import numpy as np
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.compressed_io import open_compressed
+from app.common.resources import get_namespace_resource_fns
+from app.indexes.keys import key_hash
+
+log = structlog.getLogger(__name__)
+
+report_fn = f"{settings.DATA_DIR}/validation/references.json"
+
+reference_fields = ["equivalence_keys", "parent_keys", "child_keys"]
+
+batch_size = 100000
+
+
+def key_prefix(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+def collect_key_hashes(resource_fn: str) -> Dict[str, np.ndarray]:
+    """Sorted unique primary and alt key hashes per key prefix of resource file"""
+
+    hashes = defaultdict(list)
+    with open_compressed(resource_fn, "rt") as fi:
+        for line in fi:
+            term = json.loads(line).get("term")
+            if term is None:
+                continue
+
+            for key in [term["key"]] + (term.get("alt_keys") or []):
+                hashes[key_prefix(key)].append(key_hash(key))
+
+    return {prefix: np.unique(np.array(values, dtype=np.uint64)) for prefix, values in hashes.items()}
+
+
+def build_key_sets(resource_fns: List[str], work_dir: str, pool) -> List[str]:
+    """Save key hash set per namespace prefix as {work_dir}/{prefix}.npy
+
+    Returns:
+        List[str]: namespace prefixes with key sets
+    """
+
+    key_sets = defaultdict(list)
+    for file_key_sets in pool.imap_unordered(collect_key_hashes, resource_fns):
+        for prefix, hashes in file_key_sets.items():
+            key_sets[prefix].append(hashes)
+
+    for prefix, hashes in key_sets.items():
+        np.save(f"{work_dir}/{prefix}.npy", np.unique(np.concatenate(hashes)))
+
+    log.info("Built key sets", prefixes=sorted(key_sets))
+
+    return sorted(key_sets)
+
+
+class ReferenceChecker(object):
+    """Check references in batches against the memory-mapped key sets"""
+
+    def __init__(self, work_dir: str, prefixes: List[str], max_samples: int):
+
+        self.key_sets = {
+            prefix: np.load(f"{work_dir}/{prefix}.npy", mmap_mode="r") for prefix in prefixes
+        }
+        self.max_samples = max_samples
+
+        self.pending = defaultdict(list)
+        self.results = {}
+        self.unknown_namespaces = defaultdict(int)
+
+    def add(self, source: str, field: str, term_key: str, reference: str):
+
+        target = key_prefix(reference)
+        if target not in self.key_sets:
+            self.unknown_namespaces[(source, field, target)] += 1
+            return
+
+        batch = self.pending[(source, field, target)]
+        batch.append((term_key, reference))
+        if len(batch) >= batch_size:
+            self.flush((source, field, target))
+
+    def flush(self, group: Tuple[str, str, str]):
+
+        batch = self.pending.pop(group, [])
+        if not batch:
+            return
+
+        key_set = self.key_sets[group[2]]
+        hashes = np.array([key_hash(reference) for (_, reference) in batch], dtype=np.uint64)
+        idx = np.searchsorted(key_set, hashes)
+        found = idx < len(key_set)
+        found[found] = key_set[idx[found]] == hashes[found]
+
+        result = self.results.setdefault(group, {"checked": 0, "dangling": 0, "samples": []})
+        result["checked"] += len(batch)
+        missing = np.flatnonzero(~found)
+        result["dangling"] += len(missing)
+        for position in missing[: self.max_samples - len(result["samples"])]:
+            result["samples"].append(list(batch[position]))
+
+    def finish(self) -> dict:
+
+        for group in list(self.pending):
+            self.flush(group)
+
+        return {"results": self.results, "unknown_namespaces": dict(self.unknown_namespaces)}
+
+
+def check_file(resource_fn: str, work_dir: str, prefixes: List[str], max_samples: int) -> dict:
+    """Check references of all terms in resource file"""
+
+    checker = ReferenceChecker(work_dir, prefixes, max_samples)
+
+    with open_compressed(resource_fn, "rt") as fi:
+        for line in fi:
+            term = json.loads(line).get("term")
+            if term is None:
+                continue
+
+            source = key_prefix(term["key"])
+            for field in reference_fields:
+                for reference in term.get(field) or []:
+                    checker.add(source, field, term["key"], reference)
+
+    return checker.finish()
+
+
+def validate_references(
+    resource_fns: List[str] = None, max_samples: int = 10, workers: int = None
+) -> dict:
+    """Validate references of namespace resource files
+
+    Returns:
+        dict: report with dangling reference counts and samples per namespace pair
+    """
+
+    if resource_fns is None:
+        resource_fns = get_namespace_resource_fns()
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory(prefix="key_sets_") as work_dir, multiprocessing.Pool(
+        workers
+    ) as pool:
+        prefixes = build_key_sets(resource_fns, work_dir, pool)
+
+        check = partial(check_file, work_dir=work_dir, prefixes=prefixes, max_samples=max_samples)
+        file_results = pool.map(check, resource_fns)
+
+    pairs = {}
+    unknown_namespaces = defaultdict(int)
+    for file_result in file_results:
+        for (source, field, target), result in file_result["results"].items():
+            pair = pairs.setdefault(
+                (source, field, target),
+                {
+                    "source": source,
+                    "field": field,
+                    "target": target,
+                    "checked": 0,
+                    "dangling": 0,
+                    "samples": [],
+                },
+            )
+            pair["checked"] += result["checked"]
+            pair["dangling"] += result["dangling"]
+            pair["samples"].extend(result["samples"][: max_samples - len(pair["samples"])])
+
+        for (source, field, target), count in file_result["unknown_namespaces"].items():
+            unknown_namespaces[f"{source} {field} -> {target}"] += count
+
+    report = {
+        "resource_fns": [os.path.basename(resource_fn) for resource_fn in resource_fns],
+        "checked": sum([pair["checked"] for pair in pairs.values()]),
+        "dangling": sum([pair["dangling"] for pair in pairs.values()]),
+        "pairs": sorted(pairs.values(), key=lambda pair: (-pair["dangling"], pair["source"])),
+        "unknown_namespaces": dict(sorted(unknown_namespaces.items())),
+    }
+
+    return report
+
+
+def main(
+    max_dangling: int = Option(0, help="Exit with an error if there are more dangling references"),
+    samples: int = Option(10, help="Number of sample dangling references per namespace pair"),
+    workers: int = Option(None, help="Number of parallel workers"),
+):
+
+    report = validate_references(max_samples=samples, workers=workers)
+
+    os.makedirs(os.path.dirname(report_fn), exist_ok=True)
+    with open(report_fn, "w") as f:
+        json.dump(report, f, indent=4)
+
+    for pair in report["pairs"]:
+        if pair["dangling"]:
+            log.warning(
+                "Dangling references",
+                source=pair["source"],
+                field=pair["field"],
+                target=pair["target"],
+                dangling=pair["dangling"],
+                checked=pair["checked"],
+                samples=pair["samples"][:3],
+            )
+
+    log.info(
+        "Validated references",
+        checked=report["checked"],
+        dangling=report["dangling"],
+        report_fn=report_fn,
+    )
+
+    if report["dangling"] > max_dangling:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  benchmark_compression.py [NAMESPACE ...] [--sample-mb 64]
+
+Report the compressed size and compression/decompression times per namespace
+resource file for gzip levels and zstd levels (if the zstandard package is installed)
+"""
+
+import glob
+import gzip
+import os
+import time
+from typing import List, Tuple
+
+import typer
+from typer import Option
+
+import app.settings as settings
+from app.common.compressed_io import open_compressed
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+gzip_levels = [1, 3, 6, 9]
+zstd_levels = [1, 3, 9, 19]
+
+
+def get_codecs():
+    """Compress/decompress functions per codec and level"""
+
+    codecs = []
+    for level in gzip_levels:
+        codecs.append(
+            ("gzip", level, lambda data, level=level: gzip.compress(data, level), gzip.decompress)
+        )
+
+    if zstandard is not None:
+        for level in zstd_levels:
+            codecs.append(
+                (
+                    "zstd",
+                    level,
+                    lambda data, level=level: zstandard.ZstdCompressor(level=level).compress(data),
+                    lambda data: zstandard.ZstdDecompressor().decompress(data),
+                )
+            )
+
+    return codecs
+
+
+def benchmark_file(filename: str, sample_mb: int) -> Tuple[float, List[tuple]]:
+    """Benchmark codecs on the (sampled) decompressed contents of filename"""
+
+    with open_compressed(filename, "rb") as fi:
+        if sample_mb:
+            data = fi.read(sample_mb * 1024 * 1024)
+        else:
+            data = fi.read()
+
+    size_mb = len(data) / 1024 / 1024
+
+    results = []
+    for (codec, level, compress, decompress) in get_codecs():
+        start = time.time()
+        compressed = compress(data)
+        compress_secs = time.time() - start
+
+        start = time.time()
+        decompress(compressed)
+        decompress_secs = time.time() - start
+
+        results.append(
+            (
+                codec,
+                level,
+                len(compressed) / 1024 / 1024,
+                len(data) / max(len(compressed), 1),
+                size_mb / max(compress_secs, 1e-6),
+                size_mb / max(decompress_secs, 1e-6),
+            )
+        )
+
+    return (size_mb, results)
+
+
+def main(
+    namespaces: List[str] = typer.Argument(
+        None, help="Namespace resource files to benchmark, e.g. eg tax - defaults to all"
+    ),
+    sample_mb: int = Option(64, help="Benchmark first N Mb of decompressed data, 0 for all"),
+):
+
+    if namespaces:
+        filenames = [
+            f"{settings.DATA_DIR}/namespaces/{namespace.lower()}.jsonl.{settings.RESOURCE_EXT}"
+            for namespace in namespaces
+        ]
+    else:
+        filenames = sorted(
+            glob.glob(f"{settings.DATA_DIR}/namespaces/*.jsonl.{settings.RESOURCE_EXT}")
+        )
+
+    print(
+        f"{'file':<28} {'codec':<5} {'level':>5} {'input Mb':>9} {'output Mb':>10} "
+        f"{'ratio':>6} {'comp Mb/s':>10} {'decomp Mb/s':>12}"
+    )
+
+    for filename in filenames:
+        name = os.path.basename(filename)
+        (size_mb, results) = benchmark_file(filename, sample_mb)
+        for (codec, level, output_mb, ratio, compress_rate, decompress_rate) in results:
+            print(
+                f"{name:<28} {codec:<5} {level:>5} {size_mb:>9.1f} {output_mb:>10.1f} "
+                f"{ratio:>6.1f} {compress_rate:>10.1f} {decompress_rate:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  block_resources.py [RESOURCE_FILE ...] [--block-kb 256] [--workers 4]
+
+Rewrite resource files as block compressed (BGZF-style) files with a sidecar
+block index ({resource_fn}.blocks.json) for random access - see app/common/blocked.py.
+The files are still readable with gunzip/zcat and open_compressed.
+"""
+
+import glob
+import multiprocessing
+import os
+from functools import partial
+from typing import List
+
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.blocked import block_compress
+
+resource_types = ["namespaces", "orthologs", "backbone"]
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Resource files - defaults to all namespace, ortholog and backbone files"
+    ),
+    block_kb: int = Option(
+        None, help="Uncompressed block size in KB - defaults to BELRES_RESOURCE_BLOCK_KB"
+    ),
+    level: int = Option(None, help="Compression level"),
+    workers: int = Option(None, help="Number of resource files to process in parallel"),
+):
+
+    if not resource_fns:
+        resource_fns = [
+            filename
+            for resource_type in resource_types
+            for filename in sorted(
+                glob.glob(f"{settings.DATA_DIR}/{resource_type}/*.jsonl.{settings.RESOURCE_EXT}")
+            )
+        ]
+
+    block_size = block_kb * 1024 if block_kb else None
+    compress = partial(block_compress, block_size=block_size, compresslevel=level)
+
+    if workers is None:
+        workers = min(len(resource_fns), os.cpu_count() or 1)
+
+    if workers <= 1:
+        for resource_fn in resource_fns:
+            compress(resource_fn)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(compress, resource_fns)
+
+
+if __name__ == "__main__":
+    typer.run(main)
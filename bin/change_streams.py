@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  change_streams.py [RESOURCE_FILE ...] [--commit]
+
+Write change streams of upserts and deletes relative to the previous run for
+resource files (see app/common/changes.py) - run after the builders so loaders
+can apply the changes instead of reloading the full resource files.
+
+Change streams are relative to the last committed content hash sidecars. Run
+with --commit after publishing the resource and change stream files to advance
+the sidecars to this release - rebuilding the change streams before that keeps
+them relative to the previous published release. Default resource files that do
+not exist, e.g. after a failed ortholog build, are skipped.
+"""
+
+import os
+from typing import List
+
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.changes import commit_change_stream, update_change_stream
+from app.common.resources import get_namespace_resource_fns
+
+log = structlog.getLogger(__name__)
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Resource files - defaults to all namespace and EG ortholog resource files"
+    ),
+    commit: bool = Option(
+        False, help="Commit the pending content hash sidecars after publishing the files"
+    ),
+):
+
+    if not resource_fns:
+        resource_fns = get_namespace_resource_fns()
+        resource_fns.append(f"{settings.DATA_DIR}/orthologs/eg.jsonl.{settings.RESOURCE_EXT}")
+
+        for resource_fn in [fn for fn in resource_fns if not os.path.exists(fn)]:
+            log.warning("Skipping missing resource file", resource_fn=resource_fn)
+        resource_fns = [resource_fn for resource_fn in resource_fns if os.path.exists(resource_fn)]
+
+    for resource_fn in resource_fns:
+        if commit:
+            commit_change_stream(resource_fn)
+        else:
+            update_change_stream(resource_fn)
+
+
+if __name__ == "__main__":
+    typer.run(main)
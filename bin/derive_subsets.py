@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  derive_subsets.py [RESOURCE_FILE ...] [--subset hmrz] [--workers 4]
+
+Derive species subset files (e.g. eg_hmrz.jsonl.gz) from existing full resource files
+without rebuilding them from the source files. Useful after changing a subset
+definition in resources/species_subsets.yml.
+"""
+
+import multiprocessing
+import os
+from functools import partial
+from typing import List
+
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.backbone.gene2protein import backbone_fn, backbone_namespaces
+from app.common.subsets import derive_subsets
+
+
+def species_resource_fns() -> List[str]:
+    """Existing full resource files that have species subsets"""
+
+    resource_fns = [
+        f"{settings.DATA_DIR}/namespaces/{namespace_lc}.jsonl.{settings.RESOURCE_EXT}"
+        for namespace_lc in ["eg", "sp", "tax"]
+    ]
+    resource_fns.append(f"{settings.DATA_DIR}/orthologs/eg.jsonl.{settings.RESOURCE_EXT}")
+    resource_fns.extend([backbone_fn(namespace_lc) for namespace_lc in backbone_namespaces])
+
+    return [resource_fn for resource_fn in resource_fns if os.path.exists(resource_fn)]
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Full resource files - defaults to all species specific resource files"
+    ),
+    subset_names: List[str] = Option(
+        None, "--subset", help="Species subsets to derive - defaults to all configured subsets"
+    ),
+    workers: int = Option(None, help="Number of resource files to process in parallel"),
+):
+
+    if not resource_fns:
+        resource_fns = species_resource_fns()
+
+    subsets = settings.SPECIES_SUBSETS
+    if subset_names:
+        subsets = {name: subsets[name] for name in subset_names}
+
+    if workers is None:
+        workers = min(len(resource_fns), os.cpu_count() or 1)
+
+    if workers <= 1:
+        for resource_fn in resource_fns:
+            derive_subsets(resource_fn, subsets)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(partial(derive_subsets, subsets=subsets), resource_fns)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  diff_resources.py OLD_RESOURCE_FILE NEW_RESOURCE_FILE [--diff-fn FILE]
+
+Diff two releases of a resource file by record key (see app/common/diff.py)
+
+Writes the added/removed/changed records to the diff file, defaults to
+DATA_DIR/diffs/{name}.diff.jsonl.gz, and the summary with counts and changes
+per field next to it as {name}.summary.json for release notes and incremental reloads.
+"""
+
+import json
+import os
+
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.diff import diff_resources
+
+log = structlog.getLogger(__name__)
+
+
+def main(
+    old_fn: str = typer.Argument(..., help="Previous release resource file"),
+    new_fn: str = typer.Argument(..., help="New release resource file"),
+    diff_fn: str = Option(None, help="Diff file - defaults to DATA_DIR/diffs/{name}.diff.jsonl.gz"),
+    memory_mb: int = Option(None, help="Memory budget for external sorts in MB"),
+):
+
+    if diff_fn is None:
+        name = os.path.basename(new_fn).split(".")[0]
+        diff_fn = f"{settings.DATA_DIR}/diffs/{name}.diff.jsonl.{settings.RESOURCE_EXT}"
+
+    os.makedirs(os.path.dirname(os.path.abspath(diff_fn)), exist_ok=True)
+
+    memory_budget = memory_mb * 1024 * 1024 if memory_mb else settings.JOIN_MEMORY_BUDGET
+    summary = diff_resources(old_fn, new_fn, diff_fn, memory_budget=memory_budget)
+
+    summary_fn = diff_fn.split(".diff.")[0] + ".summary.json"
+    with open(summary_fn, "w") as f:
+        json.dump(summary, f, indent=4)
+
+    log.info(
+        "Diffed resource files",
+        added=summary["added"],
+        removed=summary["removed"],
+        changed=summary["changed"],
+        unchanged=summary["unchanged"],
+        diff_fn=diff_fn,
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
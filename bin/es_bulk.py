@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  es_bulk.py [RESOURCE_FILE ...] [--chunk-mb 10] [--index terms] [--post http://localhost:9200]
+
+Write Elasticsearch bulk NDJSON chunks of namespace resource files (see
+app/common/es_bulk.py) or POST the existing chunks with --post. The eg, sp and
+tax builders write the chunks with the resource files when BELRES_ES_BULK is set.
+--post creates a missing index with resources/es_terms_mapping.json first and
+skips resource files without chunks.
+"""
+
+from typing import List
+
+import typer
+from typer import Option
+
+import app.setup_logging
+from app.common.es_bulk import derive_es_bulk, post_es_bulk
+from app.common.resources import get_namespace_resource_fns
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Namespace resource files - defaults to all namespace resource files"
+    ),
+    index: str = Option(None, help="Elasticsearch index - defaults to BELRES_ES_TERMS_INDEX"),
+    chunk_mb: int = Option(None, help="Maximum uncompressed chunk size in MB"),
+    post: str = Option(None, help="Elasticsearch URL to POST the existing chunks to"),
+):
+
+    if not resource_fns:
+        resource_fns = get_namespace_resource_fns()
+
+    errors = 0
+    for resource_fn in resource_fns:
+        if post:
+            errors += post_es_bulk(resource_fn, post)
+        else:
+            derive_es_bulk(resource_fn, index, chunk_mb * 1024 * 1024 if chunk_mb else None)
+
+    if errors:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  hash_resources.py [RESOURCE_FILE ...] [--verify]
+
+Embed per-record content hashes and the whole-file Merkle digest in resource
+files (see app/common/hashes.py) or verify them with --verify. Run before
+block compressing or sharding the resource files.
+"""
+
+import glob
+from typing import List
+
+import structlog
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.hashes import embed_hashes, verify_hashes
+
+log = structlog.getLogger(__name__)
+
+resource_types = ["namespaces", "orthologs", "backbone"]
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Resource files - defaults to all namespace, ortholog and backbone files"
+    ),
+    verify: bool = Option(False, help="Verify the embedded hashes and digests"),
+):
+
+    if not resource_fns:
+        resource_fns = [
+            filename
+            for resource_type in resource_types
+            for filename in sorted(
+                glob.glob(f"{settings.DATA_DIR}/{resource_type}/*.jsonl.{settings.RESOURCE_EXT}")
+            )
+        ]
+
+    if not verify:
+        for resource_fn in resource_fns:
+            embed_hashes(resource_fn)
+        return
+
+    invalid = 0
+    for resource_fn in resource_fns:
+        result = verify_hashes(resource_fn)
+        if result["valid"]:
+            log.info("Verified record hashes", **result)
+        else:
+            log.error("Invalid record hashes", **result)
+            invalid += 1
+
+    if invalid:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
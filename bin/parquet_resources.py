@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  parquet_resources.py [RESOURCE_FILE ...] [--batch-rows 65536]
+
+Write the terms of namespace resource files into the namespace/species partitioned
+Parquet dataset (see app/common/columnar.py). The eg, sp and tax builders write
+their terms with the resource files when BELRES_PARQUET_EXPORT is set.
+"""
+
+from typing import List
+
+import typer
+from typer import Option
+
+import app.setup_logging
+from app.common.columnar import default_batch_rows, derive_parquet
+from app.common.resources import get_namespace_resource_fns
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Namespace resource files - defaults to all namespace resource files"
+    ),
+    batch_rows: int = Option(default_batch_rows, help="Rows per record batch (row group)"),
+):
+
+    if not resource_fns:
+        resource_fns = get_namespace_resource_fns()
+
+    for resource_fn in resource_fns:
+        derive_parquet(resource_fn, batch_rows=batch_rows)
+
+
+if __name__ == "__main__":
+    typer.run(main)
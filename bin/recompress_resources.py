@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  recompress_resources.py [--level 9]
+
+Recompress resource files for publishing, e.g. after building them with
+BELRES_RESOURCE_COMPRESSION_LEVEL=1 for faster intermediate builds and then
+running this with --level 9 (gzip) or --level 19 (zstd)
+"""
+
+import glob
+
+import typer
+from typer import Option
+
+import app.settings as settings
+from app.common.compressed_io import compression_level, recompress
+
+resource_types = ["namespaces", "orthologs", "backbone"]
+
+
+def main(
+    level: int = Option(
+        None,
+        help="Compression level - defaults to BELRES_RESOURCE_COMPRESSION_LEVEL or the codec default",
+    ),
+    threads: int = Option(None, help="Number of compression threads"),
+):
+
+    if level is None:
+        level = compression_level(settings.RESOURCE_CODEC)
+
+    for resource_type in resource_types:
+        for filename in sorted(
+            glob.glob(f"{settings.DATA_DIR}/{resource_type}/*.json*.{settings.RESOURCE_EXT}")
+        ):
+            recompress(filename, compresslevel=level, threads=threads)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Usage:  shard_resources.py [RESOURCE_FILE ...] [--shards 16] [--shard-by key] [--workers 4]
+
+Write shard files and a shard manifest (see app/common/shards.py) for existing
+resource files so loaders can process the shards in parallel. Builders using
+SubsetWriter (eg, sp, tax, orthologs/eg, backbone) write shards directly when
+BELRES_RESOURCE_SHARDS is set.
+"""
+
+import glob
+import multiprocessing
+import os
+from functools import partial
+from typing import List
+
+import typer
+from typer import Option
+
+import app.settings as settings
+import app.setup_logging
+from app.common.resources import get_namespace_resource_fns
+from app.common.shards import derive_shards
+
+
+def main(
+    resource_fns: List[str] = typer.Argument(
+        None, help="Resource files - defaults to all namespace and ortholog resource files"
+    ),
+    shards: int = Option(None, help="Number of shards - defaults to BELRES_RESOURCE_SHARDS or 16"),
+    shard_by: str = Option(None, help="Partition records by [key, species]"),
+    workers: int = Option(None, help="Number of resource files to process in parallel"),
+):
+
+    if not resource_fns:
+        resource_fns = get_namespace_resource_fns()
+        resource_fns.extend(
+            sorted(glob.glob(f"{settings.DATA_DIR}/orthologs/eg.jsonl.{settings.RESOURCE_EXT}"))
+        )
+
+    shard = partial(derive_shards, count=shards or settings.RESOURCE_SHARDS or 16, shard_by=shard_by)
+
+    if workers is None:
+        workers = min(len(resource_fns), os.cpu_count() or 1)
+
+    if workers <= 1:
+        for resource_fn in resource_fns:
+            shard(resource_fn)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(shard, resource_fns)
+
+
+if __name__ == "__main__":
+    typer.run(main)
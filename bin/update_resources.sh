@@ -31,11 +31,33 @@ source "/home/ubuntu/bel_resources/.venv/bin/activate"
 /home/ubuntu/bel_resources/app/orthologs/eg.py
 /home/ubuntu/bel_resources/app/orthologs/hgnc.py
 
-# Update Backbone Nanopubs
-/home/ubuntu/bel_resources/app/backbone/gene2protein.py
+# Update Backbone Nanopubs - EG backbone is built with the EG namespace (add --namespace eg if eg.py is run with --no-backbone)
+/home/ubuntu/bel_resources/app/backbone/gene2protein.py --namespace hgnc --namespace mgi --namespace rgd --namespace zfin
 
-# Sync files to S3
-/home/ubuntu/.local/bin/aws s3 sync --quiet /data/bel_resources/resources_v2 s3://resources.bel.bio/resources_v2
+# Change streams (upserts/deletes relative to the previous published release) for incremental loads
+/home/ubuntu/bel_resources/bin/change_streams.py
+
+# Optional: embed per-record content hashes and the file digest (before sharding/block compressing)
+# /home/ubuntu/bel_resources/bin/hash_resources.py
+
+# Optional: shard files for parallel loading (or set BELRES_RESOURCE_SHARDS for eg, sp, tax, orthologs/eg and backbones)
+# /home/ubuntu/bel_resources/bin/shard_resources.py --shards 16
+
+# Optional: Elasticsearch bulk NDJSON chunks (or set BELRES_ES_BULK for eg, sp and tax)
+# /home/ubuntu/bel_resources/bin/es_bulk.py
+
+# Optional: Parquet dataset of namespace terms (or set BELRES_PARQUET_EXPORT for eg, sp and tax)
+# /home/ubuntu/bel_resources/bin/parquet_resources.py
+
+# Optional: ArangoDB import files of namespaces and orthologs (exports/arango)
+# /home/ubuntu/bel_resources/app/exports/arango.py
+
+# Optional: block compress resource files with block indexes for random access/parallel loading
+# /home/ubuntu/bel_resources/bin/block_resources.py
+
+# Sync files to S3 - then advance the change stream sidecars to the published release
+/home/ubuntu/.local/bin/aws s3 sync --quiet /data/bel_resources/resources_v2 s3://resources.bel.bio/resources_v2 \
+    && /home/ubuntu/bel_resources/bin/change_streams.py --commit
 
 
 # Ping Healthchecks.io